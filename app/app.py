@@ -1,19 +1,30 @@
-import io
-from PIL import Image
-from flask import Flask, request, jsonify, g, render_template
+from flask import Flask, Response, request, jsonify, g, render_template, stream_with_context
 import json
+import queue
 import time
 import logging
-import base64
 from os import environ
+from concurrent import futures
+from datetime import datetime, timezone
 from models import db, ClassificationRequest
 from prometheus_client import Counter, generate_latest, REGISTRY, Summary, Histogram
 from prometheus_client.exposition import start_http_server
 
-from constants import ALLOWED_EXTENSIONS
+from constants import ALLOWED_EXTENSIONS, MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS, MAX_BATCH_ITEMS, MAX_BATCH_BYTES, RESULTS_NOTIFY_CHANNEL, MAX_TOPK
 from postgresConnector import PostgresConnectionManager
-from rabbitmqConnector import RabbitMQConnectionManager
+from rabbitmqPublisher import RabbitMQPublisher
+from messageEnvelope import encode_message
+from stageTracing import mark, stage_headers, observe_stages, PIPELINE_STAGE_SECONDS
+from imageValidation import read_upload, validate_image
+from resultCache import ResultCache, content_hash
+from requestWriter import BatchedRequestWriter, IdAllocator, INSERT_REQUESTS_QUERY
+from resultNotifier import ResultNotifier
+from pagination import parse_page_args, build_page_query, build_page
+from queryArgs import parse_number, parse_wait, parse_request_id
+from schema import upgrade_schema
+from batchUpload import iter_tar, iter_zip, iter_archive, BatchTooLarge, TAR_CONTENT_TYPES, ZIP_CONTENT_TYPES
 from flask_migrate import Migrate
+from werkzeug.exceptions import RequestEntityTooLarge
 
 
 # Environment variables for database and RabbitMQ
@@ -22,11 +33,31 @@ db_port = int(environ.get('DB_PORT', 5432))
 db_name = environ.get('DB_NAME', 'resnet18_db')
 db_user = environ.get('DB_USER', 'root')
 db_password = environ.get('DB_PASSWORD', 'password')
+db_pool_min_size = int(environ.get('DB_POOL_MIN_SIZE', 1))
+db_pool_max_size = int(environ.get('DB_POOL_MAX_SIZE', 10))
+db_pool_timeout = float(environ.get('DB_POOL_TIMEOUT', 30))
 rabbitmq_host = environ.get('RABBITMQ_HOST', 'localhost')
 rabbitmq_port = int(environ.get('RABBITMQ_PORT', 5672))
 rabbitmq_queue = environ.get('RABBITMQ_QUEUE', 'requests_queue')
 rabbitmq_username = environ.get('RABBITMQ_USERNAME', 'guest')   
 rabbitmq_password = environ.get('RABBITMQ_PASSWORD', 'guest')
+publisher_pool_size = int(environ.get('PUBLISHER_POOL_SIZE', 2))
+publish_confirm_timeout = float(environ.get('PUBLISH_CONFIRM_TIMEOUT', 5))
+rpc_enabled = environ.get('RPC_ENABLED', 'true').lower() == 'true'
+upload_validation = environ.get('UPLOAD_VALIDATION', 'header').lower()
+max_upload_bytes = int(environ.get('MAX_UPLOAD_BYTES', MAX_UPLOAD_BYTES))
+max_image_pixels = int(environ.get('MAX_IMAGE_PIXELS', MAX_IMAGE_PIXELS))
+result_cache_enabled = environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+result_cache_size = int(environ.get('RESULT_CACHE_SIZE', 10000))
+ingest_mode = environ.get('INGEST_MODE', 'orm').lower()
+id_block_size = int(environ.get('ID_BLOCK_SIZE', 100))
+insert_batch_size = int(environ.get('INSERT_BATCH_SIZE', 50))
+insert_batch_wait_ms = float(environ.get('INSERT_BATCH_WAIT_MS', 5))
+max_batch_items = int(environ.get('MAX_BATCH_ITEMS', MAX_BATCH_ITEMS))
+max_batch_bytes = int(environ.get('MAX_BATCH_BYTES', MAX_BATCH_BYTES))
+result_notify_enabled = environ.get('RESULT_NOTIFY_ENABLED', 'true').lower() == 'true'
+max_result_wait = float(environ.get('MAX_RESULT_WAIT', 60))
+sse_keepalive = float(environ.get('SSE_KEEPALIVE', 15))
 
 route_hit_counter = Counter('route_hits', 'Count of hits to routes', ['route'])
 REQUEST_TIME = Summary('request_processing_seconds', 'Time spent processing request', registry=REGISTRY)
@@ -36,6 +67,8 @@ REQUEST_LATENCY = Histogram('request_latency_seconds', 'Request latency', ['meth
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Werkzeug answers 413 before the body is read, and stops chunked bodies at the same size
+app.config['MAX_CONTENT_LENGTH'] = max_batch_bytes
 
 db.init_app(app)
 
@@ -55,7 +88,7 @@ def initialize_connections():
     logging.info("Initializing connections...")
     try:
         db_manager.connect()
-        rabbitmq_manager.connect()
+        rabbitmq_publisher.start()
         logging.info("Connections established successfully.")
     except Exception as e:
         logging.error(f"Failed to initialize connections: {e}")
@@ -67,51 +100,149 @@ db_manager = PostgresConnectionManager(
     port=db_port,
     database=db_name,
     user=db_user,
-    password=db_password
+    password=db_password,
+    min_pool_size=db_pool_min_size,
+    max_pool_size=db_pool_max_size,
+    checkout_timeout=db_pool_timeout
 )
 
-rabbitmq_manager = RabbitMQConnectionManager(
+rabbitmq_publisher = RabbitMQPublisher(
     host=rabbitmq_host,
     port=rabbitmq_port,
     queue_name=rabbitmq_queue,
     rabbitmq_username=rabbitmq_username,
-    rabbitmq_password=rabbitmq_password
+    rabbitmq_password=rabbitmq_password,
+    pool_size=publisher_pool_size,
+    confirm_timeout=publish_confirm_timeout,
+    enable_rpc=rpc_enabled
 )
 
 initialize_connections()
 
-def predict(file):
+result_cache = ResultCache(db_manager, max_size=result_cache_size) if result_cache_enabled else None
+
+result_notifier = None
+if result_notify_enabled:
+    result_notifier = ResultNotifier(db_manager, RESULTS_NOTIFY_CHANNEL)
+    result_notifier.start()
+
+id_allocator = IdAllocator(db_manager, block_size=id_block_size)
+request_writer = None
+if ingest_mode == 'batched':
+    request_writer = BatchedRequestWriter(
+        db_manager,
+        id_allocator,
+        max_batch_size=insert_batch_size,
+        max_wait=insert_batch_wait_ms / 1000.0
+    )
+
+def create_request(status, label=None, confidence=None):
+    """Insert a classification request row and return its id."""
+    if request_writer is not None:
+        return request_writer.submit(status=status, label=label, confidence=confidence)
     try:
-        image = Image.open(io.BytesIO(file.read())) 
-        if image.format.lower() not in ALLOWED_EXTENSIONS:
-            raise ValueError(f"Invalid image format: {image.format}")
-        
-        image_bytes = io.BytesIO()
-        image.save(image_bytes, format=image.format)
-        encoded_image = base64.b64encode(image_bytes.getvalue()).decode('utf-8')
+        record = ClassificationRequest(status=status, label=label, confidence=confidence)
+        db.session.add(record)
+        db.session.commit()
+        return record.id
+    except Exception:
+        db.session.rollback()
+        raise
+
+def observe_publish(times):
+    """Export the producer's stage latencies once the broker has confirmed the message."""
+    observe_stages(times, ('persisted', 'published'))
+    PIPELINE_STAGE_SECONDS.labels(stage='confirmed').observe(time.time() - times['published'])
+
+def predict(file, wait=0, topk=1, received=None):
+    """Queue an uploaded image; with wait > 0 seconds, wait that long for the worker's direct reply."""
+    times = {'received': received or time.time()}
+    try:
+        image_bytes, content_type = validate_image(read_upload(file, max_upload_bytes), mode=upload_validation, max_pixels=max_image_pixels)
     except Exception as e:
         resp = {'status': 400, 'header': 'Invalid image data', 'msg': 'The image may not be of a valid extension {}. Error: {}'.format(ALLOWED_EXTENSIONS,str(e))}
         return resp    
-    
+
+    image_hash = content_hash(image_bytes)
+    use_rpc = wait > 0 and rpc_enabled
+    # The cache only holds the top prediction, so a caller waiting for more has to go to a worker
+    if result_cache is not None and not (use_rpc and topk > 1):
+        cached = result_cache.get(image_hash)
+        if cached is not None:
+            return predict_from_cache(*cached, completed=wait > 0)
+
     try:
-        record = ClassificationRequest(status='PENDING', label=None)
-        db.session.add(record)
-        db.session.commit()
-        request_id = record.id
+        request_id = create_request(status='PENDING')
+        mark(times, 'persisted')
     except Exception as db_error:
-        db.session.rollback()
         logging.error(f"Failed to save classification request to the database: {db_error}")
         data = {'status': 400, 'header': 'Database Error', 'msg': str(db_error)}
         return data
 
+    headers = {'x-content-hash': image_hash}
+    if use_rpc:
+        headers['x-topk'] = topk
+    headers.update(stage_headers(mark(times, 'published')))
+    body, properties = encode_message(request_id, image_bytes, content_type, headers=headers)
+    if use_rpc:
+        confirm, reply = rabbitmq_publisher.publish_rpc(body, properties)
+    else:
+        confirm, reply = rabbitmq_publisher.publish(body, properties=properties), None
     try:
-        msg = {'id': request_id, 'image': encoded_image} 
-        rabbitmq_manager.publish_message(json.dumps(msg))
+        confirm.result(publish_confirm_timeout)
+        observe_publish(times)
     except Exception as rabbitmq_error:
         logging.error(f"Failed to publish message to RabbitMQ: {rabbitmq_error}")
+        if reply is not None:
+            rabbitmq_publisher.cancel_rpc(reply)
+        abandon_request(request_id, confirm)
         data = {'status': 400, 'header':'RabbitMQ Error','msg': 'Failed to publish message to RabbitMQ. Error:{}'.format(str(rabbitmq_error))}
         return data
-    data = {'status': 200, 'msg': 'Prediction request received. Request id:{}'.format(request_id)}
+
+    result = wait_for_reply(reply, wait) if reply is not None else None
+    if result is not None:
+        data = {'status': 200, 'msg': 'Prediction completed. Request id:{}'.format(request_id), 'id': request_id, 'result': result}
+        return data
+    data = {'status': 200, 'msg': 'Prediction request received. Request id:{}'.format(request_id), 'id': request_id}
+    return data
+
+def wait_for_reply(reply, wait):
+    """Return the worker's direct reply, or None if it does not arrive within wait seconds."""
+    try:
+        return json.loads(reply.result(timeout=wait))
+    except futures.TimeoutError:
+        # Too slow for the caller's deadline, answer like an asynchronous request instead
+        return None
+    finally:
+        # Forget the correlation id on every path; a reply arriving later is counted as late and dropped
+        rabbitmq_publisher.cancel_rpc(reply)
+
+def abandon_request(request_id, confirm):
+    """Withdraw a message whose confirm never came and mark its row FAILED unless a worker already got to it."""
+    if rabbitmq_publisher.withdraw(confirm):
+        logging.warning(f"Withdrew unpublished message for request ID {request_id}")
+    try:
+        db_manager.execute_query(
+            "UPDATE classification_requests SET status = 'FAILED', label = 'unknown', confidence = 0 WHERE id = %s AND status = 'PENDING'",
+            (request_id,)
+        )
+    except Exception as db_error:
+        logging.error(f"Failed to mark request ID {request_id} as FAILED: {db_error}")
+
+def predict_from_cache(label, confidence, completed=False):
+    """Record a request answered from the result cache; completed gives a waiting caller the result itself."""
+    try:
+        request_id = create_request(status='PROCESSED', label=label, confidence=confidence)
+    except Exception as db_error:
+        logging.error(f"Failed to save classification request to the database: {db_error}")
+        data = {'status': 400, 'header': 'Database Error', 'msg': str(db_error)}
+        return data
+    if completed:
+        result = {'id': request_id, 'status': 'PROCESSED', 'label': label, 'confidence': confidence,
+                  'topk': [{'label': label, 'confidence': confidence}]}
+        data = {'status': 200, 'msg': 'Prediction completed. Request id:{}'.format(request_id), 'id': request_id, 'result': result}
+        return data
+    data = {'status': 200, 'msg': 'Prediction request received. Request id:{}'.format(request_id), 'id': request_id}
     return data
 
 @app.route('/predictFE', methods=['POST'])
@@ -123,7 +254,7 @@ def predictFE():
         if 'image' not in request.files:
             return render_template('processing.html', data=resp)
         file = request.files['image']    
-        data = predict(file)
+        data = predict(file, received=g.start_time)
         return render_template('processing.html', data=data), data['status']
     except Exception as e:
         logging.error(f"Error occurred: {e}")
@@ -138,66 +269,210 @@ def predictAPI():
         if 'image' not in request.files:
             return resp
         file = request.files['image']    
-        data = predict(file)
+        try:
+            wait = parse_wait(request.args, max_result_wait)
+            topk = parse_number(request.args, 'topk', 1, 1, MAX_TOPK, cast=int)
+        except ValueError as e:
+            return {'status': 400, 'header': 'Invalid query argument', 'msg': str(e)}, 400
+        data = predict(file, wait=wait, topk=topk, received=g.start_time)
         return data, data['status']
     except Exception as e:
         logging.error(f"Error occurred: {e}")
         return jsonify({'error': str(e)}), 500
 
+def iter_batch_uploads():
+    """Yield (filename, file) for every image in a /predict/batch request, as it is read from the request."""
+    if request.mimetype in TAR_CONTENT_TYPES:
+        yield from iter_tar(request.stream, max_batch_items, max_batch_bytes)
+        return
+    if request.mimetype in ZIP_CONTENT_TYPES:
+        yield from iter_zip(request.stream, max_batch_items, max_batch_bytes)
+        return
+    for file in request.files.getlist('image'):
+        yield file.filename, file
+    for archive in request.files.getlist('archive'):
+        yield from iter_archive(archive.filename, archive.stream, max_batch_items, max_batch_bytes)
+
+def predict_batch(uploads, received=None):
+    """Validate, insert and publish many images at once, reporting errors per item."""
+    times = {'received': received or time.time()}
+    items = []
+    accepted = []
+    for index, (filename, file) in enumerate(uploads):
+        if index >= max_batch_items:
+            items.append({'index': index, 'filename': filename, 'status': 400, 'error': f'Batch exceeds {max_batch_items} images'})
+            break
+        item = {'index': index, 'filename': filename}
+        items.append(item)
+        try:
+            image_bytes, content_type = validate_image(read_upload(file, max_upload_bytes), mode=upload_validation, max_pixels=max_image_pixels)
+        except Exception as e:
+            item.update({'status': 400, 'error': 'Invalid image data: {}'.format(str(e))})
+            continue
+        image_hash = content_hash(image_bytes)
+        cached = result_cache.get(image_hash) if result_cache is not None else None
+        accepted.append((item, image_bytes, content_type, image_hash, cached))
+
+    if not accepted:
+        return {'status': 400, 'accepted': 0, 'results': items}
+
+    # All rows go in with a single multi-row INSERT, so they commit or fail together
+    try:
+        now = datetime.now(timezone.utc)
+        rows = []
+        for entry in accepted:
+            item, cached = entry[0], entry[4]
+            item['id'] = id_allocator.next_id()
+            label, confidence = cached if cached is not None else (None, None)
+            rows.append((item['id'], 'PENDING' if cached is None else 'PROCESSED', label, confidence, now, now))
+        db_manager.execute_values(INSERT_REQUESTS_QUERY, rows)
+        mark(times, 'persisted')
+    except Exception as db_error:
+        logging.error(f"Failed to save {len(accepted)} classification requests to the database: {db_error}")
+        for entry in accepted:
+            entry[0].pop('id', None)
+            entry[0].update({'status': 400, 'error': 'Database Error: {}'.format(str(db_error))})
+        return {'status': 400, 'accepted': 0, 'results': items}
+
+    # Publish everything first and then wait, so the broker can confirm the batch together
+    publishes = []
+    mark(times, 'published')
+    for item, image_bytes, content_type, image_hash, cached in accepted:
+        if cached is not None:
+            item['status'] = 200
+            continue
+        body, properties = encode_message(item['id'], image_bytes, content_type, headers={'x-content-hash': image_hash, **stage_headers(times)})
+        publishes.append((item, rabbitmq_publisher.publish(body, properties=properties)))
+    futures.wait([future for _, future in publishes], timeout=publish_confirm_timeout)
+    for item, future in publishes:
+        try:
+            future.result(timeout=0)
+            item['status'] = 200
+            observe_publish(times)
+        except Exception as rabbitmq_error:
+            logging.error(f"Failed to publish request {item['id']} to RabbitMQ: {rabbitmq_error}")
+            abandon_request(item['id'], future)
+            item.update({'status': 400, 'error': 'RabbitMQ Error: {}'.format(str(rabbitmq_error) or 'publish confirm timed out')})
+
+    accepted_count = sum(1 for item in items if item.get('status') == 200)
+    return {'status': 200 if accepted_count else 400, 'accepted': accepted_count, 'results': items}
+
+@app.route('/predict/batch', methods=['POST'])
+@REQUEST_TIME.time()
+def predictBatchAPI():
+    route_hit_counter.labels(route='/predict/batch').inc()
+    try:
+        data = predict_batch(iter_batch_uploads(), received=g.start_time)
+        return data, data['status']
+    except (BatchTooLarge, RequestEntityTooLarge) as e:
+        logging.warning(f"Rejected oversized batch: {e}")
+        return {'status': 413, 'error': str(e)}, 413
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def fetch_result(request_id):
+    result = db_manager.execute_query(
+        "SELECT id, status, label, confidence FROM classification_requests WHERE id = %s",
+        (request_id,)
+    )
+    if not result:
+        return None
+    return {'id': result[0][0], 'status': result[0][1], 'label': result[0][2], 'confidence': result[0][3]}
+
+def wait_for_result(request_id, timeout):
+    """Return the request row once it leaves PENDING or timeout expires, woken by NOTIFY instead of polling."""
+    result = None
+    for result in iter_result_updates(request_id, timeout):
+        pass
+    return result
+
+def iter_result_updates(request_id, timeout, keepalive=None):
+    """Yield None every keepalive seconds while the request is PENDING, then yield its final row."""
+    # Subscribe before reading the row so a notification sent in between is not missed
+    subscription = result_notifier.subscribe(request_id)
+    try:
+        result = fetch_result(request_id)
+        deadline = time.monotonic() + timeout
+        while result is not None and result['status'] == 'PENDING':
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                payload = subscription.get(timeout=min(remaining, keepalive or remaining))
+            except queue.Empty:
+                if keepalive is not None and time.monotonic() < deadline:
+                    yield None
+                continue
+            if payload.get('resync'):
+                result = fetch_result(request_id)
+            else:
+                result = {'id': payload['id'], 'status': payload['status'], 'label': payload['label'], 'confidence': payload['confidence']}
+        yield result
+    finally:
+        result_notifier.unsubscribe(request_id, subscription)
+
+@app.route('/results/stream', methods=['GET'])
+def stream_result():
+    """Server-sent events stream that emits a single 'result' event when the request finishes."""
+    route_hit_counter.labels(route='/results/stream').inc()
+    if result_notifier is None:
+        return jsonify({'error': 'Result notifications are disabled'}), 503
+    try:
+        request_id = parse_request_id(request.args.get('id'))
+        timeout = parse_number(request.args, 'timeout', max_result_wait, 0.0, max_result_wait)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'hint': 'Use /results/stream?id=<request id>&timeout=<seconds>'}), 400
+
+    def events():
+        for result in iter_result_updates(request_id, timeout, keepalive=sse_keepalive):
+            if result is None:
+                yield ": keep-alive\n\n"
+            elif result['status'] == 'PENDING':
+                yield f"event: timeout\ndata: {json.dumps(result)}\n\n"
+            else:
+                yield f"event: result\ndata: {json.dumps(result)}\n\n"
+
+    if fetch_result(request_id) is None:
+        return jsonify({'msg': 'Request ID not found', 'hint': 'Check the request ID and try again'}), 404
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def wants_json():
+    if request.args.get('format', '').lower() == 'json':
+        return True
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
 @app.route('/results', methods=['GET'])
 @REQUEST_TIME.time()
 def get_prediction():
     route_hit_counter.labels(route='/results').inc()
     try:
-        route_hit_counter.labels(route='/results').inc()
-        
-        request_id = request.args.get('id')
-        if request_id:
-            result = db_manager.execute_query(
-                "SELECT id, status, label FROM classification_requests WHERE id = %s",
-                (request_id)
-            )
+        if request.args.get('id'):
+            try:
+                request_id = parse_request_id(request.args['id'])
+                wait = parse_wait(request.args, max_result_wait)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if wait > 0 and result_notifier is not None:
+                result = wait_for_result(request_id, wait)
+            else:
+                result = fetch_result(request_id)
             if not result:
                 return jsonify({'msg': 'Request ID not found', 'hint': 'Check the request ID and try again'}), 404
-            return jsonify({'id': result[0][0], 'status': result[0][1], 'label': result[0][2]}), 200
-        
-        cursor = request.args.get('cursor', None)
-        limit = int(request.args.get('limit', 10))
-        order = request.args.get('order', 'desc').lower()
-        direction = request.args.get('direction', 'next').lower()
-        order_clause = 'ASC' if order == 'asc' else 'DESC'
-           
-        query = 'SELECT id, status, label, "createdAt"\nFROM classification_requests'
-        prev_cursor = None
-        next_cursor = None   
-        if cursor:
-            if direction == 'next':
-                prev_cursor = int(cursor) +1
-                next_cursor = int(cursor) + limit
-            else:
-                prev_cursor = int(cursor) - limit - 1
-                next_cursor = int(cursor) - 1
-              
-            query += "\nWHERE id >= {} AND id <= {}".format(str(prev_cursor), str(next_cursor))
-        
-        query += "\nORDER BY id {}\nLIMIT {}".format(order_clause, limit)
-        results = db_manager.execute_query(query)
-
-        data = [{'id': row[0], 'status': row[1], 'label': row[2], 'createdAt':row[3]} for row in results]
-        has_more = True
-        if len(data) < limit:
-            has_more = False
-        if len(data) > 0 and has_more:
-            cursor = data[-1]['id']
-
-        response = {
-            'data': data,
-            'limit': limit,
-            'order': order,
-            'cursor': int(cursor),
-            'has_more': has_more,
-            'direction': direction
-        }
+            return jsonify({'id': result['id'], 'status': result['status'], 'label': result['label']}), 200
+
+        try:
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query, params = build_page_query(**page_args)
+        results = db_manager.execute_query(query, params)
+        response = build_page(results, **page_args)
+
+        if wants_json():
+            for row in response['data']:
+                row['createdAt'] = row['createdAt'].isoformat() if row['createdAt'] else None
+            return jsonify(response), 200
         return render_template('results.html', data=response)
 
     except Exception as e:
@@ -227,6 +502,7 @@ if __name__ == '__main__':
     # start_metrics_server()  # Start the Prometheus metrics server
     with app.app_context():
         db.create_all()    
+    upgrade_schema(db_manager)
     migrate = Migrate(app, db)
     app.run(host='0.0.0.0', port=5000, debug=True)  # Start the Flask app
     
\ No newline at end of file
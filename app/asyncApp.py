@@ -0,0 +1,266 @@
+import time
+import asyncio
+import logging
+from os import environ
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncpg
+import aio_pika
+from quart import Quart, request, jsonify, g, render_template
+from prometheus_client import Counter, generate_latest, REGISTRY, Summary, Histogram
+
+from constants import ALLOWED_EXTENSIONS, MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS
+from messageEnvelope import message_headers
+from stageTracing import mark, stage_headers, observe_stages, PIPELINE_STAGE_SECONDS
+from imageValidation import read_upload, validate_image
+from pagination import parse_page_args, build_page_query, build_page
+from queryArgs import parse_request_id
+from resultCache import LRUCache, CACHE_HITS, CACHE_MISSES, content_hash
+
+# Asyncio variant of app.py serving the same routes on an ASGI server.
+# The schema is still created and migrated by app.py (db.create_all / Flask-Migrate).
+# Pushed results (/results/stream, /results?wait=) and synchronous /predict?wait=&topk= are only served by
+# app.py; here wait and topk are ignored.
+
+db_host = environ.get('DB_HOST', 'localhost')
+db_port = int(environ.get('DB_PORT', 5432))
+db_name = environ.get('DB_NAME', 'resnet18_db')
+db_user = environ.get('DB_USER', 'root')
+db_password = environ.get('DB_PASSWORD', 'password')
+db_pool_min_size = int(environ.get('DB_POOL_MIN_SIZE', 1))
+db_pool_max_size = int(environ.get('DB_POOL_MAX_SIZE', 10))
+rabbitmq_host = environ.get('RABBITMQ_HOST', 'localhost')
+rabbitmq_port = int(environ.get('RABBITMQ_PORT', 5672))
+rabbitmq_queue = environ.get('RABBITMQ_QUEUE', 'requests_queue')
+rabbitmq_username = environ.get('RABBITMQ_USERNAME', 'guest')
+rabbitmq_password = environ.get('RABBITMQ_PASSWORD', 'guest')
+upload_validation = environ.get('UPLOAD_VALIDATION', 'header').lower()
+max_upload_bytes = int(environ.get('MAX_UPLOAD_BYTES', MAX_UPLOAD_BYTES))
+max_image_pixels = int(environ.get('MAX_IMAGE_PIXELS', MAX_IMAGE_PIXELS))
+result_cache_enabled = environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+result_cache_size = int(environ.get('RESULT_CACHE_SIZE', 10000))
+validation_workers = int(environ.get('VALIDATION_WORKERS', 2))
+publish_confirm_timeout = float(environ.get('PUBLISH_CONFIRM_TIMEOUT', 5))
+app_port = int(environ.get('PORT', 5000))
+
+route_hit_counter = Counter('route_hits', 'Count of hits to routes', ['route'])
+REQUEST_TIME = Summary('request_processing_seconds', 'Time spent processing request', registry=REGISTRY)
+REQUEST_COUNT = Counter('request_count', 'Total number of requests', ['method', 'endpoint', 'http_status'], registry=REGISTRY)
+REQUEST_LATENCY = Histogram('request_latency_seconds', 'Request latency', ['method', 'endpoint'], registry=REGISTRY)
+
+app = Quart(__name__)
+
+# CPU-bound image validation runs here so it never blocks the event loop
+validation_executor = ThreadPoolExecutor(max_workers=validation_workers, thread_name_prefix='validation')
+local_cache = LRUCache(result_cache_size) if result_cache_enabled else None
+db_pool = None
+amqp_connection = None
+amqp_channel = None
+
+@app.before_serving
+async def initialize_connections():
+    """Open the asyncpg pool and the AMQP connection before accepting requests."""
+    global db_pool, amqp_connection, amqp_channel
+    logging.info("Initializing connections...")
+    db_pool = await asyncpg.create_pool(
+        host=db_host, port=db_port, user=db_user, password=db_password, database=db_name,
+        min_size=db_pool_min_size, max_size=db_pool_max_size
+    )
+    amqp_connection = await aio_pika.connect_robust(
+        host=rabbitmq_host, port=rabbitmq_port, login=rabbitmq_username, password=rabbitmq_password
+    )
+    amqp_channel = await amqp_connection.channel(publisher_confirms=True)
+    await amqp_channel.declare_queue(rabbitmq_queue, durable=True)
+    logging.info("Connections established successfully.")
+
+@app.after_serving
+async def close_connections():
+    if amqp_connection is not None:
+        await amqp_connection.close()
+    if db_pool is not None:
+        await db_pool.close()
+    validation_executor.shutdown(wait=False)
+
+@app.before_request
+async def before_request():
+    g.start_time = time.time()
+
+@app.after_request
+async def after_request(response):
+    latency = time.time() - g.start_time
+    REQUEST_LATENCY.labels(request.method, request.path).observe(latency)
+    REQUEST_COUNT.labels(request.method, request.path, response.status_code).inc()
+    return response
+
+def read_and_validate(file):
+    return validate_image(read_upload(file, max_upload_bytes), mode=upload_validation, max_pixels=max_image_pixels)
+
+async def lookup_cached_result(image_hash):
+    if local_cache is None:
+        return None
+    result = local_cache.get(image_hash)
+    if result is not None:
+        CACHE_HITS.labels(tier='memory').inc()
+        return result
+    try:
+        row = await db_pool.fetchrow("SELECT label, confidence FROM image_results WHERE hash = $1", image_hash)
+    except Exception as e:
+        logging.warning(f"Result cache lookup failed: {e}")
+        row = None
+    if row is not None:
+        result = (row['label'], row['confidence'])
+        local_cache.put(image_hash, result)
+        CACHE_HITS.labels(tier='database').inc()
+        return result
+    CACHE_MISSES.inc()
+    return None
+
+async def create_request(status, label=None, confidence=None):
+    # createdAt/updated are timestamp without time zone, and asyncpg rejects aware datetimes for those
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return await db_pool.fetchval(
+        'INSERT INTO classification_requests (status, label, confidence, "createdAt", updated) VALUES ($1, $2, $3, $4, $4) RETURNING id',
+        status, label, confidence, now
+    )
+
+async def fail_request(request_id):
+    """Mark FAILED a request whose message was never confirmed, unless a worker already got to it."""
+    try:
+        await db_pool.execute(
+            "UPDATE classification_requests SET status = 'FAILED', label = 'unknown', confidence = 0 WHERE id = $1 AND status = 'PENDING'",
+            request_id
+        )
+    except Exception as db_error:
+        logging.error(f"Failed to mark request ID {request_id} as FAILED: {db_error}")
+
+async def predict(file, received=None):
+    times = {'received': received or time.time()}
+    try:
+        loop = asyncio.get_running_loop()
+        image_bytes, content_type = await loop.run_in_executor(validation_executor, read_and_validate, file)
+    except Exception as e:
+        resp = {'status': 400, 'header': 'Invalid image data', 'msg': 'The image may not be of a valid extension {}. Error: {}'.format(ALLOWED_EXTENSIONS, str(e))}
+        return resp
+
+    image_hash = content_hash(image_bytes)
+    cached = await lookup_cached_result(image_hash)
+    status = 'PENDING' if cached is None else 'PROCESSED'
+    label, confidence = cached if cached is not None else (None, None)
+
+    try:
+        request_id = await create_request(status, label, confidence)
+        mark(times, 'persisted')
+    except Exception as db_error:
+        logging.error(f"Failed to save classification request to the database: {db_error}")
+        data = {'status': 400, 'header': 'Database Error', 'msg': str(db_error)}
+        return data
+
+    if cached is None:
+        try:
+            message = aio_pika.Message(
+                body=image_bytes,
+                content_type=content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                message_id=str(request_id),
+                headers=message_headers(request_id, {'x-content-hash': image_hash, **stage_headers(mark(times, 'published'))})
+            )
+            await amqp_channel.default_exchange.publish(message, routing_key=rabbitmq_queue, timeout=publish_confirm_timeout)
+            observe_stages(times, ('persisted', 'published'))
+            PIPELINE_STAGE_SECONDS.labels(stage='confirmed').observe(time.time() - times['published'])
+        except Exception as rabbitmq_error:
+            logging.error(f"Failed to publish message to RabbitMQ: {rabbitmq_error}")
+            await fail_request(request_id)
+            data = {'status': 400, 'header': 'RabbitMQ Error', 'msg': 'Failed to publish message to RabbitMQ. Error:{}'.format(str(rabbitmq_error))}
+            return data
+    data = {'status': 200, 'msg': 'Prediction request received. Request id:{}'.format(request_id), 'id': request_id}
+    return data
+
+@app.route('/predictFE', methods=['POST'])
+async def predictFE():
+    route_hit_counter.labels(route='/predict').inc()
+    try:
+        files = await request.files
+        resp = {'header': 'Image not found in request', 'msg': 'Add the image to a key named "image"'}
+        if 'image' not in files:
+            return await render_template('processing.html', data=resp)
+        data = await predict(files['image'], received=g.start_time)
+        return await render_template('processing.html', data=data), data['status']
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict', methods=['POST'])
+async def predictAPI():
+    route_hit_counter.labels(route='/predict').inc()
+    try:
+        files = await request.files
+        resp = {'header': 'Image not found in request', 'msg': 'Add the image to a key named "image"'}
+        if 'image' not in files:
+            return resp
+        data = await predict(files['image'], received=g.start_time)
+        return data, data['status']
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def wants_json():
+    if request.args.get('format', '').lower() == 'json':
+        return True
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+@app.route('/results', methods=['GET'])
+async def get_prediction():
+    route_hit_counter.labels(route='/results').inc()
+    try:
+        if request.args.get('id'):
+            try:
+                request_id = parse_request_id(request.args['id'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            row = await db_pool.fetchrow("SELECT id, status, label FROM classification_requests WHERE id = $1", request_id)
+            if row is None:
+                return jsonify({'msg': 'Request ID not found', 'hint': 'Check the request ID and try again'}), 404
+            return jsonify({'id': row['id'], 'status': row['status'], 'label': row['label']}), 200
+
+        try:
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query, params = build_page_query(**page_args, paramstyle='numeric')
+        rows = await db_pool.fetch(query, *params)
+        response = build_page([tuple(row.values()) for row in rows], **page_args)
+
+        if wants_json():
+            for row in response['data']:
+                row['createdAt'] = row['createdAt'].isoformat() if row['createdAt'] else None
+            return jsonify(response), 200
+        return await render_template('results.html', data=response)
+
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/')
+async def index():
+    route_hit_counter.labels(route='/').inc()
+    return await render_template('index.html')
+
+@app.route('/health')
+async def health():
+    route_hit_counter.labels(route='/health').inc()
+    return "OK", 200
+
+@app.route('/metrics')
+async def metrics():
+    route_hit_counter.labels(route='/metrics').inc()
+    return generate_latest(REGISTRY), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    config.bind = [f'0.0.0.0:{app_port}']
+    asyncio.run(serve(app, config))
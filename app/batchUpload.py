@@ -0,0 +1,67 @@
+import tarfile
+import zipfile
+import tempfile
+from constants import MAX_BATCH_ITEMS, MAX_BATCH_BYTES
+
+TAR_CONTENT_TYPES = {'application/x-tar', 'application/tar', 'application/gzip', 'application/x-gzip'}
+ZIP_CONTENT_TYPES = {'application/zip', 'application/x-zip-compressed'}
+
+class BatchTooLarge(ValueError):
+    """A batch archive has more files, or more bytes, than the configured limits allow."""
+
+def iter_tar(stream, max_files=MAX_BATCH_ITEMS, max_total_bytes=MAX_BATCH_BYTES):
+    """Yield (name, file) for each regular file in a tar stream without buffering the whole archive.
+
+    Each file must be read before the next one is requested. The file count and the sizes declared in the
+    member headers are checked as the archive streams in, so an oversized archive fails part way through.
+    """
+    files = 0
+    total_bytes = 0
+    with tarfile.open(fileobj=stream, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            files += 1
+            total_bytes += member.size
+            check_limits(files, total_bytes, max_files, max_total_bytes)
+            yield member.name, archive.extractfile(member)
+
+def iter_zip(stream, max_files=MAX_BATCH_ITEMS, max_total_bytes=MAX_BATCH_BYTES, spool_size=16 * 1024 * 1024):
+    """Yield (name, file) for each file in a zip archive; non-seekable streams are spooled first.
+
+    Spooling stops with BatchTooLarge once more than max_total_bytes have been read, and the central
+    directory is checked against both limits before any member is opened.
+    """
+    if not (hasattr(stream, 'seekable') and stream.seekable()):
+        spooled = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        copy_limited(stream, spooled, max_total_bytes)
+        spooled.seek(0)
+        stream = spooled
+    with zipfile.ZipFile(stream) as archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        check_limits(len(infos), sum(info.file_size for info in infos), max_files, max_total_bytes)
+        for info in infos:
+            with archive.open(info) as file:
+                yield info.filename, file
+
+def iter_archive(filename, stream, max_files=MAX_BATCH_ITEMS, max_total_bytes=MAX_BATCH_BYTES):
+    if filename and filename.lower().endswith('.zip'):
+        return iter_zip(stream, max_files, max_total_bytes)
+    return iter_tar(stream, max_files, max_total_bytes)
+
+def check_limits(files, total_bytes, max_files, max_total_bytes):
+    if files > max_files:
+        raise BatchTooLarge(f"Archive holds more than {max_files} files")
+    if total_bytes > max_total_bytes:
+        raise BatchTooLarge(f"Archive holds more than {max_total_bytes} bytes of files")
+
+def copy_limited(source, target, max_bytes, chunk_size=1024 * 1024):
+    copied = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        copied += len(chunk)
+        if copied > max_bytes:
+            raise BatchTooLarge(f"Archive is larger than {max_bytes} bytes")
+        target.write(chunk)
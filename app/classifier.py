@@ -1,16 +1,48 @@
+import os
+import shutil
+import logging
+import tempfile
+from contextlib import suppress
 import torch
 from torchvision import transforms, models
+from PIL import Image
+from preprocessing import ImagePreprocessor, normalize_mode, flatten_to_rgb
+
+BACKENDS = ('eager', 'torchscript', 'quantized_dynamic', 'quantized_static', 'onnx')
+PREPROCESSORS = ('fast', 'torchvision')
 
 class ImageClassifier:
-    def __init__(self, model_name='resnet18', model_path=None, label_path=None):
+    """ResNet-18 classifier with a selectable CPU execution backend.
+
+    backend is one of BACKENDS; every backend is built from the same eager weights. 'quantized_static'
+    needs calibration_dir (a folder of sample images) for its int8 calibration pass. channels_last switches
+    the torch backends to NHWC memory format. preprocessing 'fast' uses ImagePreprocessor (draft JPEG decoding,
+    crop before resize, reused buffers); 'torchvision' keeps the original transforms pipeline for comparison.
+    The weights are memory-mapped from model_path, and the model is warmed up with warmup_iterations
+    dummy batches before the constructor returns. The 'onnx' backend caches its export in onnx_cache_dir.
+    """
+    def __init__(self, model_name='resnet18', model_path=None, label_path=None, backend='eager',
+                 channels_last=False, calibration_dir=None, warmup_iterations=2, onnx_cache_dir=None,
+                 preprocessing='fast'):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+        if preprocessing not in PREPROCESSORS:
+            raise ValueError(f"Unknown preprocessing '{preprocessing}', expected one of {PREPROCESSORS}")
         self.device = torch.device('cpu')  # Force to use CPU
+        self.backend = backend
+        self.channels_last = channels_last and backend != 'onnx'
+        self.model_path = model_path
+        self.onnx_cache_dir = onnx_cache_dir or os.path.join(tempfile.gettempdir(), 'onnx-cache')
         if model_path:
-            self.model = models.resnet18()
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+            # Build the module without initializing weights, then adopt the memory-mapped tensors from the checkpoint
+            with torch.device('meta'):
+                self.model = models.resnet18()
+            state_dict = torch.load(model_path, map_location=self.device, mmap=True, weights_only=True)
+            self.model.load_state_dict(state_dict, assign=True)
         else:
             self.model = torch.hub.load('pytorch/vision:v0.10.0', model_name, pretrained=True)
         self.model.eval()
-        
+
         self.model.to(self.device)
 
         self.preprocess = transforms.Compose([
@@ -19,22 +51,202 @@ class ImageClassifier:
             transforms.ToTensor(),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
         ])
+        self.preprocessor = ImagePreprocessor(channels_last=self.channels_last) if preprocessing == 'fast' else None
 
         with open(label_path, "r") as f:
             self.categories = [s.strip() for s in f.readlines()]
 
-    def preprocess_image(self, image):
-        input_image = image
-        input_tensor = self.preprocess(input_image)
-        input_batch = input_tensor.unsqueeze(0).to(self.device)  # Move to device here
+        self.runner = self._build_runner(calibration_dir)
+        self.warmup(warmup_iterations)
+
+    def _build_runner(self, calibration_dir):
+        if self.backend == 'onnx':
+            return self._build_onnx_runner()
+
+        if self.backend == 'quantized_static':
+            model = self._build_static_quantized_model(calibration_dir)
+        elif self.backend == 'quantized_dynamic':
+            # Only nn.Linear (the final fc layer) has a dynamic int8 kernel; the convolutions stay fp32
+            model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            model = self.model
+
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        if self.backend == 'torchscript':
+            with torch.no_grad():
+                example = self._example_input()
+                model = torch.jit.optimize_for_inference(torch.jit.freeze(torch.jit.trace(model, example)))
+        return model
+
+    def _build_static_quantized_model(self, calibration_dir):
+        if not calibration_dir:
+            raise ValueError("The 'quantized_static' backend needs calibration_dir with sample images")
+        from torchvision.models import quantization
+
+        model = quantization.resnet18(weights=None, quantize=False)
+        model.load_state_dict(self.model.state_dict())
+        model.eval()
+        model.fuse_model()
+        model.qconfig = torch.ao.quantization.get_default_qconfig('fbgemm')
+        torch.ao.quantization.prepare(model, inplace=True)
+
+        images = load_sample_images(calibration_dir)
+        if not images:
+            raise ValueError(f"No calibration images found in '{calibration_dir}'")
+        with torch.no_grad():
+            for start in range(0, len(images), 16):
+                model(self._to_batch(images[start:start + 16]))
+        torch.ao.quantization.convert(model, inplace=True)
+        logging.info(f"Calibrated static int8 model on {len(images)} images")
+        return model
+
+    def _build_onnx_runner(self):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        onnx_path = self._export_onnx()
+        try:
+            session = onnxruntime.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+        except Exception as e:
+            # A cached export missing its weights sidecar, for instance; export again once
+            logging.warning(f"Failed to load cached ONNX model {onnx_path}, exporting it again: {e}")
+            onnx_path = self._export_onnx(force=True)
+            session = onnxruntime.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+        def run(input_batch):
+            return torch.from_numpy(session.run(None, {'input': input_batch.numpy()})[0])
+        return run
+
+    def _export_onnx(self, force=False):
+        """Return the path of the ONNX export in onnx_cache_dir, exporting first unless an export newer than the checkpoint is cached.
+
+        Newer torch versions write the weights to a .onnx.data sidecar, so both files are checked. The export
+        goes to a private temporary directory and is renamed into place, sidecar first, so workers starting
+        together never load a half-written model.
+        """
+        os.makedirs(self.onnx_cache_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(self.model_path))[0] + '.onnx' if self.model_path else 'resnet18.onnx'
+        onnx_path = os.path.join(self.onnx_cache_dir, name)
+        files = (onnx_path + '.data', onnx_path)
+        if not force and self.model_path and os.path.exists(onnx_path):
+            checkpoint_mtime = os.path.getmtime(self.model_path)
+            if all(os.path.getmtime(f) >= checkpoint_mtime for f in files if os.path.exists(f)):
+                return onnx_path
+
+        export_dir = tempfile.mkdtemp(dir=self.onnx_cache_dir)
+        try:
+            torch.onnx.export(
+                self.model, self._example_input(), os.path.join(export_dir, name),
+                input_names=['input'], output_names=['output'],
+                dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}}
+            )
+            for path in files:
+                exported = os.path.join(export_dir, os.path.basename(path))
+                if os.path.exists(exported):
+                    os.replace(exported, path)
+                else:
+                    # Left by an export from another torch version, and no longer referenced
+                    with suppress(FileNotFoundError):
+                        os.remove(path)
+        finally:
+            shutil.rmtree(export_dir, ignore_errors=True)
+        logging.info(f"Exported ONNX model to {onnx_path}")
+        return onnx_path
+
+    def _example_input(self):
+        example = torch.zeros(1, 3, 224, 224)
+        if self.channels_last:
+            example = example.contiguous(memory_format=torch.channels_last)
+        return example
+
+    def _to_batch(self, images):
+        if self.preprocessor is not None:
+            return self.preprocessor.to_tensor(images)
+        input_batch = torch.stack([self.preprocess(flatten_to_rgb(normalize_mode(image))) for image in images]).to(self.device)
+        if self.channels_last:
+            input_batch = input_batch.contiguous(memory_format=torch.channels_last)
         return input_batch
 
+    def _forward(self, input_batch):
+        with torch.no_grad():
+            return self.runner(input_batch)
+
+    def warmup(self, iterations=2, batch_size=1):
+        """Run dummy batches through preprocessing and the model so real requests don't pay for lazy initialization."""
+        if iterations <= 0:
+            return
+        dummy = self.prepare(Image.new('RGB', (320, 240)))
+        for _ in range(iterations):
+            self.predict_prepared([dummy] * batch_size, topk=1)
+
+    def preprocess_image(self, image):
+        return self._to_batch([image])
+
     def predict(self, image, topk=5):
         input_batch = self.preprocess_image(image)
-        with torch.no_grad():
-            output = self.model(input_batch)
+        output = self._forward(input_batch)
         probabilities = torch.nn.functional.softmax(output[0], dim=0)
         top_prob, top_catid = torch.topk(probabilities, topk)
-        
+
         results = [(self.categories[top_catid[i]], top_prob[i].item()) for i in range(top_prob.size(0))]
-        return results
\ No newline at end of file
+        return results
+
+    def predict_batch(self, images, topk=5):
+        """Run a single forward pass over a list of images and return top-k results per image."""
+        if not images:
+            return []
+        return self._top_results(self._forward(self._to_batch(images)), topk)
+
+    def prepare(self, image):
+        """Decode and resize one image ahead of predict_prepared(); safe to call from several threads at once."""
+        if self.preprocessor is not None:
+            return self.preprocessor.to_pixels(image)
+        return self.preprocess(flatten_to_rgb(normalize_mode(image)))
+
+    def predict_prepared(self, prepared, topk=5):
+        """predict_batch() for images already passed through prepare()."""
+        if not prepared:
+            return []
+        if self.preprocessor is not None:
+            input_batch = self.preprocessor.from_pixels(prepared)
+        else:
+            input_batch = torch.stack(prepared).to(self.device)
+            if self.channels_last:
+                input_batch = input_batch.contiguous(memory_format=torch.channels_last)
+        return self._top_results(self._forward(input_batch), topk)
+
+    def _top_results(self, output, topk):
+        probabilities = torch.nn.functional.softmax(output, dim=1)
+        top_prob, top_catid = torch.topk(probabilities, topk, dim=1)
+
+        results = []
+        for row in range(top_prob.size(0)):
+            results.append([(self.categories[top_catid[row][i]], top_prob[row][i].item()) for i in range(top_prob.size(1))])
+        return results
+
+    def top1_agreement(self, reference, images, batch_size=16):
+        """Fraction of images whose top-1 label matches another classifier, e.g. the eager fp32 model."""
+        if not images:
+            raise ValueError("No images to compare")
+        matches = 0
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            ours = self.predict_batch(batch, topk=1)
+            theirs = reference.predict_batch(batch, topk=1)
+            matches += sum(1 for a, b in zip(ours, theirs) if a[0][0] == b[0][0])
+        return matches / len(images)
+
+def load_sample_images(folder, limit=None):
+    """Load RGB images from a folder, e.g. data/sampleImages, for calibration and accuracy checks."""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
+            continue
+        with Image.open(os.path.join(folder, name)) as image:
+            images.append(image.convert('RGB'))
+        if limit and len(images) >= limit:
+            break
+    return images
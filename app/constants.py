@@ -1 +1,19 @@
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Version 1 is the legacy base64-in-JSON body, version 2 carries the raw image bytes as the body
+MESSAGE_SCHEMA_VERSION = 2
+
+# Upload limits enforced before an image is forwarded to the workers
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Maximum number of images accepted by a single /predict/batch request
+MAX_BATCH_ITEMS = 256
+# Maximum size of a /predict/batch request body, and of the files unpacked from an archive in it
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+
+# Postgres NOTIFY channel the consumer signals on when a request reaches PROCESSED or FAILED
+RESULTS_NOTIFY_CHANNEL = 'classification_results'
+
+# Upper bound on the number of predictions a synchronous (/predict?wait=) caller can request
+MAX_TOPK = 10
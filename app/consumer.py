@@ -1,16 +1,25 @@
-import threading
 import time
+# Captured before the remaining imports so the "ready after" log line and time-to-first-inference include import time
+started_at = time.time()
+import threading
+import queue
+import functools
 from flask import Flask, g, jsonify, request
-import json
 import io
-import base64
+import json
+import hashlib
 import logging
 from PIL import Image
 import pika
-from prometheus_client import REGISTRY, Counter, Histogram, Summary, generate_latest, start_http_server
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, Summary, generate_latest, start_http_server, multiprocess
 from postgresConnector import PostgresConnectionManager
 from rabbitmqConnector import RabbitMQConnectionManager
-from classifier import ImageClassifier
+from workerSupervisor import WorkerSupervisor, prepare_parent, threads_per_process
+from messageEnvelope import decode_message, envelope_request_id
+from stageTracing import mark, read_stage_times, observe_stages, create_span_exporter
+from schema import upgrade_schema, has_column
+from resultWriter import ResultWriter, FAIL_REQUEST_QUERY, with_notify
+from constants import RESULTS_NOTIFY_CHANNEL, MAX_TOPK
 from os import environ, path
 
 # Load environment variables
@@ -19,13 +28,36 @@ db_port = int(environ.get('DB_PORT', 5432))
 db_name = environ.get('DB_NAME', 'resnet18_db')
 db_user = environ.get('DB_USER', 'root')
 db_password = environ.get('DB_PASSWORD', 'password')
+db_pool_min_size = int(environ.get('DB_POOL_MIN_SIZE', 1))
+db_pool_max_size = int(environ.get('DB_POOL_MAX_SIZE', 4))
+db_pool_timeout = float(environ.get('DB_POOL_TIMEOUT', 30))
 rabbitmq_host = environ.get('RABBITMQ_HOST', 'localhost')
 rabbitmq_port = int(environ.get('RABBITMQ_PORT', 5672))
 rabbitmq_queue = environ.get('RABBITMQ_QUEUE', 'requests_queue')
 rabbitmq_username = environ.get('RABBITMQ_USERNAME', 'guest')   
 rabbitmq_password = environ.get('RABBITMQ_PASSWORD', 'guest')
+rabbitmq_heartbeat = int(environ['RABBITMQ_HEARTBEAT']) if environ.get('RABBITMQ_HEARTBEAT') else None
+reconnect_delay = float(environ.get('RECONNECT_DELAY', 2))
 app_port = int(environ.get('PORT', 5000))
 metrics_port = int(environ.get('METRICS_PORT', 8000))
+# single and batch run inference on the pika I/O thread, so a forward pass longer than the heartbeat interval
+# costs the connection; pipeline keeps the I/O loop free
+consumer_mode = environ.get('CONSUMER_MODE', 'pipeline').lower()
+batch_size = int(environ.get('BATCH_SIZE', 16))
+batch_timeout_ms = int(environ.get('BATCH_TIMEOUT_MS', 50))
+prefetch_count = int(environ.get('PREFETCH_COUNT', batch_size * 2))
+write_batch_size = int(environ.get('WRITE_BATCH_SIZE', 1))
+write_batch_max_age_ms = int(environ.get('WRITE_BATCH_MAX_AGE_MS', 100))
+notify_results = environ.get('NOTIFY_RESULTS', 'true').lower() == 'true'
+decode_workers = int(environ.get('DECODE_WORKERS', 2))
+inference_backend = environ.get('INFERENCE_BACKEND', 'eager').lower()
+channels_last = environ.get('CHANNELS_LAST', 'false').lower() == 'true'
+preprocessing = environ.get('PREPROCESSING', 'fast').lower()
+worker_processes = int(environ.get('WORKER_PROCESSES', 1))
+warmup_batches = int(environ.get('WARMUP_BATCHES', 3))
+calibration_dir = environ.get('CALIBRATION_DIR') or path.join(path.dirname(__file__), '../data/sampleImages')
+onnx_cache_dir = environ.get('ONNX_CACHE_DIR') or None
+store_stage_times = environ.get('STORE_STAGE_TIMES', 'false').lower() == 'true'
 
 app = Flask(__name__)
 
@@ -35,13 +67,28 @@ db_manager = PostgresConnectionManager(
     port=db_port,
     database=db_name,
     user=db_user,
-    password=db_password
+    password=db_password,
+    min_pool_size=db_pool_min_size,
+    max_pool_size=db_pool_max_size,
+    checkout_timeout=db_pool_timeout
 )
 
-# Initialize the image classifier
+# The image classifier is loaded and warmed up by load_classifier() once the HTTP endpoints are up
 model_path = path.join(path.dirname(__file__), '../models/resnet18.pth')
 label_path = path.join(path.dirname(__file__), '../data/imagenet_classes.txt')
-classifier = ImageClassifier(model_name='resnet18', model_path=model_path, label_path=label_path)
+classifier = None
+first_inference_done = False
+
+# Readiness: set once the warmed-up consumer starts consuming, or tracked per inference process by the supervisor
+consuming = threading.Event()
+supervisor = None
+
+# Results are buffered and written back in batches once consuming starts
+result_writer = None
+
+# Created per consuming process by start_consuming(), since the span export thread does not survive fork()
+span_exporter = None
+CONSUMER_STAGES = ('dequeued', 'decoded', 'inferred', 'written')
 
 # initialize the RabbitMQ connection manager
 rabbitmq_manager = RabbitMQConnectionManager(
@@ -49,13 +96,21 @@ rabbitmq_manager = RabbitMQConnectionManager(
     port=rabbitmq_port,
     queue_name=rabbitmq_queue,
     rabbitmq_username=rabbitmq_username,
-    rabbitmq_password=rabbitmq_password
+    rabbitmq_password=rabbitmq_password,
+    heartbeat=rabbitmq_heartbeat
 )
 
 route_hit_counter = Counter('route_hits', 'Count of hits to routes', ['route'])
 REQUEST_TIME = Summary('request_processing_seconds', 'Time spent processing request', registry=REGISTRY)
 REQUEST_COUNT = Counter('request_count', 'Total number of requests', ['method', 'endpoint', 'http_status'], registry=REGISTRY)
 REQUEST_LATENCY = Histogram('request_latency_seconds', 'Request latency', ['method', 'endpoint'], registry=REGISTRY)
+MESSAGES_PROCESSED = Counter('consumer_messages_processed', 'Messages classified and committed to the database', registry=REGISTRY)
+REDELIVERIES = Counter('consumer_redeliveries', 'Deliveries the broker flagged as redelivered', registry=REGISTRY)
+CONNECTION_DROPS = Counter('consumer_connection_drops', 'RabbitMQ connections or channels lost while consuming', registry=REGISTRY)
+STARTUP_SECONDS = Gauge('worker_startup_seconds', 'Seconds spent in each startup phase (load, warmup)', ['phase'], multiprocess_mode='max', registry=REGISTRY)
+TIME_TO_FIRST_INFERENCE = Gauge('worker_time_to_first_inference_seconds', 'Seconds from process start to the first classified message', multiprocess_mode='max', registry=REGISTRY)
+STAGE_QUEUE_DEPTH = Gauge('consumer_stage_queue_depth', 'Messages waiting in front of each pipeline stage', ['stage'], multiprocess_mode='livesum', registry=REGISTRY)
+STAGE_SECONDS = Histogram('consumer_stage_seconds', 'Time spent in each pipeline stage (inference per batch, the others per message)', ['stage'], registry=REGISTRY)
 
 @app.before_request
 def before_request():
@@ -88,81 +143,487 @@ def health():
     route_hit_counter.labels(route='/health').inc()
     return "OK", 200
 
+@app.route('/ready')
+def readiness():
+    route_hit_counter.labels(route='/ready').inc()
+    ready = supervisor.ready() if supervisor is not None else consuming.is_set()
+    if not ready:
+        return "Warming up", 503
+    return "READY", 200
+
 @app.route('/metrics')
 def metrics():
     route_hit_counter.labels(route='/metrics').inc()
-    return generate_latest(REGISTRY), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return generate_latest(metrics_registry()), 200, {'Content-Type': 'text/plain; charset=utf-8'}
 
 def start_flask_app():
     app.run(host='0.0.0.0', port=app_port)
 
 def start_metrics_server():
-    start_http_server(metrics_port)
+    start_http_server(metrics_port, registry=metrics_registry())
 
-def callback(ch, method, properties, body):
-    retry_count = 0
-    try:
-        retry_count = int(properties.headers.get('x-retry-count', 0))
+def serve_http():
+    """Run both HTTP endpoints in the supervisor's server process; blocks."""
+    start_metrics_server()
+    start_flask_app()
+
+def metrics_registry():
+    """Registry to expose; with PROMETHEUS_MULTIPROC_DIR set it aggregates the metrics of every inference process."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def load_classifier():
+    """Import torch, memory-map the weights and run the warm-up batches; the worker reports ready afterwards."""
+    global classifier
+    start = time.time()
+    from classifier import ImageClassifier
+    classifier = ImageClassifier(
+        model_name='resnet18',
+        model_path=model_path,
+        label_path=label_path,
+        backend=inference_backend,
+        channels_last=channels_last,
+        calibration_dir=calibration_dir,
+        onnx_cache_dir=onnx_cache_dir,
+        preprocessing=preprocessing,
+        warmup_iterations=0
+    )
+    STARTUP_SECONDS.labels(phase='load').set(time.time() - start)
+
+    start = time.time()
+    classifier.warmup(warmup_batches, batch_size if consumer_mode != 'single' else 1)
+    STARTUP_SECONDS.labels(phase='warmup').set(time.time() - start)
+    logging.info(f"Image classifier ready with the '{inference_backend}' backend (channels_last={channels_last}) "
+                 f"{time.time() - started_at:.1f}s after start")
+
+def record_first_inference():
+    global first_inference_done
+    if not first_inference_done:
+        first_inference_done = True
+        TIME_TO_FIRST_INFERENCE.set(time.time() - started_at)
 
-        message = json.loads(body)
-        request_id = message['id']
-        encoded_image = message['image']
+def finish_trace(request_id, times):
+    """Called once a result is committed: export the consumer's stage latencies and, if configured, the request's spans."""
+    mark(times, 'written')
+    observe_stages(times, CONSUMER_STAGES)
+    if span_exporter is not None:
+        span_exporter.export(request_id, times)
 
-        image_data = base64.b64decode(encoded_image)
-        image = Image.open(io.BytesIO(image_data))
+def open_image(image_data, properties):
+    """Open the decoded image bytes; callers bind the request id first so a bad image can still be marked FAILED."""
+    image = Image.open(io.BytesIO(image_data))
+    image_hash = (properties.headers or {}).get('x-content-hash') or hashlib.sha256(image_data).hexdigest()
+    return image, image_hash
 
-        results = classifier.predict(image, topk=1)
-        label = results[0][0]
-        confidence = results[0][1]  
-        db_manager.execute_query(
-            "UPDATE classification_requests SET status = %s, label = %s, confidence = %s WHERE id = %s",
-            ('PROCESSED', label, confidence, request_id)
+def requested_topk(properties):
+    """Number of predictions an RPC caller asked for in the x-topk header (1 for normal requests)."""
+    topk = int((properties.headers or {}).get('x-topk', 1))
+    return max(1, min(topk, MAX_TOPK))
+
+def send_reply(ch, properties, request_id, results):
+    """Answer a direct reply-to request straight away, ahead of the database write."""
+    reply = {
+        'id': request_id,
+        'status': 'PROCESSED',
+        'label': results[0][0],
+        'confidence': results[0][1],
+        'topk': [{'label': label, 'confidence': confidence} for label, confidence in results]
+    }
+    try:
+        ch.basic_publish(
+            exchange='',
+            routing_key=properties.reply_to,
+            body=json.dumps(reply),
+            properties=pika.BasicProperties(correlation_id=properties.correlation_id, content_type='application/json')
         )
-        
+    except Exception as e:
+        # The caller falls back to polling when no reply arrives
+        logging.warning(f"Failed to send reply for request ID {request_id}: {e}")
+
+def record_result(ch, method, properties, body, request_id, results, image_hash, times):
+    """Reply to RPC callers and queue the top result for write-back; the delivery is acked only once the write commits."""
+    label = results[0][0]
+    confidence = results[0][1]
+    if properties.reply_to:
+        send_reply(ch, properties, request_id, results)
+
+    def on_commit():
         logging.info(f"Processed request ID {request_id} with label {label}")
+        MESSAGES_PROCESSED.inc()
         ch.basic_ack(delivery_tag=method.delivery_tag)
-        
-    except Exception as e:
-        logging.error(f"Failed to process message: {e}")
-        retry_count += 1
-        # Requeue the message with new retry count if less than 3
-        if retry_count < 3:
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-            ch.basic_publish(
-                exchange='',
-                routing_key=rabbitmq_queue,
-                body=body,
-                properties=pika.BasicProperties(
-                    headers={'x-retry-count': retry_count}
-                )
+        finish_trace(request_id, times)
+
+    def on_error(error):
+        handle_failure(ch, method, properties, body, request_id, error)
+
+    result_writer.add(request_id, 'PROCESSED', label, confidence, image_hash=image_hash, on_commit=on_commit, on_error=on_error, stage_times=times)
+
+def handle_failure(ch, method, properties, body, request_id, error):
+    logging.error(f"Failed to process message: {error}")
+    headers = dict(properties.headers or {})
+    retry_count = int(headers.get('x-retry-count', 0)) + 1
+    # Requeue the message with new retry count if less than 3
+    if retry_count < 3:
+        headers['x-retry-count'] = retry_count
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        ch.basic_publish(
+            exchange='',
+            routing_key=rabbitmq_queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=properties.content_type,
+                delivery_mode=properties.delivery_mode,
+                message_id=properties.message_id,
+                reply_to=properties.reply_to,
+                correlation_id=properties.correlation_id,
+                headers=headers
             )
-        else:
-            # After 3 failed attempts, Mark status as failed, label request as 'unknown' and discard the message
+        )
+    else:
+        # After 3 failed attempts, Mark status as failed, label request as 'unknown' and discard the message
+        if request_id is None:
+            request_id = envelope_request_id(properties)
+        if request_id is not None:
             db_manager.execute_query(
-                "UPDATE classification_requests SET status = %s, label = %s, confidence = %s WHERE id = %s",
+                with_notify(FAIL_REQUEST_QUERY, RESULTS_NOTIFY_CHANNEL) if notify_results else FAIL_REQUEST_QUERY,
                 ('FAILED', 'unknown', 0, request_id)
             )
-            logging.warning(f"Request ID {request_id} discarded after 3 attempts.")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        logging.warning(f"Request ID {request_id} discarded after 3 attempts.")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+def track_delivery(method):
+    if method.redelivered:
+        REDELIVERIES.inc()
+
+def callback(ch, method, properties, body):
+    track_delivery(method)
+    times = mark(read_stage_times(properties), 'dequeued')
+    request_id = None
+    try:
+        request_id, image_data = decode_message(body, properties)
+        image, image_hash = open_image(image_data, properties)
+        mark(times, 'decoded')
 
+        results = classifier.predict(image, topk=requested_topk(properties))
+        mark(times, 'inferred')
+        record_first_inference()
+        record_result(ch, method, properties, body, request_id, results, image_hash, times)
+        
+    except Exception as e:
+        handle_failure(ch, method, properties, body, request_id, e)
 
-def start_consuming():
+def process_batch(ch, deliveries):
+    """Decode a batch of deliveries, classify them in one forward pass and queue each result for write-back."""
+    decoded = []
+    for method, properties, body, times in deliveries:
+        request_id = None
+        try:
+            request_id, image_data = decode_message(body, properties)
+            image, image_hash = open_image(image_data, properties)
+            decoded.append((method, properties, body, request_id, image, image_hash, mark(times, 'decoded')))
+        except Exception as e:
+            handle_failure(ch, method, properties, body, request_id, e)
+    if not decoded:
+        return
+
+    try:
+        topk = max(requested_topk(item[1]) for item in decoded)
+        batch_results = classifier.predict_batch([item[4] for item in decoded], topk=topk)
+        record_first_inference()
+    except Exception as e:
+        for method, properties, body, request_id, _, _, _ in decoded:
+            handle_failure(ch, method, properties, body, request_id, e)
+        return
+
+    inferred_at = time.time()
+    for (method, properties, body, request_id, _, image_hash, times), results in zip(decoded, batch_results):
+        try:
+            mark(times, 'inferred', inferred_at)
+            record_result(ch, method, properties, body, request_id, results[:requested_topk(properties)], image_hash, times)
+        except Exception as e:
+            handle_failure(ch, method, properties, body, request_id, e)
+    logging.info(f"Processed batch of {len(decoded)} messages")
+
+class MessageBatcher:
+    """Collects deliveries until the batch is full or the oldest message has waited max_wait seconds."""
+    def __init__(self, connection, channel, max_size, max_wait):
+        self.connection = connection
+        self.channel = channel
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.pending = []
+        self.timer = None
+
+    def on_message(self, ch, method, properties, body):
+        track_delivery(method)
+        self.pending.append((method, properties, body, mark(read_stage_times(properties), 'dequeued')))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.connection.call_later(self.max_wait, self._on_timeout)
+
+    def _on_timeout(self):
+        self.timer = None
+        self.flush()
+
+    def flush(self):
+        if self.timer is not None:
+            self.connection.remove_timeout(self.timer)
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            process_batch(self.channel, batch)
+
+class PipelineItem:
+    __slots__ = ('connection', 'channel', 'method', 'properties', 'body', 'request_id', 'image_hash', 'prepared', 'results', 'inferred_at', 'times')
+
+    def __init__(self, connection, channel, method, properties, body):
+        self.connection = connection
+        self.channel = channel
+        self.method = method
+        self.properties = properties
+        self.body = body
+        self.request_id = None
+        self.image_hash = None
+        self.prepared = None
+        self.results = None
+        self.inferred_at = None
+        self.times = mark(read_stage_times(properties), 'dequeued')
+
+class StagedConsumer:
+    """Runs fetch -> decode/preprocess -> inference -> persist+ack as concurrent stages joined by bounded queues.
+
+    The pika I/O thread only enqueues deliveries. A pool of decode threads parses and preprocesses them,
+    one inference thread batches the prepared images through the model, and one persist thread feeds the
+    ResultWriter. Everything that touches the channel (acks, replies, failure handling) is handed back to
+    the I/O thread with add_callback_threadsafe. The broker never has more than prefetch_count unacked
+    deliveries out, so each queue is sized to prefetch_count and the I/O thread never blocks on a put.
+    Since the I/O loop never runs inference it keeps answering heartbeats however slow a batch is.
+
+    Each item remembers the connection and channel it arrived on. After a reconnect, items from the old
+    channel are dropped before inference where possible; the broker redelivers them anyway, and their
+    delivery tags are meaningless on the new channel.
+    """
+    def __init__(self, writer, prefetch_count, decode_workers, batch_size, batch_timeout, write_max_age):
+        self.connection = None
+        self.writer = writer
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.write_max_age = write_max_age
+        self.queues = {stage: queue.Queue(maxsize=prefetch_count) for stage in ('decode', 'inference', 'persist')}
+        self.threads = [threading.Thread(target=self._decode_loop, name=f"decode-{i}", daemon=True) for i in range(decode_workers)]
+        self.threads.append(threading.Thread(target=self._inference_loop, name='inference', daemon=True))
+        self.threads.append(threading.Thread(target=self._persist_loop, name='persist', daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def attach(self, connection):
+        """Use this connection for new deliveries; called again after every reconnect."""
+        self.connection = connection
+
+    def _put(self, stage, item):
+        self.queues[stage].put(item)
+        STAGE_QUEUE_DEPTH.labels(stage=stage).set(self.queues[stage].qsize())
+
+    def _get(self, stage, timeout=None):
+        item = self.queues[stage].get(timeout=timeout)
+        STAGE_QUEUE_DEPTH.labels(stage=stage).set(self.queues[stage].qsize())
+        return item
+
+    def _on_io_thread(self, item, fn, *args, **kwargs):
+        try:
+            item.connection.add_callback_threadsafe(functools.partial(fn, *args, **kwargs))
+        except Exception as e:
+            # The connection is gone; the broker redelivers every unacked message
+            logging.error(f"Could not hand {getattr(fn, '__name__', fn)} to the RabbitMQ I/O thread: {e}")
+
+    def _fail(self, item, error):
+        self._on_io_thread(item, handle_failure, item.channel, item.method, item.properties, item.body, item.request_id, error)
+
+    def _stale(self, item):
+        return not item.channel.is_open
+
+    def on_message(self, ch, method, properties, body):
+        track_delivery(method)
+        try:
+            self.queues['decode'].put_nowait(PipelineItem(self.connection, ch, method, properties, body))
+        except queue.Full:
+            logging.warning("Decode queue is full, requeueing delivery; PREFETCH_COUNT exceeds the queue size")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        STAGE_QUEUE_DEPTH.labels(stage='decode').set(self.queues['decode'].qsize())
+
+    def _decode_loop(self):
+        while True:
+            item = self._get('decode')
+            if self._stale(item):
+                continue
+            start = time.perf_counter()
+            try:
+                item.request_id, image_data = decode_message(item.body, item.properties)
+                image, item.image_hash = open_image(image_data, item.properties)
+                item.prepared = classifier.prepare(image)
+            except Exception as e:
+                self._fail(item, e)
+                continue
+            mark(item.times, 'decoded')
+            STAGE_SECONDS.labels(stage='decode').observe(time.perf_counter() - start)
+            self._put('inference', item)
+
+    def _inference_loop(self):
+        while True:
+            batch = [self._get('inference')]
+            deadline = time.monotonic() + self.batch_timeout
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._get('inference', timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            batch = [item for item in batch if not self._stale(item)]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                topk = max(requested_topk(item.properties) for item in batch)
+                batch_results = classifier.predict_prepared([item.prepared for item in batch], topk=topk)
+            except Exception as e:
+                for item in batch:
+                    self._fail(item, e)
+                continue
+            STAGE_SECONDS.labels(stage='inference').observe(time.perf_counter() - start)
+            record_first_inference()
+            inferred_at = time.perf_counter()
+            inferred_time = time.time()
+            for item, results in zip(batch, batch_results):
+                item.prepared = None
+                item.results = results[:requested_topk(item.properties)]
+                item.inferred_at = inferred_at
+                mark(item.times, 'inferred', inferred_time)
+                self._put('persist', item)
+
+    def _persist_loop(self):
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._get('persist', timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                self._persist(item)
+                if not self.writer.pending:
+                    deadline = None
+                elif deadline is None:
+                    deadline = time.monotonic() + self.write_max_age
+            if deadline is not None and time.monotonic() >= deadline:
+                deadline = None
+                self.writer.flush()
+
+    def _persist(self, item):
+        label, confidence = item.results[0]
+        if item.properties.reply_to:
+            self._on_io_thread(item, send_reply, item.channel, item.properties, item.request_id, item.results)
+
+        def on_commit():
+            STAGE_SECONDS.labels(stage='persist').observe(time.perf_counter() - item.inferred_at)
+            MESSAGES_PROCESSED.inc()
+            self._on_io_thread(item, item.channel.basic_ack, delivery_tag=item.method.delivery_tag)
+            finish_trace(item.request_id, item.times)
+
+        def on_error(error):
+            self._fail(item, error)
+
+        self.writer.add(item.request_id, 'PROCESSED', label, confidence, image_hash=item.image_hash, on_commit=on_commit, on_error=on_error,
+                        stage_times=item.times)
+
+def consume(staged=None, on_ready=None):
+    """Consume on a fresh connection until it is lost; all deliveries still unacked then go back to the queue."""
+    global result_writer
     rabbitmq_manager.connect()
     channel = rabbitmq_manager.get_channel()
-    channel.basic_consume(queue=rabbitmq_queue, on_message_callback=callback)
-    
+    if staged is not None:
+        channel.basic_qos(prefetch_count=prefetch_count)
+        staged.attach(rabbitmq_manager.connection)
+        channel.basic_consume(queue=rabbitmq_queue, on_message_callback=staged.on_message)
+        logging.info(f"Pipelined consumer with {decode_workers} decode threads, batches of up to {batch_size} and prefetch {prefetch_count}")
+    else:
+        # Results buffered for a lost connection are dropped with it; their messages are redelivered
+        result_writer = ResultWriter(db_manager, max_size=write_batch_size, max_age=write_batch_max_age_ms / 1000.0, scheduler=rabbitmq_manager.connection,
+                                     notify_channel=RESULTS_NOTIFY_CHANNEL if notify_results else None, store_stage_times=store_stage_times)
+        if consumer_mode == 'batch':
+            channel.basic_qos(prefetch_count=prefetch_count)
+            batcher = MessageBatcher(rabbitmq_manager.connection, channel, batch_size, batch_timeout_ms / 1000.0)
+            channel.basic_consume(queue=rabbitmq_queue, on_message_callback=batcher.on_message)
+            logging.info(f"Batching up to {batch_size} messages or {batch_timeout_ms} ms with prefetch {prefetch_count}")
+        else:
+            channel.basic_consume(queue=rabbitmq_queue, on_message_callback=callback)
+
     logging.info("Starting to consume messages...")
+    if on_ready is not None:
+        on_ready()
     channel.start_consuming()
 
+def prepare_schema():
+    """Bring a database created by an older release up to date; stage times are only stored once their column exists."""
+    global store_stage_times
+    upgrade_schema(db_manager)
+    if store_stage_times and not has_column(db_manager, 'classification_requests', 'stage_times'):
+        logging.warning("classification_requests has no stage_times column; not storing stage times")
+        store_stage_times = False
+
+def start_consuming(on_ready=None):
+    """Consume until the process stops, reconnecting to RabbitMQ; on_ready is called once the consumer is registered."""
+    global span_exporter
+    db_manager.connect()
+    prepare_schema()
+    span_exporter = create_span_exporter('worker-app')
+    staged = None
+    if consumer_mode == 'pipeline':
+        writer = ResultWriter(db_manager, max_size=write_batch_size, max_age=write_batch_max_age_ms / 1000.0,
+                              notify_channel=RESULTS_NOTIFY_CHANNEL if notify_results else None, store_stage_times=store_stage_times)
+        # The stage threads outlive reconnects; consume() attaches each new connection to them
+        staged = StagedConsumer(writer, prefetch_count, decode_workers, batch_size, batch_timeout_ms / 1000.0, write_batch_max_age_ms / 1000.0)
+        staged.start()
+    while True:
+        try:
+            consume(staged, on_ready)
+        except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+            CONNECTION_DROPS.inc()
+            logging.warning(f"Lost the RabbitMQ connection while consuming: {e!r}; reconnecting in {reconnect_delay}s")
+            rabbitmq_manager.close_quietly()
+            time.sleep(reconnect_delay)
+
 def main():
-    # Start the Prometheus metrics server in a separate thread
-    threading.Thread(target=start_metrics_server).start()
+    global supervisor
+    if worker_processes > 1:
+        # The parent never starts a thread, so forking (and re-forking) the inference processes is safe.
+        # The HTTP endpoints run in a child process of their own, forked before the model is loaded so
+        # /health and /metrics answer during the load; /ready waits for every inference process.
+        threads = threads_per_process(worker_processes)
+        supervisor = WorkerSupervisor(start_consuming, worker_processes, threads, server=serve_http)
+        if 'PROMETHEUS_MULTIPROC_DIR' not in environ:
+            logging.warning("PROMETHEUS_MULTIPROC_DIR is not set; /metrics only shows the HTTP server process")
+        supervisor.start_server()
+        # Load once in the parent; the forked children inherit the warmed-up model and only run the consumer
+        prepare_parent()
+        load_classifier()
+        supervisor.start()
+        supervisor.monitor()
+        return
 
-    # Start the Flask app in a separate thread
-    threading.Thread(target=start_flask_app).start()
+    # Serve /health, /ready and /metrics while the model is still loading
+    threading.Thread(target=start_metrics_server, daemon=True).start()
+    threading.Thread(target=start_flask_app, daemon=True).start()
 
-    # Start RabbitMQ consumer in the main thread
-    start_consuming()
+    load_classifier()
+    # Start RabbitMQ consumer in the main thread; /ready follows once it is consuming
+    start_consuming(on_ready=consuming.set)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,38 @@
+import io
+from PIL import Image
+from constants import ALLOWED_EXTENSIONS, MAX_UPLOAD_BYTES, MAX_IMAGE_PIXELS
+
+# PIL raises DecompressionBombError above twice this limit, even for lazily opened images
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """Read an uploaded file, refusing to buffer more than max_bytes."""
+    data = file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image exceeds the maximum upload size of {max_bytes} bytes")
+    if not data:
+        raise ValueError("Empty image upload")
+    return data
+
+def validate_image(data, mode='header', max_pixels=MAX_IMAGE_PIXELS):
+    """Validate raw image bytes and return (image_bytes, content_type).
+
+    In 'header' mode only the image header is parsed and the original buffer is returned unchanged.
+    The 'full' mode decodes and re-encodes the image, which is the behaviour before header validation existed.
+    """
+    image = Image.open(io.BytesIO(data))  # Lazy open, only the header is read
+    if image.format is None or image.format.lower() not in ALLOWED_EXTENSIONS:
+        raise ValueError(f"Invalid image format: {image.format}")
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ValueError(f"Image has {width * height} pixels, the limit is {max_pixels}")
+    content_type = Image.MIME.get(image.format, 'application/octet-stream')
+
+    if mode == 'full':
+        image.load()
+        image_bytes = io.BytesIO()
+        image.save(image_bytes, format=image.format)
+        return image_bytes.getvalue(), content_type
+
+    image.verify()
+    return data, content_type
@@ -0,0 +1,48 @@
+import json
+import base64
+import pika
+from constants import MESSAGE_SCHEMA_VERSION
+
+def message_headers(request_id, headers=None):
+    """Return the AMQP headers carrying the request id and schema version."""
+    combined = dict(headers or {})
+    combined['x-request-id'] = request_id
+    combined['x-schema-version'] = MESSAGE_SCHEMA_VERSION
+    return combined
+
+def encode_message(request_id, image_bytes, content_type, headers=None):
+    """Build the AMQP body and properties for a classification request.
+
+    The raw image bytes are the body; the request id and schema version travel as headers.
+    """
+    properties = pika.BasicProperties(
+        content_type=content_type,
+        delivery_mode=2,  # Make message persistent
+        message_id=str(request_id),
+        headers=message_headers(request_id, headers)
+    )
+    return image_bytes, properties
+
+def encode_legacy_message(request_id, image_bytes):
+    """Build a version 1 (base64-in-JSON) body, kept for benchmarks and rollback."""
+    return json.dumps({'id': request_id, 'image': base64.b64encode(image_bytes).decode('utf-8')})
+
+def decode_message(body, properties):
+    """Return (request_id, image_bytes) from either a binary envelope or a legacy JSON message."""
+    headers = (properties.headers if properties is not None else None) or {}
+    version = headers.get('x-schema-version')
+    if version is None:
+        message = json.loads(body)
+        return message['id'], base64.b64decode(message['image'])
+    if int(version) > MESSAGE_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported message schema version: {version}")
+    return int(headers['x-request-id']), body
+
+def envelope_request_id(properties):
+    """Request id from the headers or message id alone, for messages whose body could not be decoded."""
+    headers = (properties.headers if properties is not None else None) or {}
+    request_id = headers.get('x-request-id', properties.message_id if properties is not None else None)
+    try:
+        return int(request_id)
+    except (TypeError, ValueError):
+        return None
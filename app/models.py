@@ -1,14 +1,29 @@
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 db = SQLAlchemy()
 
 class ClassificationRequest(db.Model):
     __tablename__ = 'classification_requests'
+    __table_args__ = (
+        # Keyset pagination on /results walks ("createdAt", id) in either direction, optionally within one status
+        db.Index('ix_classification_requests_created_at_id', 'createdAt', 'id'),
+        db.Index('ix_classification_requests_status_created_at_id', 'status', 'createdAt', 'id'),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     status: Mapped[str] = mapped_column(nullable=False)
     label: Mapped[str] = mapped_column(nullable=True)  # Make label nullable
     confidence: Mapped[float] = mapped_column(nullable=True)  # Add confidence column
     createdAt: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
     updated: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # Epoch seconds at which the request reached each pipeline stage, written by the consumer when STORE_STAGE_TIMES is on
+    stage_times: Mapped[dict] = mapped_column(JSONB, nullable=True)
+
+class ImageResult(db.Model):
+    __tablename__ = 'image_results'
+    hash: Mapped[str] = mapped_column(primary_key=True)  # sha256 hex digest of the image bytes
+    label: Mapped[str] = mapped_column(nullable=False)
+    confidence: Mapped[float] = mapped_column(nullable=False)
+    createdAt: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
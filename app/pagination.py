@@ -0,0 +1,93 @@
+import json
+import base64
+from datetime import datetime
+from queryArgs import parse_number, parse_request_id
+
+MAX_PAGE_SIZE = 100
+REQUEST_STATUSES = {'PENDING', 'PROCESSED', 'FAILED'}
+
+def encode_cursor(row):
+    """Opaque cursor pointing at a row's ("createdAt", id) key; clients should pass it back unchanged."""
+    key = {'createdAt': row['createdAt'].isoformat(), 'id': row['id']}
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Return the (createdAt, id) key held by a cursor; raises ValueError for anything encode_cursor did not produce."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        created_at = datetime.fromisoformat(key['createdAt'])
+        if created_at.tzinfo is not None:
+            raise ValueError("createdAt is stored without a time zone")
+        return created_at, parse_request_id(key['id'])
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def parse_page_args(args):
+    """Read and validate the /results listing query arguments."""
+    limit = parse_number(args, 'limit', 10, 1, MAX_PAGE_SIZE, cast=int)
+    order = 'asc' if args.get('order', 'desc').lower() == 'asc' else 'desc'
+    direction = 'prev' if args.get('direction', 'next').lower() == 'prev' else 'next'
+    status = args.get('status')
+    if status:
+        status = status.upper()
+        if status not in REQUEST_STATUSES:
+            raise ValueError(f"Invalid status filter: {status}")
+    cursor = args.get('cursor')
+    cursor_key = decode_cursor(cursor) if cursor else None
+    return {'limit': limit, 'order': order, 'direction': direction, 'status': status or None, 'cursor_key': cursor_key}
+
+def build_page_query(limit, order, direction, status=None, cursor_key=None, paramstyle='format'):
+    """Build a keyset query for one page of classification_requests.
+
+    Rows are ordered by ("createdAt", id) rather than id alone: producers hand out ids in per-pod blocks,
+    so ids are unique but not in creation order. Reading past the cursor with a row comparison is one
+    index range scan regardless of page depth. A 'prev' page is read in the opposite order and reversed
+    by build_page. One extra row is fetched to detect whether another page exists. paramstyle is
+    'format' (psycopg2) or 'numeric' (asyncpg).
+    """
+    params = []
+
+    def placeholder(value):
+        params.append(value)
+        return '%s' if paramstyle == 'format' else f'${len(params)}'
+
+    forward = direction == 'next'
+    ascending = (order == 'asc') == forward
+    conditions = []
+    if status:
+        conditions.append(f"status = {placeholder(status)}")
+    if cursor_key is not None:
+        created_at, request_id = cursor_key
+        conditions.append(f"(\"createdAt\", id) {'>' if ascending else '<'} ({placeholder(created_at)}, {placeholder(request_id)})")
+
+    sort = 'ASC' if ascending else 'DESC'
+    query = 'SELECT id, status, label, "createdAt"\nFROM classification_requests'
+    if conditions:
+        query += '\nWHERE ' + ' AND '.join(conditions)
+    query += f"\nORDER BY \"createdAt\" {sort}, id {sort}\nLIMIT {placeholder(limit + 1)}"
+    return query, params
+
+def build_page(rows, limit, order, direction, status=None, cursor_key=None):
+    """Turn (id, status, label, createdAt) rows from build_page_query into a page with next/prev cursors."""
+    has_extra = len(rows) > limit
+    rows = list(rows[:limit])
+    if direction == 'prev':
+        rows.reverse()
+    data = [{'id': row[0], 'status': row[1], 'label': row[2], 'createdAt': row[3]} for row in rows]
+
+    if direction == 'next':
+        has_next, has_prev = has_extra, cursor_key is not None
+    else:
+        has_next, has_prev = cursor_key is not None, has_extra
+
+    return {
+        'data': data,
+        'limit': limit,
+        'order': order,
+        'status': status,
+        'direction': direction,
+        'has_more': has_next,
+        'next_cursor': encode_cursor(data[-1]) if data and has_next else None,
+        'prev_cursor': encode_cursor(data[0]) if data and has_prev else None
+    }
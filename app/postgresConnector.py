@@ -1,10 +1,21 @@
 import psycopg2
 from psycopg2 import OperationalError, InterfaceError, DatabaseError, Error, sql
-from time import sleep
+from psycopg2.extras import execute_values
+from time import sleep, time
+from contextlib import contextmanager
+from prometheus_client import Gauge, Histogram, REGISTRY
+import queue
+import threading
 import logging
 
+POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time spent waiting to check out a PostgreSQL connection', ['database'], registry=REGISTRY)
+POOL_IN_USE = Gauge('db_pool_connections_in_use', 'PostgreSQL connections currently checked out', ['database'], registry=REGISTRY)
+POOL_OPEN = Gauge('db_pool_connections_open', 'PostgreSQL connections currently open', ['database'], registry=REGISTRY)
+
 class PostgresConnectionManager:
-    def __init__(self, host, port, user, password, database=None, max_retries=5, retry_delay=2):
+    def __init__(self, host, port, user, password, database=None, max_retries=5, retry_delay=2,
+                 min_pool_size=1, max_pool_size=1, checkout_timeout=30, health_check_on_borrow=True,
+                 health_check_interval=30):
         self.host = host
         self.port = port
         self.database = database
@@ -12,7 +23,18 @@ class PostgresConnectionManager:
         self.password = password
         self.max_retries = max_retries
         self.retry_delay = retry_delay
-        self.connection = None
+        self.min_pool_size = min(min_pool_size, max_pool_size)
+        self.max_pool_size = max_pool_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_on_borrow = health_check_on_borrow
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()  # (connection, time it was returned to the pool)
+        self._slots = threading.BoundedSemaphore(max_pool_size)
+        self._lock = threading.Lock()
+        self._open_count = 0
+        self._last_error_at = 0.0
+        self._bootstrapped = False
+        self._closed = False
 
     def _create_db_if_not_exists(self):
         # Connect to the default 'postgres' database to check if the target DB exists
@@ -59,28 +81,20 @@ class PostgresConnectionManager:
         logging.error("Exceeded maximum retries, could not connect to 'postgres' database")
         raise ConnectionError("Could not connect to default database after multiple attempts.")
 
-    def connect(self, database=None):
+    def _open_connection(self):
         retries = 0
-        if self.database is None and database is None:
-            raise ValueError("Database name must be provided.")
-        if database:
-            self.database = database
-
-        # Ensure the database exists
-        self._create_db_if_not_exists()
-
         while retries < self.max_retries:
             try:
-                self.connection = psycopg2.connect(
+                conn = psycopg2.connect(
                     host=self.host,
                     port=self.port,
                     user=self.user,
                     password=self.password,
                     database=self.database
                 )
-                self.connection.autocommit = True
+                conn.autocommit = True
                 logging.info(f"Successfully connected to PostgreSQL database '{self.database}'")
-                return self.connection
+                return conn
             except (OperationalError, InterfaceError) as e:
                 retries += 1
                 logging.warning(f"Connection attempt {retries} to '{self.database}' failed: {e}")
@@ -91,42 +105,185 @@ class PostgresConnectionManager:
         logging.error(f"Exceeded maximum retries, could not connect to database '{self.database}'")
         raise ConnectionError(f"Could not connect to PostgreSQL database '{self.database}' after multiple attempts.")
 
-    def get_connection(self):
-        """Get the active connection or reconnect if necessary."""
-        if not self.connection or self.connection.closed:
-            logging.info("No active connection. Attempting to connect/reconnect.")
-            self.connect()
-        return self.connection
+    def connect(self, database=None):
+        """Create the database if needed (once per manager) and open the minimum number of pooled connections."""
+        if self.database is None and database is None:
+            raise ValueError("Database name must be provided.")
+        if database:
+            self.database = database
+
+        with self._lock:
+            if not self._bootstrapped:
+                # Ensure the database exists
+                self._create_db_if_not_exists()
+                self._bootstrapped = True
+
+        # Each pre-opened connection is opened under a pool slot, so together with the connections already
+        # checked out the pool never goes over max_pool_size
+        while self._open_count < self.min_pool_size and self._slots.acquire(blocking=False):
+            try:
+                conn = self._open_connection()
+                self._track_open(1)
+                self._idle.put((conn, time()))
+            finally:
+                self._slots.release()
+
+    def open_dedicated_connection(self):
+        """Open an autocommit connection outside the pool, e.g. for a long-lived LISTEN."""
+        return self._open_connection()
+
+    def _track_open(self, delta):
+        with self._lock:
+            self._open_count += delta
+            POOL_OPEN.labels(database=self.database).set(self._open_count)
 
-    def execute_query(self, query, params=None):
-        conn = self.get_connection()
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Error as e:
+            logging.warning(f"Error closing PostgreSQL connection: {e}")
+        self._track_open(-1)
+
+    def _is_healthy(self, conn, released_at):
+        """Check a connection before lending it out.
+
+        Only connections that sat idle for health_check_interval seconds, or were returned before the last
+        connection error, get a SELECT 1; a recently used connection is lent out without the extra round trip.
+        """
+        if conn.closed:
+            return False
+        if not self.health_check_on_borrow:
+            return True
+        if time() - released_at < self.health_check_interval and released_at > self._last_error_at:
+            return True
         try:
             with conn.cursor() as cursor:
-                cursor.execute(query, params)
-                # Commit for non-SELECT queries
-                if not query.strip().upper().startswith("SELECT"):
+                cursor.execute("SELECT 1")
+            return True
+        except Error as e:
+            logging.warning(f"Discarding unhealthy pooled connection: {e}")
+            self._last_error_at = time()
+            return False
+
+    def acquire(self):
+        """Borrow a connection from the pool, waiting at most checkout_timeout seconds for a free slot."""
+        if self.database is None:
+            raise ValueError("Database name must be provided.")
+        start = time()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise TimeoutError(f"Timed out after {self.checkout_timeout}s waiting for a PostgreSQL connection")
+        POOL_WAIT.labels(database=self.database).observe(time() - start)
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn, released_at = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open_connection()
+                    self._track_open(1)
+                    break
+                if not self._is_healthy(conn, released_at):
+                    self._close_quietly(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+        POOL_IN_USE.labels(database=self.database).inc()
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection to the pool, closing it instead if it is broken."""
+        try:
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.put((conn, time()))
+        finally:
+            POOL_IN_USE.labels(database=self.database).dec()
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out of the pool and always returns it."""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (OperationalError, InterfaceError):
+            broken = True
+            # Other idle connections may have been cut off too; check them all on their next borrow
+            self._last_error_at = time()
+            raise
+        except Error:
+            if not conn.closed:
+                conn.rollback()  # Rollback in case of error
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    def execute_query(self, query, params=None, retry=None):
+        """Run one statement and return its rows, or None for statements that return no rows.
+
+        After a connection error the statement is run again on a fresh connection only if retry is true.
+        It defaults to true for SELECTs alone: a write may have been applied before the connection dropped,
+        so callers pass retry=True only for writes that are safe to apply twice.
+        """
+        if retry is None:
+            retry = query.lstrip().upper().startswith("SELECT")
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    # Anything that returns rows (SELECT, ... RETURNING, WITH ... SELECT) has a description
+                    rows = cursor.fetchall() if cursor.description is not None else None
                     conn.commit()
-                # Return results for SELECT queries
-                if query.strip().upper().startswith("SELECT"):
-                    return cursor.fetchall()
+                    return rows
         except (OperationalError, InterfaceError) as e:
-            logging.warning(f"Connection error during query execution: {e}. Reconnecting.")
-            self.connect()  # Attempt to reconnect and retry
-            return self.execute_query(query, params)
+            if not retry:
+                raise e
+            logging.warning(f"Connection error during query execution: {e}. Retrying on a fresh connection.")
+            return self.execute_query(query, params, retry=False)
         except Error as e:
             logging.error(f"Database error: {e}")
-            conn.rollback()  # Rollback in case of error
             raise e
 
+    def execute_values(self, query, rows, template=None, page_size=1000, fetch=False):
+        """Run a multi-row statement (e.g. INSERT ... VALUES %s) over rows in a single transaction.
+
+        Pooled connections are in autocommit mode, where every page of page_size rows would commit on its
+        own; autocommit is switched off for the call so a failure on any page rolls back all of them.
+        """
+        with self.connection() as conn:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cursor:
+                    result = execute_values(cursor, query, rows, template=template, page_size=page_size, fetch=fetch)
+                conn.commit()
+                return result
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                if not conn.closed:
+                    conn.autocommit = True
+
     def close(self):
-        """Close the PostgreSQL connection if it is active."""
-        if self.connection and not self.connection.closed:
+        """Close every idle pooled connection; connections still checked out are closed when released."""
+        self._closed = True
+        while True:
             try:
-                self.connection.close()
-                logging.info("PostgreSQL connection closed.")
-            except Error as e:
-                logging.error(f"Error closing PostgreSQL connection: {e}")
-                raise e
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not conn.closed:
+                try:
+                    conn.close()
+                    logging.info("PostgreSQL connection closed.")
+                except Error as e:
+                    logging.error(f"Error closing PostgreSQL connection: {e}")
+                    raise e
+            self._track_open(-1)
 
     def __enter__(self):
         """Enter context management and establish the connection."""
@@ -0,0 +1,112 @@
+import threading
+import numpy as np
+import torch
+from PIL import Image
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Modes that resize correctly as-is; everything else is converted to one of these first
+RESIZABLE_MODES = {'RGB', 'RGBA', 'L', 'LA'}
+
+def normalize_mode(image):
+    """Convert palette, 16-bit, float and CMYK images to RGB/RGBA/L/LA, keeping transparency as an alpha channel."""
+    if image.mode in RESIZABLE_MODES:
+        return image
+    if image.mode in ('P', 'PA'):
+        return image.convert('RGBA' if image.mode == 'PA' or 'transparency' in image.info else 'RGB')
+    if image.mode in ('I', 'I;16', 'I;16B', 'I;16L', 'F'):
+        # 16-bit and float greyscale: scale down to 8 bits instead of letting convert() clip
+        high = 255.0 if image.mode == 'F' else 65535.0
+        return image.convert('F').point(lambda value: value * (255.0 / high)).convert('L')
+    return image.convert('RGB')
+
+def flatten_to_rgb(image, background=(255, 255, 255)):
+    """Composite any alpha channel onto a solid background and return an RGB image."""
+    if image.mode in ('RGBA', 'LA'):
+        flat = Image.new('RGB', image.size, background)
+        flat.paste(image.convert('RGBA'), mask=image.getchannel('A'))
+        return flat
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+class ImagePreprocessor:
+    """Decode-to-tensor pipeline equivalent to Resize(resize_size) + CenterCrop(crop_size) + ToTensor + Normalize.
+
+    JPEGs are decoded with DCT scaling (Image.draft) to the smallest size whose short side is still at least
+    resize_size. The centre crop is taken in source coordinates and resized in a single PIL pass, and the
+    pixels of a whole batch are scaled and normalized into a preallocated float buffer in place.
+
+    The buffers are per thread and reused: a batch returned by to_tensor() or from_pixels() is only valid
+    until the same thread calls either of them again.
+
+    Non-JPEG inputs, and JPEGs too small to be drafted, match the torchvision pipeline to within one 8-bit
+    level. Draft decoding is not exact: on a 1920x1080 JPEG the normalized input differs by about 0.015 mean
+    absolute on smooth content and up to about 0.09 on noise-heavy images, because DCT scaling filters out
+    detail that bilinear resampling aliases. Use PREPROCESSING=torchvision where exact parity matters.
+    """
+    def __init__(self, resize_size=256, crop_size=224, mean=IMAGENET_MEAN, std=IMAGENET_STD, channels_last=False):
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+        self.channels_last = channels_last
+        # (pixel / 255 - mean) / std == pixel * scale - offset
+        self.scale = torch.tensor([1.0 / (255.0 * s) for s in std], dtype=torch.float32)
+        self.offset = torch.tensor([m / s for m, s in zip(mean, std)], dtype=torch.float32)
+        self._local = threading.local()
+
+    def load(self, image):
+        """Return the crop_size x crop_size RGB image the model sees, from an opened (not yet loaded) PIL image."""
+        width, height = image.size
+        short_side = min(width, height)
+        if image.format == 'JPEG' and short_side > self.resize_size:
+            target = (width * self.resize_size // short_side, height * self.resize_size // short_side)
+            image.draft('RGB', target)
+            width, height = image.size
+            short_side = min(width, height)
+        if getattr(image, 'is_animated', False):
+            image.seek(0)
+
+        image = normalize_mode(image)
+        image = image.resize((self.crop_size, self.crop_size), Image.BILINEAR, box=self.crop_box(width, height))
+        return flatten_to_rgb(image)
+
+    def crop_box(self, width, height):
+        """Source region that Resize(resize_size) followed by CenterCrop(crop_size) keeps, with torchvision's rounding."""
+        short_side, long_side = min(width, height), max(width, height)
+        resized_long = int(self.resize_size * long_side / short_side)
+        resized_width, resized_height = (self.resize_size, resized_long) if width == short_side else (resized_long, self.resize_size)
+        crop_left = int(round((resized_width - self.crop_size) / 2.0))
+        crop_top = int(round((resized_height - self.crop_size) / 2.0))
+        scale_x = width / resized_width
+        scale_y = height / resized_height
+        return (crop_left * scale_x, crop_top * scale_y,
+                (crop_left + self.crop_size) * scale_x, (crop_top + self.crop_size) * scale_y)
+
+    def _buffers(self, count):
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[0].shape[0] < count:
+            size = self.crop_size
+            pixels = np.empty((count, size, size, 3), dtype=np.uint8)
+            memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+            batch = torch.empty((count, 3, size, size), dtype=torch.float32).contiguous(memory_format=memory_format)
+            buffers = self._local.buffers = (pixels, batch)
+        pixels, batch = buffers
+        return pixels[:count], batch[:count]
+
+    def to_pixels(self, image):
+        """Decode, crop and resize one image into a crop_size x crop_size x 3 uint8 array; safe to call from any thread."""
+        return np.asarray(self.load(image))
+
+    def to_tensor(self, images):
+        """Preprocess a list of opened PIL images into an N x 3 x crop_size x crop_size normalized float batch."""
+        return self.from_pixels([self.to_pixels(image) for image in images])
+
+    def from_pixels(self, pixel_arrays):
+        """Normalize arrays from to_pixels() into the calling thread's reused batch buffer."""
+        pixels, batch = self._buffers(len(pixel_arrays))
+        for index, array in enumerate(pixel_arrays):
+            pixels[index] = array
+        # One vectorized uint8 -> float pass written straight into the batch, then normalized in place
+        nhwc = batch.permute(0, 2, 3, 1)
+        torch.mul(torch.from_numpy(pixels), self.scale, out=nhwc)
+        nhwc.sub_(self.offset)
+        return batch
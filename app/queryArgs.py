@@ -0,0 +1,31 @@
+import math
+
+# classification_requests.id is a PostgreSQL integer
+MAX_REQUEST_ID = 2 ** 31 - 1
+
+def parse_number(args, name, default, minimum, maximum, cast=float):
+    """Read a numeric query argument clamped to [minimum, maximum]; raises ValueError if it is not a number."""
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value!r} is not a number")
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid {name}: {value!r} is not a finite number")
+    return max(minimum, min(number, maximum))
+
+def parse_request_id(value):
+    """Validate a request id from a query argument or cursor; raises ValueError for anything but a valid row id."""
+    try:
+        request_id = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid request id: {value!r}")
+    if not 1 <= request_id <= MAX_REQUEST_ID:
+        raise ValueError(f"Request id out of range: {request_id}")
+    return request_id
+
+def parse_wait(args, max_wait, name='wait'):
+    """Read a wait given in milliseconds and return it in seconds, capped at max_wait."""
+    return parse_number(args, name, 0.0, 0.0, max_wait * 1000.0) / 1000.0
@@ -3,7 +3,7 @@ import logging
 from time import sleep
 
 class RabbitMQConnectionManager:
-    def __init__(self, host, port, queue_name, max_retries=5, retry_delay=2,rabbitmq_username="guest", rabbitmq_password="guest"):
+    def __init__(self, host, port, queue_name, max_retries=5, retry_delay=2,rabbitmq_username="guest", rabbitmq_password="guest", heartbeat=None):
         self.host = host
         self.port = port
         self.queue_name = queue_name
@@ -13,7 +13,8 @@ class RabbitMQConnectionManager:
         self.channel = None
         print('rabbit mq creds: {},{}'.format(rabbitmq_username, rabbitmq_password))
         self.credentials = pika.PlainCredentials(rabbitmq_username, rabbitmq_password)
-        self.parameters = pika.ConnectionParameters(host=self.host, port=self.port, credentials=self.credentials)
+        # heartbeat=None accepts the broker's proposed interval
+        self.parameters = pika.ConnectionParameters(host=self.host, port=self.port, credentials=self.credentials, heartbeat=heartbeat)
 
     def connect(self):
         retries = 0
@@ -40,24 +41,6 @@ class RabbitMQConnectionManager:
             self.connect()
         return self.channel
 
-    def publish_message(self, message):
-        channel = self.get_channel()
-        try:
-            channel.basic_publish(
-                exchange='',
-                routing_key=self.queue_name,
-                body=message,
-                properties=pika.BasicProperties(delivery_mode=2)  # Make message persistent
-            )
-            logging.info(f"Message sent to RabbitMQ: {message}")
-        except pika.exceptions.AMQPConnectionError as e:
-            logging.warning(f"Connection error during message publish: {e}. Reconnecting.")
-            self.connect()
-            self.publish_message(message)
-        except Exception as e:
-            logging.error(f"Failed to publish message to RabbitMQ: {e}")
-            raise e
-
     def close(self):
         if self.connection and not self.connection.is_closed:
             try:
@@ -67,6 +50,16 @@ class RabbitMQConnectionManager:
                 logging.error(f"Error closing RabbitMQ connection: {e}")
                 raise e
 
+    def close_quietly(self):
+        """Close a connection that may already be broken, e.g. before reconnecting."""
+        try:
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+        except Exception as e:
+            logging.debug(f"Ignoring error while closing RabbitMQ connection: {e}")
+        self.connection = None
+        self.channel = None
+
     def __enter__(self):
         self.connect()
         return self
@@ -0,0 +1,293 @@
+import time
+import uuid
+import logging
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import pika
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+
+PUBLISH_LATENCY = Histogram('rabbitmq_publish_latency_seconds', 'Time from a publish request to the broker confirm', registry=REGISTRY)
+CONFIRM_LAG = Histogram('rabbitmq_confirm_lag_seconds', 'Time from basic_publish to the broker confirm', registry=REGISTRY)
+UNCONFIRMED = Gauge('rabbitmq_unconfirmed_messages', 'Published messages still waiting for a broker confirm', registry=REGISTRY)
+RPC_REPLIES = Counter('rabbitmq_rpc_replies', 'Direct reply-to replies received', ['outcome'], registry=REGISTRY)
+RECONNECTS = Counter('rabbitmq_publisher_reconnects', 'Publisher reconnect attempts', registry=REGISTRY)
+
+DIRECT_REPLY_TO = 'amq.rabbitmq.reply-to'
+
+class PendingPublish:
+    def __init__(self, body, properties, routing_key):
+        self.body = body
+        self.properties = properties
+        self.routing_key = routing_key
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+        self.published_at = None
+
+class PublisherConnection(threading.Thread):
+    """Owns one pika SelectConnection and confirm-mode channel on its own I/O thread.
+
+    Other threads hand messages over through submit(); only the I/O thread touches the channel.
+    Broker confirms (including multiple=True batches) resolve the futures returned to callers.
+    """
+    def __init__(self, parameters, queue_name, name, retry_delay=1, max_retry_delay=30, on_reply=None):
+        super().__init__(name=name, daemon=True)
+        self.parameters = parameters
+        self.on_reply = on_reply
+        self.queue_name = queue_name
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.connection = None
+        self.channel = None
+        self.ready = threading.Event()
+        self.outbox = deque()
+        self.lock = threading.Lock()
+        self.unconfirmed = OrderedDict()
+        self.delivery_tag = 0
+        self.attempt = 0
+        self.stopping = False
+
+    def run(self):
+        while not self.stopping:
+            self.connection = pika.SelectConnection(
+                parameters=self.parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed
+            )
+            self.connection.ioloop.start()
+            if self.stopping:
+                break
+            # Bounded exponential backoff between reconnect attempts
+            delay = min(self.retry_delay * (2 ** self.attempt), self.max_retry_delay)
+            self.attempt += 1
+            RECONNECTS.inc()
+            logging.warning(f"{self.name}: reconnecting to RabbitMQ in {delay}s (attempt {self.attempt})")
+            time.sleep(delay)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        logging.warning(f"{self.name}: connection to RabbitMQ failed: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self.ready.clear()
+        self.channel = None
+        self._fail_unconfirmed(ConnectionError(f"RabbitMQ connection closed before confirm: {reason}"))
+        if not self.stopping:
+            logging.warning(f"{self.name}: RabbitMQ connection closed: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(
+            ack_nack_callback=self._on_confirm,
+            callback=lambda _frame: channel.queue_declare(queue=self.queue_name, durable=True, callback=self._on_queue_declared)
+        )
+
+    def _on_queue_declared(self, _frame):
+        if self.on_reply is None:
+            self._on_ready()
+            return
+        # Direct reply-to: replies come back on this channel without a real queue
+        self.channel.basic_consume(
+            queue=DIRECT_REPLY_TO,
+            on_message_callback=self._on_reply_message,
+            auto_ack=True,
+            callback=lambda _frame: self._on_ready()
+        )
+
+    def _on_reply_message(self, channel, method, properties, body):
+        self.on_reply(properties.correlation_id, body)
+
+    def _on_ready(self):
+        self.attempt = 0
+        self.delivery_tag = 0
+        self.ready.set()
+        logging.info(f"{self.name}: publisher connected to RabbitMQ")
+        self._drain()
+
+    def _on_channel_closed(self, channel, reason):
+        self.ready.clear()
+        self.channel = None
+        if not self.stopping:
+            logging.warning(f"{self.name}: RabbitMQ channel closed: {reason}")
+        if self.connection.is_open:
+            self.connection.close()
+
+    def submit(self, pending):
+        with self.lock:
+            self.outbox.append(pending)
+        connection = self.connection
+        if self.ready.is_set() and connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._drain)
+            except Exception:
+                # The outbox is drained again as soon as the channel reopens
+                pass
+
+    def withdraw(self, future):
+        """Take the message behind future back out of the outbox; False if it was already published."""
+        with self.lock:
+            for pending in self.outbox:
+                if pending.future is future:
+                    self.outbox.remove(pending)
+                    return True
+        return False
+
+    def _drain(self):
+        while self.channel is not None and self.channel.is_open:
+            with self.lock:
+                if not self.outbox:
+                    return
+                pending = self.outbox.popleft()
+            try:
+                self.channel.basic_publish(
+                    exchange='',
+                    routing_key=pending.routing_key,
+                    body=pending.body,
+                    properties=pending.properties
+                )
+            except Exception as e:
+                logging.error(f"{self.name}: failed to publish {len(pending.body)} bytes: {e}")
+                pending.future.set_exception(e)
+                continue
+            self.delivery_tag += 1
+            pending.published_at = time.monotonic()
+            self.unconfirmed[self.delivery_tag] = pending
+            UNCONFIRMED.inc()
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = list(itertools.takewhile(lambda tag: tag <= method.delivery_tag, self.unconfirmed))
+        else:
+            tags = [method.delivery_tag]
+        now = time.monotonic()
+        for tag in tags:
+            pending = self.unconfirmed.pop(tag, None)
+            if pending is None:
+                continue
+            UNCONFIRMED.dec()
+            CONFIRM_LAG.observe(now - pending.published_at)
+            PUBLISH_LATENCY.observe(now - pending.submitted_at)
+            if acked:
+                pending.future.set_result(tag)
+            else:
+                pending.future.set_exception(RuntimeError("RabbitMQ rejected the message (basic.nack)"))
+
+    def _fail_unconfirmed(self, error):
+        for pending in self.unconfirmed.values():
+            UNCONFIRMED.dec()
+            pending.future.set_exception(error)
+        self.unconfirmed.clear()
+
+    def stop(self):
+        self.stopping = True
+        connection = self.connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(self._close)
+
+    def _close(self):
+        if self.connection.is_open:
+            self.connection.close()
+        else:
+            self.connection.ioloop.stop()
+
+class RabbitMQPublisher:
+    """Thread-safe publisher backed by a pool of confirm-mode connections, each owned by one I/O thread.
+
+    With enable_rpc the first connection also runs the process's single direct reply-to consumer;
+    publish_rpc() requests are published on it and their replies resolve futures keyed by correlation id.
+    """
+    def __init__(self, host, port, queue_name, rabbitmq_username="guest", rabbitmq_password="guest",
+                 pool_size=1, retry_delay=1, max_retry_delay=30, confirm_timeout=5, enable_rpc=False):
+        self.queue_name = queue_name
+        self.confirm_timeout = confirm_timeout
+        self.replies = {}
+        self.replies_lock = threading.Lock()
+        credentials = pika.PlainCredentials(rabbitmq_username, rabbitmq_password)
+        parameters = pika.ConnectionParameters(host=host, port=port, credentials=credentials)
+        self.connections = [
+            PublisherConnection(parameters, queue_name, f"rabbitmq-publisher-{i}", retry_delay, max_retry_delay,
+                                on_reply=self._on_reply if enable_rpc and i == 0 else None)
+            for i in range(pool_size)
+        ]
+        self.rpc_connection = self.connections[0] if enable_rpc else None
+        self._next = itertools.count()
+
+    def start(self, timeout=30):
+        for connection in self.connections:
+            connection.start()
+        deadline = time.monotonic() + timeout
+        for connection in self.connections:
+            if not connection.ready.wait(max(0, deadline - time.monotonic())):
+                raise ConnectionError("Could not connect to RabbitMQ publisher within {}s.".format(timeout))
+        logging.info(f"RabbitMQ publisher started with {len(self.connections)} connection(s)")
+
+    def publish(self, body, properties=None, routing_key=None):
+        """Queue a message for publishing and return a Future resolved by the broker confirm."""
+        if properties is None:
+            properties = pika.BasicProperties(delivery_mode=2)  # Make message persistent
+        pending = PendingPublish(body, properties, routing_key or self.queue_name)
+        connection = self.connections[next(self._next) % len(self.connections)]
+        connection.submit(pending)
+        logging.debug(f"Queued {len(body)} bytes for RabbitMQ on {connection.name}")
+        return pending.future
+
+    def withdraw(self, future):
+        """Drop a message whose caller stopped waiting for its confirm, if it has not been published yet.
+
+        Returns False when the message already went to the broker, in which case it may still be delivered.
+        """
+        return any(connection.withdraw(future) for connection in self.connections)
+
+    def publish_rpc(self, body, properties, routing_key=None):
+        """Publish a request whose consumer replies via direct reply-to.
+
+        Returns (confirm_future, reply_future); call cancel_rpc() if the caller stops waiting for the reply.
+        """
+        if self.rpc_connection is None:
+            raise RuntimeError("RPC publishing is not enabled on this publisher")
+        properties.correlation_id = uuid.uuid4().hex
+        properties.reply_to = DIRECT_REPLY_TO
+        reply = Future()
+        with self.replies_lock:
+            self.replies[properties.correlation_id] = reply
+        reply.correlation_id = properties.correlation_id
+        pending = PendingPublish(body, properties, routing_key or self.queue_name)
+        self.rpc_connection.submit(pending)
+        return pending.future, reply
+
+    def cancel_rpc(self, reply):
+        with self.replies_lock:
+            self.replies.pop(reply.correlation_id, None)
+
+    def _on_reply(self, correlation_id, body):
+        with self.replies_lock:
+            reply = self.replies.pop(correlation_id, None)
+        if reply is None:
+            # The caller already gave up waiting
+            RPC_REPLIES.labels(outcome='late').inc()
+            return
+        RPC_REPLIES.labels(outcome='delivered').inc()
+        reply.set_result(body)
+
+    def close(self):
+        for connection in self.connections:
+            connection.stop()
+        for connection in self.connections:
+            connection.join(timeout=5)
+        logging.info("RabbitMQ publisher closed.")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
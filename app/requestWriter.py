@@ -0,0 +1,122 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+INSERT_REQUESTS_QUERY = 'INSERT INTO classification_requests (id, status, label, confidence, "createdAt", updated) VALUES %s'
+# Only rows still PENDING: a worker may already have processed a request whose submit() timed out
+FAIL_ABANDONED_QUERY = "UPDATE classification_requests SET status = 'FAILED', label = 'unknown', confidence = 0 WHERE id = ANY(%s) AND status = 'PENDING'"
+
+class IdAllocator:
+    """Hands out request ids from blocks reserved on the classification_requests id sequence.
+
+    Every producer process reserves its own block, so ids from different processes interleave and are not
+    in creation order: a request can get a lower id than an older one from another pod. Anything that needs
+    newest-first order has to sort on "createdAt" (with id as a tie-breaker), not on id alone.
+    """
+    def __init__(self, db_manager, block_size=100):
+        self.db_manager = db_manager
+        self.block_size = block_size
+        self.ids = deque()
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            if not self.ids:
+                rows = self.db_manager.execute_query(
+                    "SELECT nextval(pg_get_serial_sequence('classification_requests', 'id')) FROM generate_series(1, %s)",
+                    (self.block_size,)
+                )
+                self.ids.extend(row[0] for row in rows)
+            return self.ids.popleft()
+
+class PendingInsert:
+    def __init__(self, request_id, status, label, confidence):
+        now = datetime.now(timezone.utc)
+        self.row = (request_id, status, label, confidence, now, now)
+        self.done = threading.Event()
+        self.error = None
+        # queued -> writing -> finished; submit() moves it to cancelled or abandoned when it stops waiting
+        self.state = 'queued'
+
+class BatchedRequestWriter:
+    """Group-commits classification_requests rows from a background flusher thread.
+
+    Ids come from an IdAllocator so a request thread knows its id immediately; submit() then blocks
+    only until the batch holding its own row has been committed. A row whose submit() timed out is
+    dropped if it is still queued, or marked FAILED if its insert was already under way, so no PENDING
+    row is left behind without a published message.
+    """
+    def __init__(self, db_manager, id_allocator, max_batch_size=50, max_wait=0.005, commit_timeout=10):
+        self.db_manager = db_manager
+        self.id_allocator = id_allocator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.commit_timeout = commit_timeout
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='request-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, status='PENDING', label=None, confidence=None):
+        request_id = self.id_allocator.next_id()
+        pending = PendingInsert(request_id, status, label, confidence)
+        self.queue.put(pending)
+        if not pending.done.wait(self.commit_timeout):
+            with self.lock:
+                if pending.state == 'queued':
+                    pending.state = 'cancelled'
+                elif pending.state == 'writing':
+                    pending.state = 'abandoned'
+            if pending.state in ('cancelled', 'abandoned'):
+                raise TimeoutError(f"Request {request_id} was not committed within {self.commit_timeout}s")
+        if pending.error is not None:
+            raise pending.error
+        return request_id
+
+    def _collect_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            with self.lock:
+                batch = [pending for pending in batch if pending.state != 'cancelled']
+                for pending in batch:
+                    pending.state = 'writing'
+            if not batch:
+                continue
+            try:
+                self.db_manager.execute_values(INSERT_REQUESTS_QUERY, [pending.row for pending in batch])
+            except Exception as e:
+                logging.error(f"Failed to insert {len(batch)} classification requests: {e}")
+                for pending in batch:
+                    pending.error = e
+            with self.lock:
+                abandoned = [pending.row[0] for pending in batch if pending.state == 'abandoned' and pending.error is None]
+                for pending in batch:
+                    pending.state = 'finished'
+            if abandoned:
+                self._fail_abandoned(abandoned)
+            for pending in batch:
+                pending.done.set()
+
+    def _fail_abandoned(self, request_ids):
+        """Mark FAILED the rows committed after their submit() had already given up on them."""
+        logging.warning(f"Marking {len(request_ids)} classification requests committed after their submit timed out as FAILED")
+        try:
+            self.db_manager.execute_query(FAIL_ABANDONED_QUERY, (request_ids,))
+        except Exception as e:
+            logging.error(f"Failed to mark abandoned classification requests {request_ids} as FAILED: {e}")
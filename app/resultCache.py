@@ -0,0 +1,60 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from prometheus_client import Counter, REGISTRY
+
+CACHE_HITS = Counter('result_cache_hits', 'Result cache hits', ['tier'], registry=REGISTRY)
+CACHE_MISSES = Counter('result_cache_misses', 'Result cache misses', registry=REGISTRY)
+CACHE_EVICTIONS = Counter('result_cache_evictions', 'Entries evicted from the in-process result cache', registry=REGISTRY)
+
+def content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                CACHE_EVICTIONS.inc()
+
+class ResultCache:
+    """Two-tier hash -> (label, confidence) cache: an in-process LRU in front of the image_results table."""
+    def __init__(self, db_manager, max_size=10000):
+        self.db_manager = db_manager
+        self.local = LRUCache(max_size)
+
+    def get(self, image_hash):
+        result = self.local.get(image_hash)
+        if result is not None:
+            CACHE_HITS.labels(tier='memory').inc()
+            return result
+        try:
+            rows = self.db_manager.execute_query(
+                "SELECT label, confidence FROM image_results WHERE hash = %s",
+                (image_hash,)
+            )
+        except Exception as e:
+            logging.warning(f"Result cache lookup failed: {e}")
+            rows = None
+        if rows:
+            result = (rows[0][0], rows[0][1])
+            self.local.put(image_hash, result)
+            CACHE_HITS.labels(tier='database').inc()
+            return result
+        CACHE_MISSES.inc()
+        return None
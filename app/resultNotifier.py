@@ -0,0 +1,93 @@
+import json
+import time
+import queue
+import select
+import logging
+import threading
+from psycopg2 import OperationalError, InterfaceError
+from prometheus_client import Counter, Gauge, REGISTRY
+
+NOTIFICATIONS = Counter('result_notifications', 'Result notifications received over LISTEN', registry=REGISTRY)
+WAITERS = Gauge('result_notification_waiters', 'Clients currently waiting for a result notification', registry=REGISTRY)
+
+class ResultNotifier(threading.Thread):
+    """Holds one LISTEN connection for the whole process and fans notifications out to waiting requests.
+
+    Waiters subscribe() before checking the current status so that no notification can slip in between.
+    After a reconnect every waiter receives {'resync': True} and should re-read the row, since
+    notifications sent while disconnected are lost.
+    """
+    def __init__(self, db_manager, channel, poll_interval=5, retry_delay=1, max_retry_delay=30):
+        super().__init__(name='result-notifier', daemon=True)
+        self.db_manager = db_manager
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.waiters = {}
+        self.lock = threading.Lock()
+        self.stopping = False
+
+    def subscribe(self, request_id):
+        subscription = queue.Queue()
+        with self.lock:
+            self.waiters.setdefault(int(request_id), set()).add(subscription)
+        WAITERS.inc()
+        return subscription
+
+    def unsubscribe(self, request_id, subscription):
+        with self.lock:
+            subscribers = self.waiters.get(int(request_id))
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.waiters[int(request_id)]
+        WAITERS.dec()
+
+    def _dispatch(self, payload):
+        with self.lock:
+            subscribers = list(self.waiters.get(int(payload['id']), ()))
+        for subscription in subscribers:
+            subscription.put(payload)
+
+    def _resync_all(self):
+        with self.lock:
+            waiting = [(request_id, list(subscribers)) for request_id, subscribers in self.waiters.items()]
+        for request_id, subscribers in waiting:
+            for subscription in subscribers:
+                subscription.put({'id': request_id, 'resync': True})
+
+    def run(self):
+        attempt = 0
+        while not self.stopping:
+            conn = None
+            try:
+                conn = self.db_manager.open_dedicated_connection()
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                logging.info(f"Listening for result notifications on '{self.channel}'")
+                if attempt:
+                    self._resync_all()
+                attempt = 0
+                while not self.stopping:
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        NOTIFICATIONS.inc()
+                        try:
+                            self._dispatch(json.loads(notification.payload))
+                        except (ValueError, KeyError) as e:
+                            logging.warning(f"Ignoring malformed result notification: {e}")
+            except (OperationalError, InterfaceError, ConnectionError) as e:
+                delay = min(self.retry_delay * (2 ** attempt), self.max_retry_delay)
+                attempt += 1
+                logging.warning(f"Result notification listener lost its connection: {e}. Reconnecting in {delay}s.")
+                time.sleep(delay)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+    def stop(self):
+        self.stopping = True
@@ -0,0 +1,120 @@
+import time
+import json
+import logging
+
+UPDATE_RESULTS_QUERY = """
+UPDATE classification_requests AS c
+SET status = v.status, label = v.label, confidence = v.confidence
+FROM (VALUES %s) AS v(id, status, label, confidence)
+WHERE c.id = v.id
+"""
+UPDATE_RESULTS_TEMPLATE = "(%s::integer, %s::varchar, %s::varchar, %s::double precision)"
+
+UPDATE_RESULTS_WITH_STAGES_QUERY = """
+UPDATE classification_requests AS c
+SET status = v.status, label = v.label, confidence = v.confidence, stage_times = v.stage_times
+FROM (VALUES %s) AS v(id, status, label, confidence, stage_times)
+WHERE c.id = v.id
+"""
+UPDATE_RESULTS_WITH_STAGES_TEMPLATE = "(%s::integer, %s::varchar, %s::varchar, %s::double precision, %s::jsonb)"
+
+FAIL_REQUEST_QUERY = """
+UPDATE classification_requests AS c
+SET status = %s, label = %s, confidence = %s
+WHERE c.id = %s
+"""
+
+def with_notify(update_query, channel):
+    """Wrap an UPDATE on classification_requests AS c so each updated row also sends a NOTIFY.
+
+    The notifications are delivered when the statement commits, so listeners never see uncommitted results.
+    """
+    return f"""
+WITH updated AS ({update_query.strip()}
+RETURNING c.id, c.status, c.label, c.confidence)
+SELECT pg_notify('{channel}', json_build_object('id', id, 'status', status, 'label', label, 'confidence', confidence)::text)
+FROM updated
+"""
+
+INSERT_CACHE_QUERY = 'INSERT INTO image_results (hash, label, confidence, "createdAt") VALUES %s ON CONFLICT (hash) DO NOTHING'
+INSERT_CACHE_TEMPLATE = "(%s, %s, %s, now())"
+
+class PendingResult:
+    def __init__(self, request_id, status, label, confidence, image_hash, on_commit, on_error, stage_times=None):
+        self.request_id = request_id
+        self.status = status
+        self.label = label
+        self.confidence = confidence
+        self.image_hash = image_hash
+        self.stage_times = stage_times
+        self.on_commit = on_commit
+        self.on_error = on_error
+
+class ResultWriter:
+    """Write-behind buffer for classification results.
+
+    Results are written with one UPDATE ... FROM (VALUES ...) statement when the buffer reaches max_size
+    or its oldest entry is max_age seconds old. Each entry's on_commit callback (normally the RabbitMQ ack)
+    only runs after that statement commits; on failure on_error runs instead, so delivery stays at-least-once.
+    With a notify_channel set, the same statement sends a NOTIFY per updated row. With store_stage_times set,
+    each row's stage_times column gets the timestamps passed to add(), plus 'written' for when the UPDATE was sent.
+    The scheduler is any object with the call_later/remove_timeout API of a pika connection, and all calls
+    must happen on that connection's thread. Without a scheduler only max_size triggers a flush and the
+    owning thread is responsible for calling flush() once max_age has passed.
+    """
+    def __init__(self, db_manager, max_size=64, max_age=0.1, scheduler=None, notify_channel=None, store_stage_times=False):
+        self.db_manager = db_manager
+        self.store_stage_times = store_stage_times
+        update_query = UPDATE_RESULTS_WITH_STAGES_QUERY if store_stage_times else UPDATE_RESULTS_QUERY
+        self.update_template = UPDATE_RESULTS_WITH_STAGES_TEMPLATE if store_stage_times else UPDATE_RESULTS_TEMPLATE
+        self.update_query = with_notify(update_query, notify_channel) if notify_channel else update_query
+        self.max_size = max_size
+        self.max_age = max_age
+        self.scheduler = scheduler
+        self.pending = []
+        self.timer = None
+
+    def add(self, request_id, status, label, confidence, image_hash=None, on_commit=None, on_error=None, stage_times=None):
+        self.pending.append(PendingResult(request_id, status, label, confidence, image_hash, on_commit, on_error, stage_times))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None and self.scheduler is not None:
+            self.timer = self.scheduler.call_later(self.max_age, self._on_timeout)
+
+    def _on_timeout(self):
+        self.timer = None
+        self.flush()
+
+    def flush(self):
+        if self.timer is not None:
+            self.scheduler.remove_timeout(self.timer)
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        start = time.time()
+        if self.store_stage_times:
+            rows = [(r.request_id, r.status, r.label, r.confidence, json.dumps({**(r.stage_times or {}), 'written': start})) for r in batch]
+        else:
+            rows = [(r.request_id, r.status, r.label, r.confidence) for r in batch]
+        try:
+            self.db_manager.execute_values(self.update_query, rows, template=self.update_template)
+        except Exception as e:
+            logging.error(f"Failed to write {len(batch)} results: {e}")
+            for result in batch:
+                if result.on_error is not None:
+                    result.on_error(e)
+            return
+        logging.info(f"Wrote {len(batch)} results in {time.time() - start:.3f}s")
+
+        cache_rows = [(r.image_hash, r.label, r.confidence) for r in batch if r.image_hash and r.status == 'PROCESSED']
+        if cache_rows:
+            try:
+                self.db_manager.execute_values(INSERT_CACHE_QUERY, cache_rows, template=INSERT_CACHE_TEMPLATE)
+            except Exception as e:
+                logging.warning(f"Failed to store {len(cache_rows)} cached results: {e}")
+
+        for result in batch:
+            if result.on_commit is not None:
+                result.on_commit()
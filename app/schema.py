@@ -0,0 +1,27 @@
+import logging
+from psycopg2 import Error
+
+# db.create_all() creates missing tables but never alters existing ones, so databases created before
+# these were added to models.py get them here. Every statement is idempotent.
+SCHEMA_UPGRADES = (
+    # Keyset pagination on /results; built concurrently so inserts are not blocked on a large table
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classification_requests_created_at_id ON classification_requests ("createdAt", id)',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classification_requests_status_created_at_id ON classification_requests (status, "createdAt", id)',
+    # Per-stage timestamps written by the consumer when STORE_STAGE_TIMES is on
+    'ALTER TABLE classification_requests ADD COLUMN IF NOT EXISTS stage_times JSONB',
+)
+
+def upgrade_schema(db_manager):
+    """Apply SCHEMA_UPGRADES on an autocommit pooled connection, logging and skipping any that fail."""
+    for statement in SCHEMA_UPGRADES:
+        try:
+            db_manager.execute_query(statement)
+        except Error as e:
+            logging.warning(f"Schema upgrade failed, continuing without it: {statement.splitlines()[0]}: {e}")
+
+def has_column(db_manager, table, column):
+    rows = db_manager.execute_query(
+        "SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return bool(rows)
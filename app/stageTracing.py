@@ -0,0 +1,82 @@
+import time
+import logging
+from os import environ
+from prometheus_client import Histogram, REGISTRY
+
+# Pipeline stages in order; each request carries the wall-clock time (epoch seconds) it reached each of them
+STAGES = ('received', 'persisted', 'published', 'dequeued', 'decoded', 'inferred', 'written')
+STAGE_HEADER = 'x-stage-times'
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PIPELINE_STAGE_SECONDS = Histogram('pipeline_stage_seconds', 'Per request, time from the previous pipeline stage to this one '
+                                   '(total: received to written, confirmed: published to broker confirm)',
+                                   ['stage'], buckets=STAGE_BUCKETS, registry=REGISTRY)
+
+def mark(times, stage, at=None):
+    """Record that the request reached `stage` now (or at `at`) and return the timestamps."""
+    times[stage] = time.time() if at is None else at
+    return times
+
+def stage_headers(times):
+    """AMQP headers carrying the timestamps to the next process, as integer microseconds since AMQP tables have no float type."""
+    return {STAGE_HEADER: {stage: int(at * 1_000_000) for stage, at in times.items()}}
+
+def read_stage_times(properties):
+    """Timestamps a message arrived with, or an empty dict for messages published without them."""
+    headers = (properties.headers if properties is not None else None) or {}
+    return {stage: int(at) / 1_000_000 for stage, at in (headers.get(STAGE_HEADER) or {}).items()}
+
+def observe_stages(times, stages):
+    """Export the time into each of `stages` from the stage before it that the request has a timestamp for.
+
+    Stages in different processes are compared by wall clock, so clock skew between hosts shows up in
+    the 'dequeued' stage; negative differences are clamped to zero.
+    """
+    for stage in stages:
+        if stage not in times:
+            continue
+        index = STAGES.index(stage)
+        previous = next((s for s in reversed(STAGES[:index]) if s in times), None)
+        if previous is not None:
+            PIPELINE_STAGE_SECONDS.labels(stage=stage).observe(max(0.0, times[stage] - times[previous]))
+    if STAGES[-1] in stages and 'received' in times and STAGES[-1] in times:
+        PIPELINE_STAGE_SECONDS.labels(stage='total').observe(max(0.0, times[STAGES[-1]] - times['received']))
+
+class StageSpanExporter:
+    """Sends a finished request's timestamps to an OpenTelemetry collector as one trace with a span per stage."""
+    def __init__(self, tracer, set_span_in_context):
+        self.tracer = tracer
+        self.set_span_in_context = set_span_in_context
+
+    def export(self, request_id, times):
+        reached = [stage for stage in STAGES if stage in times]
+        if len(reached) < 2:
+            return
+        try:
+            nanos = {stage: int(times[stage] * 1e9) for stage in reached}
+            root = self.tracer.start_span('classification', start_time=nanos[reached[0]], attributes={'request.id': int(request_id)})
+            context = self.set_span_in_context(root)
+            for previous, stage in zip(reached, reached[1:]):
+                self.tracer.start_span(stage, context=context, start_time=nanos[previous]).end(end_time=nanos[stage])
+            root.end(end_time=nanos[reached[-1]])
+        except Exception as e:
+            logging.warning(f"Failed to export stage spans for request ID {request_id}: {e}")
+
+def create_span_exporter(service_name):
+    """A StageSpanExporter when OTEL_EXPORTER_OTLP_ENDPOINT is set and the OpenTelemetry SDK is installed, else None."""
+    if not environ.get('OTEL_EXPORTER_OTLP_ENDPOINT') and not environ.get('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT'):
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError as e:
+        logging.warning(f"OTEL_EXPORTER_OTLP_ENDPOINT is set but the OpenTelemetry SDK is not installed ({e}); not exporting spans")
+        return None
+    # The exporter reads the endpoint, headers and timeout from the standard OTEL_EXPORTER_OTLP_* variables
+    provider = TracerProvider(resource=Resource.create({'service.name': environ.get('OTEL_SERVICE_NAME', service_name)}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    logging.info("Exporting pipeline stage spans over OTLP")
+    return StageSpanExporter(provider.get_tracer(__name__), trace.set_span_in_context)
@@ -0,0 +1,149 @@
+import os
+import time
+import signal
+import functools
+import logging
+import multiprocessing
+from prometheus_client import Counter, Gauge, REGISTRY
+
+WORKER_PROCESSES = Gauge('inference_worker_processes', 'Inference processes currently alive', multiprocess_mode='max', registry=REGISTRY)
+WORKER_RESTARTS = Counter('inference_worker_restarts', 'Inference processes restarted after exiting', registry=REGISTRY)
+
+def cpu_quota():
+    """CPUs this container may use: the cgroup CPU quota when one is set, otherwise the CPUs we are allowed to run on."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:  # cgroup v2
+            quota, period = f.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:  # cgroup v1
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def threads_per_process(processes, cpus=None):
+    """Intra-op threads per process so that all processes together stay within the CPU quota."""
+    cpus = cpu_quota() if cpus is None else cpus
+    return max(1, int(cpus // processes))
+
+def prepare_parent():
+    """Call before the model is loaded: the parent only loads and warms up, so keep it single-threaded.
+
+    OpenMP's thread pool does not survive fork(); children of a parent that ran a multi-threaded
+    forward pass hang on their first one.
+    """
+    import torch
+    torch.set_num_threads(1)
+
+class WorkerSupervisor:
+    """Forks `processes` copies of `target` from a parent that has already loaded the model, and restarts any that exit.
+
+    The children inherit the model copy-on-write. Inference only reads the parameter storages, so those
+    pages stay shared and each extra process adds its activations and connections but not another copy
+    of the weights. Each child sets its own torch thread count and opens its own database and RabbitMQ
+    connections inside `target`, which is called with an on_ready callback to run once it is consuming.
+
+    `server` (the HTTP endpoints) runs in one more child, so the parent never starts a thread and every
+    fork, restarts included, happens from a single-threaded process. The children's readiness is kept in
+    shared memory, so ready() gives the same answer in the server process as in the parent.
+    """
+    def __init__(self, target, processes, threads, restart_delay=1, server=None):
+        self.target = target
+        self.processes = processes
+        self.threads = threads
+        self.restart_delay = restart_delay
+        self.server = server
+        self.context = multiprocessing.get_context('fork')
+        self.ready_flags = self.context.Array('b', processes, lock=False)
+        self.children = {}
+        self.server_process = None
+        self.stopping = False
+
+    def _spawn(self, index):
+        self.ready_flags[index] = 0
+        process = self.context.Process(target=self._run_child, args=(index,), name=f"inference-worker-{index}")
+        process.start()
+        self.children[index] = process
+        logging.info(f"Started inference worker {index} (pid {process.pid}) with {self.threads} thread(s)")
+
+    def _run_child(self, index):
+        import torch
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        torch.set_num_threads(self.threads)
+        try:
+            self.target(on_ready=functools.partial(self._mark_ready, index))
+        finally:
+            self.ready_flags[index] = 0
+
+    def _mark_ready(self, index):
+        self.ready_flags[index] = 1
+
+    def ready(self):
+        """True once every inference process has started consuming, and until one of them exits."""
+        return all(self.ready_flags)
+
+    def _spawn_server(self):
+        self.server_process = self.context.Process(target=self._run_server, name='inference-worker-http')
+        self.server_process.start()
+        logging.info(f"Started HTTP server process (pid {self.server_process.pid})")
+
+    def _run_server(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.server()
+
+    def start_server(self):
+        """Fork the server process ahead of the inference processes, e.g. to answer /health while the model loads."""
+        signal.signal(signal.SIGTERM, self.stop)
+        if self.server is not None and self.server_process is None:
+            self._spawn_server()
+
+    def start(self):
+        self.start_server()
+        for index in range(self.processes):
+            self._spawn(index)
+        WORKER_PROCESSES.set(len(self.children))
+
+    def monitor(self):
+        """Block in the parent, restarting children that exit until stop() is called."""
+        while not self.stopping:
+            for index, process in list(self.children.items()):
+                if process.is_alive() or self.stopping:
+                    continue
+                logging.warning(f"Inference worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                self.ready_flags[index] = 0
+                self._mark_dead(process.pid)
+                WORKER_RESTARTS.inc()
+                self._spawn(index)
+            if self.server_process is not None and not self.server_process.is_alive() and not self.stopping:
+                logging.warning(f"HTTP server process exited with code {self.server_process.exitcode}, restarting")
+                self._mark_dead(self.server_process.pid)
+                self._spawn_server()
+            WORKER_PROCESSES.set(sum(1 for process in self.children.values() if process.is_alive()))
+            time.sleep(self.restart_delay)
+
+    def _mark_dead(self, pid):
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        processes = list(self.children.values()) + ([self.server_process] if self.server_process is not None else [])
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+        logging.info("Inference workers stopped.")
+        if signum is not None:
+            os._exit(0)
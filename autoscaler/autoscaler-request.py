@@ -1,22 +1,45 @@
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask
 from kubernetes import client, config
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import os
-from prometheus_client import Counter, generate_latest, REGISTRY, Summary, Histogram
+from prometheus_client import Counter, Gauge, generate_latest, REGISTRY, Summary, Histogram
+from queuePolicy import RabbitMQQueueStats, QueueScalingPolicy
+from forecastPolicy import HoltWintersForecaster, PredictiveScalingPolicy, SeasonDetector
 # Configure logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 route_hit_counter = Counter('route_hits', 'Count of hits to routes', ['route'],registry=REGISTRY)
-replica_counter = Counter('replica_counter', 'Count of replica', ['deplyment_name'],registry=REGISTRY)
+replica_counter = Counter('replica_counter', 'Count of replica', ['deployment_name'],registry=REGISTRY)
+DECISION_LATENCY = Histogram('autoscaler_decision_seconds', 'Time to collect metrics and make one scaling decision', ['deployment_name'],
+                             buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), registry=REGISTRY)
+TICK_LATENCY = Histogram('autoscaler_tick_seconds', 'Time to make the scaling decisions for all targets due in one tick',
+                         buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), registry=REGISTRY)
+QUERY_LATENCY = Histogram('autoscaler_prometheus_query_seconds', 'Prometheus query round trip',
+                          buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5), registry=REGISTRY)
+DESIRED_REPLICAS = Gauge('autoscaler_desired_replicas', 'Replicas the last decision asked for', ['deployment_name'], registry=REGISTRY)
+CURRENT_REPLICAS = Gauge('autoscaler_current_replicas', 'Replicas in the deployment spec at the last decision', ['deployment_name'], registry=REGISTRY)
+READY_REPLICAS = Gauge('autoscaler_ready_replicas', 'Ready replicas at the last decision', ['deployment_name'], registry=REGISTRY)
+SCALE_EVENTS = Counter('autoscaler_scale_events', 'Scaling actions taken', ['deployment_name', 'direction'], registry=REGISTRY)
+FORECAST_RATE = Gauge('autoscaler_forecast_arrival_rate', 'Arrival rate forecast one lead time ahead', ['deployment_name'], registry=REGISTRY)
+FORECAST_ERROR = Gauge('autoscaler_forecast_error', 'Smoothed relative error of scored arrival rate forecasts', ['deployment_name'], registry=REGISTRY)
+FORECAST_LEAD_TIME = Gauge('autoscaler_forecast_lead_seconds', 'How far ahead replicas are provisioned (startup time + decision interval)', ['deployment_name'], registry=REGISTRY)
+FORECAST_IN_USE = Gauge('autoscaler_forecast_in_use', '1 when the last decision used the forecast, 0 when it fell back to the reactive policy', ['deployment_name'], registry=REGISTRY)
+STARTUP_ESTIMATE = Gauge('autoscaler_startup_seconds_estimate', 'Learned time from a scale-up to the new replicas being ready', ['deployment_name'], registry=REGISTRY)
+SERVICE_RATE_ESTIMATE = Gauge('autoscaler_service_rate_estimate', 'Learned messages/s one replica processes', ['deployment_name'], registry=REGISTRY)
+DECISION_FAILURES = Counter('autoscaler_decision_failures', 'Decisions skipped because metrics or the deployment could not be read', ['deployment_name'], registry=REGISTRY)
 app = Flask(__name__)
 
 
 class AutoScaler:
-    def __init__(self, prometheus_url, moving_average_duration, cooldown_period, deployment_name, namespace, latency_threshold_up, latency_threshold_down, count_threshold, max_replicas, min_replicas, MAX_FAILURES):
+    def __init__(self, prometheus_url, moving_average_duration, cooldown_period, deployment_name, namespace, latency_threshold_up, latency_threshold_down, count_threshold, max_replicas, min_replicas, MAX_FAILURES,
+                 scaling_policy='latency', queue_stats=None, queue_policy=None, apps_v1=None, session=None, clock=time, executor=None):
         self.PROMETHEUS_URL = prometheus_url
         self.MOVING_AVERAGE_DURATION = moving_average_duration
         self.COOLDOWN_PERIOD = cooldown_period
@@ -30,18 +53,42 @@ class AutoScaler:
         self.MAX_FAILURES = MAX_FAILURES
         self.failure_upscale = False
         self.failure_count = 0
+        # 'latency' scales on /predict latency and request rate, 'queue' sizes a consumer deployment from its queue,
+        # 'predictive' does the same for the arrival rate forecast one pod startup ahead
+        self.SCALING_POLICY = scaling_policy
+        self.queue_stats = queue_stats
+        self.queue_policy = queue_policy
+        # Anything with monotonic() and sleep(); the offline simulator passes a simulated clock
+        self.clock = clock
+        self.session = session or requests.Session()
+        # With an executor the Prometheus queries and the deployment read of one decision run concurrently
+        self.executor = executor
 
-        try:
-            config.load_kube_config()
-        except config.ConfigException:
-            config.load_incluster_config()  
+        if apps_v1 is None:
+            try:
+                config.load_kube_config()
+            except config.ConfigException:
+                config.load_incluster_config()  
+            apps_v1 = client.AppsV1Api()
+        self.apps_v1 = apps_v1
+
+    def defer(self, call):
+        """Start `call` in the executor and return a function that waits for its result.
 
-        self.apps_v1 = client.AppsV1Api()
+        Without an executor the call is only made when its result is asked for.
+        """
+        if self.executor is None:
+            return call
+        return self.executor.submit(call).result
+
+    def read_deployment(self):
+        return self.apps_v1.read_namespaced_deployment(name=self.DEPLOYMENT_NAME, namespace=self.NAMESPACE)
 
     def query_prometheus(self, query):
         try:
             logger.info(f"Querying Prometheus with: {query}")
-            response = requests.get(f"{self.PROMETHEUS_URL}/api/v1/query", params={'query': query})
+            with QUERY_LATENCY.time():
+                response = self.session.get(f"{self.PROMETHEUS_URL}/api/v1/query", params={'query': query}, timeout=10)
             response.raise_for_status()
             data = response.json()['data']
             
@@ -73,16 +120,16 @@ class AutoScaler:
                 f")"
             )
 
-            latency_avg = self.query_prometheus(query_latency_avg)
-            if latency_avg is None:
-                logger.error("Failed to retrieve 1-minute moving average latency.")
-
             # Query for total count of requests for /predict endpoint over past 1 minute
             query_request_count = (
                 f"sum(rate(request_latency_seconds_count{{endpoint='/predict'}}[1m]))"
             )
 
-            request_count = self.query_prometheus(query_request_count)
+            latency_avg = self.defer(lambda: self.query_prometheus(query_latency_avg))
+            request_count = self.defer(lambda: self.query_prometheus(query_request_count))
+            latency_avg, request_count = latency_avg(), request_count()
+            if latency_avg is None:
+                logger.error("Failed to retrieve 1-minute moving average latency.")
             if request_count is None:
                 logger.error("Failed to retrieve total request count for /predict endpoint.")
 
@@ -119,65 +166,220 @@ class AutoScaler:
         except Exception as e:
             logger.error(f"Error scaling deployment: {e}")
 
+    def get_worker_throughput(self):
+        """Messages/s committed by all consumer replicas over the last minute."""
+        return self.query_prometheus("sum(rate(consumer_messages_processed_total[1m]))")
+
+    def record_decision(self, current_replicas, desired_replicas, ready_replicas=None):
+        CURRENT_REPLICAS.labels(deployment_name=self.DEPLOYMENT_NAME).set(current_replicas)
+        DESIRED_REPLICAS.labels(deployment_name=self.DEPLOYMENT_NAME).set(desired_replicas)
+        if ready_replicas is not None:
+            READY_REPLICAS.labels(deployment_name=self.DEPLOYMENT_NAME).set(ready_replicas)
+        if desired_replicas != current_replicas:
+            SCALE_EVENTS.labels(deployment_name=self.DEPLOYMENT_NAME, direction='up' if desired_replicas > current_replicas else 'down').inc()
+
+    def record_estimates(self):
+        labels = {'deployment_name': self.DEPLOYMENT_NAME}
+        SERVICE_RATE_ESTIMATE.labels(**labels).set(self.queue_policy.service_rate)
+        if not isinstance(self.queue_policy, PredictiveScalingPolicy):
+            return
+        policy = self.queue_policy
+        if policy.last_forecast is not None:
+            FORECAST_RATE.labels(**labels).set(policy.last_forecast)
+        if policy.forecast_error is not None:
+            FORECAST_ERROR.labels(**labels).set(policy.forecast_error)
+        FORECAST_LEAD_TIME.labels(**labels).set(policy.lead_time)
+        FORECAST_IN_USE.labels(**labels).set(1 if policy.using_forecast else 0)
+        STARTUP_ESTIMATE.labels(**labels).set(policy.startup_time)
+
+    def autoscale_queue(self):
+        """One scaling decision for a queue consumer deployment from queue depth, arrival rate and service rate."""
+        deployment = self.defer(self.read_deployment)
+        throughput = self.defer(self.get_worker_throughput)
+        stats = self.queue_stats.fetch()
+        if stats is None:
+            logger.error("Skipping queue scaling decision without queue stats.")
+            DECISION_FAILURES.labels(deployment_name=self.DEPLOYMENT_NAME).inc()
+            return
+        try:
+            deployment = deployment()
+            current_replicas = deployment.spec.replicas
+            ready_replicas = deployment.status.ready_replicas or 0
+
+            self.queue_policy.observe_throughput(throughput(), ready_replicas, stats.ready)
+            new_replicas = self.queue_policy.desired_replicas(current_replicas, stats.publish_rate, stats.ready, ready_replicas)
+            logger.info(f"{stats}, replicas {current_replicas} ({ready_replicas} ready), desired {new_replicas}")
+            self.record_decision(current_replicas, new_replicas, ready_replicas)
+            self.record_estimates()
+            if new_replicas != current_replicas:
+                logger.info(f"Scaling {'up' if new_replicas > current_replicas else 'down'} to {new_replicas} replicas")
+                self.scale_deployment(new_replicas)
+        except Exception as e:
+            logger.error(f"Error reading or scaling deployment: {e}")
+            DECISION_FAILURES.labels(deployment_name=self.DEPLOYMENT_NAME).inc()
+
     def autoscale(self):
         while True:
-            metrics = self.get_metrics()
-            if metrics is None:
-                if self.failure_upscale:
-                    try:
-                        deployment = self.apps_v1.read_namespaced_deployment(name=self.DEPLOYMENT_NAME, namespace=self.NAMESPACE)
-                        current_replicas = deployment.spec.replicas
-                        replica_counter.labels(deployment_name=self.DEPLOYMENT_NAME).inc(current_replicas)
-                        if current_replicas < self.MAX_REPLICAS:
-                            new_replicas = min(current_replicas + 1, self.MAX_REPLICAS)
-                            logger.info(f"Scaling up due to persistent failures to {new_replicas} replicas")
-                            self.scale_deployment(new_replicas)
-                            self.failure_upscale = False
-                    except Exception as e:
-                        logger.error(f"Error reading or scaling deployment during failure upscale: {e}")
-                time.sleep(self.COOLDOWN_PERIOD)
-                continue
-
-            latency_avg, request_count = metrics
-            self.failure_count = 0
-            try:
-                deployment = self.apps_v1.read_namespaced_deployment(name=self.DEPLOYMENT_NAME, namespace=self.NAMESPACE)
-                current_replicas = deployment.spec.replicas
+            self.tick()
+            self.clock.sleep(self.COOLDOWN_PERIOD)
 
-                logger.info(f"Current 1-minute moving average latency: {latency_avg} seconds")
-                logger.info(f"Current request count: {request_count}")
-                logger.info(f"Current replicas: {current_replicas}")
+    def tick(self):
+        """Make one scaling decision; autoscale() runs this every COOLDOWN_PERIOD seconds."""
+        with DECISION_LATENCY.labels(deployment_name=self.DEPLOYMENT_NAME).time():
+            if self.SCALING_POLICY in ('queue', 'predictive'):
+                self.autoscale_queue()
+            else:
+                self.autoscale_latency()
 
-                # Scaling logic
-                if (latency_avg > self.LATENCY_THRESHOLD_UP or request_count > self.COUNT_THRESHOLD) and current_replicas < self.MAX_REPLICAS:
-                    new_replicas = min(current_replicas + 1, self.MAX_REPLICAS)
-                    logger.info(f"Scaling up to {new_replicas} replicas")
-                    self.scale_deployment(new_replicas)
-                elif latency_avg < self.LATENCY_THRESHOLD_DOWN and current_replicas > self.MIN_REPLICAS:
-                    new_replicas = max(current_replicas - 1, self.MIN_REPLICAS)
-                    logger.info(f"Scaling down to {new_replicas} replicas")
-                    self.scale_deployment(new_replicas)
+    def autoscale_latency(self):
+        """One scaling decision from the /predict latency and request rate, one replica at a time."""
+        # Read the deployment while the Prometheus queries are in flight
+        deployment = self.defer(self.read_deployment)
+        metrics = self.get_metrics()
+        if metrics is None:
+            DECISION_FAILURES.labels(deployment_name=self.DEPLOYMENT_NAME).inc()
+            if self.failure_upscale:
+                try:
+                    current_replicas = deployment().spec.replicas
+                    replica_counter.labels(deployment_name=self.DEPLOYMENT_NAME).inc(current_replicas)
+                    if current_replicas < self.MAX_REPLICAS:
+                        new_replicas = min(current_replicas + 1, self.MAX_REPLICAS)
+                        logger.info(f"Scaling up due to persistent failures to {new_replicas} replicas")
+                        self.record_decision(current_replicas, new_replicas)
+                        self.scale_deployment(new_replicas)
+                        self.failure_upscale = False
+                except Exception as e:
+                    logger.error(f"Error reading or scaling deployment during failure upscale: {e}")
+            return
 
-            except Exception as e:
-                logger.error(f"Error reading or scaling deployment: {e}")
+        latency_avg, request_count = metrics
+        self.failure_count = 0
+        try:
+            deployment = deployment()
+            current_replicas = deployment.spec.replicas
+
+            logger.info(f"Current 1-minute moving average latency: {latency_avg} seconds")
+            logger.info(f"Current request count: {request_count}")
+            logger.info(f"Current replicas: {current_replicas}")
 
-            time.sleep(self.COOLDOWN_PERIOD)
+            # Scaling logic
+            new_replicas = current_replicas
+            if (latency_avg > self.LATENCY_THRESHOLD_UP or request_count > self.COUNT_THRESHOLD) and current_replicas < self.MAX_REPLICAS:
+                new_replicas = min(current_replicas + 1, self.MAX_REPLICAS)
+                logger.info(f"Scaling up to {new_replicas} replicas")
+            elif latency_avg < self.LATENCY_THRESHOLD_DOWN and current_replicas > self.MIN_REPLICAS:
+                new_replicas = max(current_replicas - 1, self.MIN_REPLICAS)
+                logger.info(f"Scaling down to {new_replicas} replicas")
+            self.record_decision(current_replicas, new_replicas, deployment.status.ready_replicas)
+            if new_replicas != current_replicas:
+                self.scale_deployment(new_replicas)
+
+        except Exception as e:
+            logger.error(f"Error reading or scaling deployment: {e}")
+            DECISION_FAILURES.labels(deployment_name=self.DEPLOYMENT_NAME).inc()
 
-def create_autoscaler():
+class AutoScalerGroup:
+    """Runs several AutoScalers, one per deployment, from a single process.
+
+    Each target keeps its own policy and COOLDOWN_PERIOD. Targets that are due are decided concurrently,
+    and each decision issues its Prometheus queries and deployment read concurrently on `executor`, so a
+    tick costs about one query round trip however many targets there are.
+    """
+    def __init__(self, autoscalers, clock=time):
+        self.autoscalers = autoscalers
+        self.clock = clock
+        # Decisions get their own pool: they block on the queries they submit to the shared query executor
+        self.decisions = ThreadPoolExecutor(max_workers=max(1, len(autoscalers)), thread_name_prefix='decision')
+
+    def tick(self, autoscalers=None):
+        """Decide for `autoscalers` (all targets by default) concurrently and wait for every decision."""
+        autoscalers = self.autoscalers if autoscalers is None else autoscalers
+        with TICK_LATENCY.time():
+            futures = {self.decisions.submit(autoscaler.tick): autoscaler for autoscaler in autoscalers}
+            for future, autoscaler in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Scaling decision for {autoscaler.DEPLOYMENT_NAME} failed: {e}")
+
+    def autoscale(self):
+        next_tick = [self.clock.monotonic()] * len(self.autoscalers)
+        while True:
+            now = self.clock.monotonic()
+            due = [i for i, at in enumerate(next_tick) if at <= now]
+            self.tick([self.autoscalers[i] for i in due])
+            for i in due:
+                next_tick[i] = now + self.autoscalers[i].COOLDOWN_PERIOD
+            self.clock.sleep(max(0, min(next_tick) - self.clock.monotonic()))
+
+def target_env(deployment_name):
+    """os.getenv for one target: WORKER_APP_COOLDOWN_PERIOD for worker-app wins over COOLDOWN_PERIOD."""
+    prefix = deployment_name.upper().replace('-', '_') + '_'
+    def getenv(key, default=None):
+        return os.getenv(prefix + key, os.getenv(key, default))
+    return getenv
+
+def create_autoscaler(deployment_name=None, session=None, apps_v1=None, executor=None):
     # Initialize AutoScaler with required parameters
     env_path = os.path.join(os.path.dirname(__file__), '../.env')
     load_dotenv(env_path)
-    PROMETHEUS_URL = os.getenv('PROMETHEUS_URL')
-    MOVING_AVERAGE_DURATION = os.getenv('MOVING_AVERAGE_DURATION')
-    COOLDOWN_PERIOD = int(os.getenv('COOLDOWN_PERIOD'))
-    DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME')
-    NAMESPACE = os.getenv('NAMESPACE')
-    LATENCY_THRESHOLD_UP = float(os.getenv('LATENCY_THRESHOLD_UP'))
-    LATENCY_THRESHOLD_DOWN = float(os.getenv('LATENCY_THRESHOLD_DOWN'))
-    COUNT_THRESHOLD = int(os.getenv('COUNT_THRESHOLD'))
-    MAX_REPLICAS = int(os.getenv('MAX_REPLICAS'))
-    MIN_REPLICAS = int(os.getenv('MIN_REPLICAS'))
-    MAX_FAILURES = int(os.getenv('MAX_FAILURES'))
+    DEPLOYMENT_NAME = deployment_name or os.getenv('DEPLOYMENT_NAME')
+    getenv = target_env(DEPLOYMENT_NAME)
+    PROMETHEUS_URL = getenv('PROMETHEUS_URL')
+    MOVING_AVERAGE_DURATION = getenv('MOVING_AVERAGE_DURATION')
+    COOLDOWN_PERIOD = int(getenv('COOLDOWN_PERIOD'))
+    NAMESPACE = getenv('NAMESPACE')
+    LATENCY_THRESHOLD_UP = float(getenv('LATENCY_THRESHOLD_UP'))
+    LATENCY_THRESHOLD_DOWN = float(getenv('LATENCY_THRESHOLD_DOWN'))
+    COUNT_THRESHOLD = int(getenv('COUNT_THRESHOLD'))
+    MAX_REPLICAS = int(getenv('MAX_REPLICAS'))
+    MIN_REPLICAS = int(getenv('MIN_REPLICAS'))
+    MAX_FAILURES = int(getenv('MAX_FAILURES'))
+    SCALING_POLICY = getenv('SCALING_POLICY', 'latency').lower()
+    queue_stats = None
+    queue_policy = None
+    if SCALING_POLICY in ('queue', 'predictive'):
+        queue_stats = RabbitMQQueueStats(
+            management_url=getenv('RABBITMQ_MANAGEMENT_URL', 'http://rabbitmq:15672'),
+            queue_name=getenv('RABBITMQ_QUEUE', 'requests_queue'),
+            username=getenv('RABBITMQ_USERNAME', 'guest'),
+            password=getenv('RABBITMQ_PASSWORD', 'guest'),
+            vhost=getenv('RABBITMQ_VHOST', '/'),
+            session=session
+        )
+        policy_args = dict(
+            min_replicas=MIN_REPLICAS,
+            max_replicas=MAX_REPLICAS,
+            service_rate=float(getenv('SERVICE_RATE_PER_REPLICA', 10)),
+            target_utilization=float(getenv('TARGET_UTILIZATION', 0.8)),
+            drain_time=float(getenv('BACKLOG_DRAIN_SECONDS', 30)),
+            scale_down_window=float(getenv('SCALE_DOWN_WINDOW', 300)),
+            max_step_up=int(getenv('MAX_SCALE_UP_STEP', 0)) or None
+        )
+        if SCALING_POLICY == 'predictive':
+            # 'auto' finds the season from the observed arrival rate; a number of seconds fixes it, 0 disables it
+            season = getenv('FORECAST_SEASON_SECONDS', 'auto')
+            auto_season = season == 'auto'
+            forecaster = HoltWintersForecaster(
+                alpha=float(getenv('FORECAST_ALPHA', 0.5)),
+                beta=float(getenv('FORECAST_BETA', 0.2)),
+                gamma=float(getenv('FORECAST_GAMMA', 0.3)),
+                season_length=0 if auto_season else float(season),
+                season_bucket=COOLDOWN_PERIOD
+            )
+            season_detector = None
+            if auto_season:
+                season_detector = SeasonDetector(COOLDOWN_PERIOD, max_season=float(getenv('FORECAST_MAX_SEASON_SECONDS', 3600)))
+            queue_policy = PredictiveScalingPolicy(
+                decision_interval=COOLDOWN_PERIOD,
+                startup_time=float(getenv('STARTUP_SECONDS', 30)),
+                forecaster=forecaster,
+                max_forecast_error=float(getenv('MAX_FORECAST_ERROR', 0.5)),
+                season_detector=season_detector,
+                **policy_args
+            )
+        else:
+            queue_policy = QueueScalingPolicy(**policy_args)
     autoscaler = AutoScaler(
         prometheus_url=PROMETHEUS_URL,
         moving_average_duration=MOVING_AVERAGE_DURATION,
@@ -189,10 +391,39 @@ def create_autoscaler():
         count_threshold=COUNT_THRESHOLD,
         max_replicas=MAX_REPLICAS,
         min_replicas=MIN_REPLICAS,
-        MAX_FAILURES=MAX_FAILURES
+        MAX_FAILURES=MAX_FAILURES,
+        scaling_policy=SCALING_POLICY,
+        queue_stats=queue_stats,
+        queue_policy=queue_policy,
+        apps_v1=apps_v1,
+        session=session,
+        executor=executor
     )
     return autoscaler
 
+def create_autoscaler_group():
+    """One AutoScaler per deployment in AUTOSCALER_TARGETS (default: DEPLOYMENT_NAME), sharing connections and threads."""
+    env_path = os.path.join(os.path.dirname(__file__), '../.env')
+    load_dotenv(env_path)
+    targets = [name.strip() for name in os.getenv('AUTOSCALER_TARGETS', os.getenv('DEPLOYMENT_NAME', '')).split(',') if name.strip()]
+    # Every decision has up to three requests in flight; size the pools so none of them waits for a connection
+    workers = int(os.getenv('AUTOSCALER_QUERY_WORKERS', 3 * len(targets)))
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    try:
+        config.load_kube_config()
+    except config.ConfigException:
+        config.load_incluster_config()
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = max(configuration.connection_pool_maxsize or 0, workers)
+    apps_v1 = client.AppsV1Api(client.ApiClient(configuration))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+    autoscalers = [create_autoscaler(name, session=session, apps_v1=apps_v1, executor=executor) for name in targets]
+    logger.info(f"Autoscaling {', '.join(f'{a.DEPLOYMENT_NAME} ({a.SCALING_POLICY})' for a in autoscalers)}")
+    return AutoScalerGroup(autoscalers)
+
 
 @app.route('/metrics')
 def metrics():
@@ -205,7 +436,9 @@ def index():
     return "<h1>Hello, Hope all good!</h1>"
 
 if __name__ == "__main__":
-    autoscaler = create_autoscaler()    
+    autoscaler = create_autoscaler_group()
+    # Serve /metrics alongside the scaling loop, which never returns
+    metrics_port = int(os.getenv('METRICS_PORT', 3000))
+    threading.Thread(target=lambda: app.run(host='0.0.0.0', port=metrics_port, threaded=True), daemon=True).start()
     autoscaler.autoscale()
-    app.run(host='0.0.0.0', port=3000)
     
@@ -0,0 +1,213 @@
+import time
+import logging
+from collections import deque
+from queuePolicy import QueueScalingPolicy
+
+logger = logging.getLogger(__name__)
+
+class HoltWintersForecaster:
+    """Additive Holt-Winters on an irregularly sampled rate: level, per-second trend and an optional season.
+
+    With season_length=0 this is Holt's linear trend. With a season (e.g. 86400 for daily traffic) the
+    season is split into buckets of season_bucket seconds, each holding the typical deviation from the
+    level at that point of the cycle, so a ramp that happens every cycle is forecast before it starts.
+    """
+    def __init__(self, alpha=0.5, beta=0.2, gamma=0.3, season_length=0, season_bucket=10):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.season_length = season_length
+        self.season_bucket = season_bucket
+        self.seasonal = {}
+        self.level = None
+        self.trend = 0.0
+        self.last_time = None
+
+    def _bucket(self, at):
+        return int((at % self.season_length) // self.season_bucket)
+
+    def season(self, at):
+        return self.seasonal.get(self._bucket(at), 0.0) if self.season_length else 0.0
+
+    def update(self, at, value):
+        if self.level is None:
+            self.level = value
+            self.last_time = at
+            return
+        dt = at - self.last_time
+        if dt <= 0:
+            return
+        season = self.season(at)
+        level = self.alpha * (value - season) + (1 - self.alpha) * (self.level + self.trend * dt)
+        self.trend = self.beta * (level - self.level) / dt + (1 - self.beta) * self.trend
+        if self.season_length:
+            self.seasonal[self._bucket(at)] = self.gamma * (value - level) + (1 - self.gamma) * season
+        self.level = level
+        self.last_time = at
+
+    def reseason(self, season_length, history):
+        """Switch to a season of season_length seconds, seeding every bucket from (time, value) history."""
+        self.season_length = season_length
+        self.seasonal = {}
+        if not history:
+            return
+        mean = sum(value for _, value in history) / len(history)
+        deviations = {}
+        for at, value in history:
+            deviations.setdefault(self._bucket(at), []).append(value - mean)
+        self.seasonal = {bucket: sum(values) / len(values) for bucket, values in deviations.items()}
+        # The level so far tracked the raw rate; restart it from the deseasonalized recent values
+        recent = [value - self.season(at) for at, value in history if at > history[-1][0] - season_length]
+        self.level = sum(recent) / len(recent)
+
+    def forecast(self, horizon):
+        """Rate expected `horizon` seconds after the last update."""
+        if self.level is None:
+            return None
+        at = self.last_time + horizon
+        return max(0.0, self.level + self.trend * horizon + self.season(at))
+
+class SeasonDetector:
+    """Finds a recurring cycle in a rate sampled once per decision interval, from the autocorrelation of its history.
+
+    Short lags always correlate because the rate is smooth, so the season is the lag of the highest
+    autocorrelation peak after the first negative one, if it reaches min_correlation. A lag needs
+    two full cycles of history, so a cycle is found two cycles after the start at the earliest, and at most
+    2 * max_season seconds of samples are kept. Below min_samples samples, chance peaks in noise reach
+    min_correlation too often, so nothing is detected; a cycle found by chance still only drives decisions
+    once its forecasts score within the policy's max_forecast_error.
+    """
+    def __init__(self, interval, max_season=3600, min_correlation=0.6, min_samples=60):
+        self.interval = interval
+        self.min_correlation = min_correlation
+        self.min_samples = max(4, min_samples)
+        self.samples = deque(maxlen=2 * max(2, int(max_season // interval)))
+
+    def add(self, at, value):
+        self.samples.append((at, value))
+
+    def detect(self):
+        """Season length in seconds, or None when no cycle stands out."""
+        values = [value for _, value in self.samples]
+        n = len(values)
+        if n < self.min_samples:
+            return None
+        mean = sum(values) / n
+        deviations = [value - mean for value in values]
+        variance = sum(d * d for d in deviations) / n
+        if variance == 0:
+            return None
+        correlations = [None] + [
+            sum(deviations[i] * deviations[i + lag] for i in range(n - lag)) / (n - lag) / variance
+            for lag in range(1, n // 2 + 1)
+        ]
+        crossed = next((lag for lag, correlation in enumerate(correlations) if lag and correlation < 0), None)
+        if crossed is None:
+            return None
+        peaks = [
+            (lag, correlations[lag]) for lag in range(crossed + 1, len(correlations))
+            if correlations[lag] >= self.min_correlation and correlations[lag] >= correlations[lag - 1]
+            and (lag + 1 == len(correlations) or correlations[lag] >= correlations[lag + 1])
+        ]
+        if not peaks:
+            return None
+        # Multiples of the season correlate about as well as the season itself; take the shortest
+        best = max(correlation for _, correlation in peaks)
+        lag = next(lag for lag, correlation in peaks if correlation >= best - 0.1)
+        return lag * self.interval
+
+class PredictiveScalingPolicy(QueueScalingPolicy):
+    """QueueScalingPolicy sized for the arrival rate forecast one lead time ahead instead of the current one.
+
+    The lead time is the learned pod startup time plus one decision interval: a replica requested now
+    serves traffic that arrives that much later, so it is sized for that traffic. The startup time is
+    learned from how long ready replicas take to catch up with a scale-up; the per-replica service rate
+    is learned as in QueueScalingPolicy.
+
+    Every forecast is scored once its target time has passed. While the smoothed relative error is above
+    max_forecast_error (or before min_forecast_samples forecasts have been scored), decisions use the
+    current arrival rate alone, i.e. the reactive queue policy. The forecast only ever adds replicas on
+    top of the reactive recommendation, never removes them.
+
+    With a season_detector the forecaster's season is found from the observed rates instead of configured,
+    and re-seeded whenever the detected cycle length changes.
+    """
+    def __init__(self, min_replicas, max_replicas, service_rate, decision_interval, startup_time=30,
+                 forecaster=None, max_forecast_error=0.5, min_forecast_samples=3, error_alpha=0.3,
+                 startup_alpha=0.3, season_detector=None, clock=time.monotonic, **kwargs):
+        super().__init__(min_replicas, max_replicas, service_rate, clock=clock, **kwargs)
+        self.decision_interval = decision_interval
+        self.startup_time = startup_time
+        self.forecaster = forecaster or HoltWintersForecaster()
+        self.max_forecast_error = max_forecast_error
+        self.min_forecast_samples = min_forecast_samples
+        self.error_alpha = error_alpha
+        self.startup_alpha = startup_alpha
+        self.season_detector = season_detector
+        self.forecast_error = None
+        self.forecast_samples = 0
+        self.forecasts = deque()  # (due time, forecast rate)
+        self.scale_ups = []  # (requested at, replicas) waiting for the pods to become ready
+        self.last_forecast = None
+        self.using_forecast = False
+
+    @property
+    def lead_time(self):
+        return self.startup_time + self.decision_interval
+
+    def observe_replicas(self, now, current, ready_replicas):
+        """Learn the startup time from scale-ups whose replicas are now all ready."""
+        if ready_replicas is None:
+            return
+        pending = []
+        for requested_at, replicas in self.scale_ups:
+            if ready_replicas >= replicas:
+                measured = now - requested_at
+                self.startup_time += self.startup_alpha * (measured - self.startup_time)
+                logger.info(f"Pod startup time estimate: {self.startup_time:.1f}s (measured {measured:.1f}s)")
+            elif replicas <= current:
+                pending.append((requested_at, replicas))
+        self.scale_ups = pending
+
+    def score_forecasts(self, now, arrival_rate):
+        while self.forecasts and self.forecasts[0][0] <= now:
+            _, predicted = self.forecasts.popleft()
+            error = abs(predicted - arrival_rate) / max(arrival_rate, 1.0)
+            if self.forecast_error is None:
+                self.forecast_error = error
+            else:
+                self.forecast_error += self.error_alpha * (error - self.forecast_error)
+            self.forecast_samples += 1
+
+    def forecast_trusted(self):
+        return (self.forecast_samples >= self.min_forecast_samples
+                and self.forecast_error is not None and self.forecast_error <= self.max_forecast_error)
+
+    def desired_replicas(self, current, arrival_rate, ready, ready_replicas=None):
+        now = self.clock()
+        self.observe_replicas(now, current, ready_replicas)
+        self.score_forecasts(now, arrival_rate)
+        self.forecaster.update(now, arrival_rate)
+        if self.season_detector is not None:
+            self.season_detector.add(now, arrival_rate)
+            season = self.season_detector.detect()
+            if season and season != self.forecaster.season_length:
+                logger.info(f"Detected a {season:.0f}s cycle in the arrival rate")
+                self.forecaster.reseason(season, list(self.season_detector.samples))
+
+        lead_time = self.lead_time
+        self.last_forecast = self.forecaster.forecast(lead_time)
+        self.forecasts.append((now + lead_time, self.last_forecast))
+        self.using_forecast = self.forecast_trusted()
+        if self.using_forecast:
+            planned_rate = max(arrival_rate, self.last_forecast)
+        else:
+            planned_rate = arrival_rate
+        logger.info(f"Arrival rate {arrival_rate:.2f}/s, forecast {self.last_forecast:.2f}/s in {lead_time:.0f}s, "
+                    f"error {self.forecast_error if self.forecast_error is not None else float('nan'):.2f}, "
+                    f"{'predictive' if self.using_forecast else 'reactive'}")
+
+        desired = super().desired_replicas(current, planned_rate, ready)
+        if desired > current:
+            self.scale_ups.append((now, desired))
+        return desired
@@ -0,0 +1,101 @@
+import math
+import time
+import logging
+from collections import deque
+from urllib.parse import quote
+import requests
+
+logger = logging.getLogger(__name__)
+
+class QueueStats:
+    def __init__(self, depth, ready, unacked, publish_rate, ack_rate, consumers):
+        self.depth = depth
+        self.ready = ready
+        self.unacked = unacked
+        self.publish_rate = publish_rate
+        self.ack_rate = ack_rate
+        self.consumers = consumers
+
+    def __repr__(self):
+        return (f"QueueStats(depth={self.depth}, ready={self.ready}, unacked={self.unacked}, "
+                f"publish_rate={self.publish_rate:.2f}/s, ack_rate={self.ack_rate:.2f}/s, consumers={self.consumers})")
+
+class RabbitMQQueueStats:
+    """Reads queue depth and message rates from the RabbitMQ management API (GET /api/queues/{vhost}/{name})."""
+    def __init__(self, management_url, queue_name, username='guest', password='guest', vhost='/', timeout=5, session=None):
+        self.url = f"{management_url.rstrip('/')}/api/queues/{quote(vhost, safe='')}/{quote(queue_name, safe='')}"
+        self.auth = (username, password)
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def fetch(self):
+        try:
+            response = self.session.get(self.url, auth=self.auth, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Error reading RabbitMQ queue stats: {e}")
+            return None
+        stats = data.get('message_stats', {})
+        return QueueStats(
+            depth=data.get('messages', 0),
+            ready=data.get('messages_ready', 0),
+            unacked=data.get('messages_unacknowledged', 0),
+            publish_rate=stats.get('publish_details', {}).get('rate', 0.0),
+            ack_rate=stats.get('ack_details', {}).get('rate', 0.0),
+            consumers=data.get('consumers', 0)
+        )
+
+class QueueScalingPolicy:
+    """Sizes a consumer deployment from its queue: enough replicas to keep up with arrivals and drain the backlog.
+
+    desired = ceil((arrival_rate + ready / drain_time) / (service_rate * target_utilization))
+
+    service_rate is messages/s per replica. It is learned as an EWMA of measured throughput per replica,
+    but only while messages are waiting (ready > 0), because an idle consumer's throughput is the arrival
+    rate rather than its capacity. Scale-up applies at once, any number of replicas (at most max_step_up
+    if set). Scale-down uses the highest recommendation of the last scale_down_window seconds, so a short
+    lull does not remove replicas that are needed again shortly after.
+    """
+    def __init__(self, min_replicas, max_replicas, service_rate, target_utilization=0.8, drain_time=30,
+                 scale_down_window=300, max_step_up=None, service_rate_alpha=0.3, clock=time.monotonic):
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.service_rate = service_rate
+        self.target_utilization = target_utilization
+        self.drain_time = drain_time
+        self.scale_down_window = scale_down_window
+        self.max_step_up = max_step_up
+        self.service_rate_alpha = service_rate_alpha
+        self.clock = clock
+        self.recommendations = deque()
+
+    def observe_throughput(self, throughput, replicas, ready):
+        """Fold a measured total throughput (messages/s across replicas) into the per-replica service rate."""
+        if throughput is None or replicas <= 0 or ready <= 0 or throughput <= 0:
+            return
+        measured = throughput / replicas
+        self.service_rate += self.service_rate_alpha * (measured - self.service_rate)
+        logger.info(f"Per-replica service rate estimate: {self.service_rate:.2f} msg/s (measured {measured:.2f})")
+
+    def recommend(self, arrival_rate, ready):
+        """Replicas needed for the current arrival rate plus draining `ready` messages within drain_time."""
+        demand = arrival_rate + ready / self.drain_time
+        capacity = self.service_rate * self.target_utilization
+        replicas = math.ceil(demand / capacity) if capacity > 0 else self.max_replicas
+        return max(self.min_replicas, min(replicas, self.max_replicas))
+
+    def desired_replicas(self, current, arrival_rate, ready, ready_replicas=None):
+        now = self.clock()
+        recommendation = self.recommend(arrival_rate, ready)
+        self.recommendations.append((now, recommendation))
+        while self.recommendations and self.recommendations[0][0] < now - self.scale_down_window:
+            self.recommendations.popleft()
+
+        if recommendation > current:
+            if self.max_step_up:
+                return min(recommendation, current + self.max_step_up)
+            return recommendation
+        # Scale down only as far as the highest recommendation inside the stabilization window
+        stabilized = max(r for _, r in self.recommendations)
+        return min(current, stabilized)
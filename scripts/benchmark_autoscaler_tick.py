@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from simulate_autoscaler import load_autoscaler_module
+
+
+class SlowBackend(BaseHTTPRequestHandler):
+    """Answers Prometheus instant queries and RabbitMQ queue lookups after a fixed delay."""
+    delay = 0.05
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if self.path.startswith('/api/queues/'):
+            data = {'messages': 40, 'messages_ready': 40, 'messages_unacknowledged': 0, 'consumers': 2,
+                    'message_stats': {'publish_details': {'rate': 30.0}, 'ack_details': {'rate': 20.0}}}
+        else:
+            data = {'status': 'success', 'data': {'resultType': 'vector', 'result': [{'metric': {}, 'value': [time.time(), '0.15']}]}}
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SlowAppsV1:
+    """Deployment reads and scale patches that take as long as a round trip to the API server."""
+    def __init__(self, delay):
+        self.delay = delay
+        self.replicas = {}
+
+    def read_namespaced_deployment(self, name, namespace):
+        time.sleep(self.delay)
+        replicas = self.replicas.get(name, 2)
+        return SimpleNamespace(spec=SimpleNamespace(replicas=replicas), status=SimpleNamespace(ready_replicas=replicas))
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body):
+        time.sleep(self.delay)
+
+
+def build_group(module, url, targets, queue_targets, delay, concurrent):
+    os.environ.update({
+        'PROMETHEUS_URL': url, 'RABBITMQ_MANAGEMENT_URL': url, 'MOVING_AVERAGE_DURATION': '1m', 'COOLDOWN_PERIOD': '30',
+        'NAMESPACE': 'default', 'LATENCY_THRESHOLD_UP': '0.2', 'LATENCY_THRESHOLD_DOWN': '0.1', 'COUNT_THRESHOLD': '20',
+        'MAX_REPLICAS': '8', 'MIN_REPLICAS': '1', 'MAX_FAILURES': '3',
+    })
+    names = [f"app-{i}" for i in range(targets)]
+    for name in names[:queue_targets]:
+        os.environ[f"{name.upper().replace('-', '_')}_SCALING_POLICY"] = 'queue'
+    apps_v1 = SlowAppsV1(delay)
+    if concurrent:
+        executor = ThreadPoolExecutor(max_workers=3 * targets)
+        autoscalers = [module.create_autoscaler(name, apps_v1=apps_v1, executor=executor) for name in names]
+        return module.AutoScalerGroup(autoscalers)
+    # Before: one decision after another, each waiting for its queries in turn
+    autoscalers = [module.create_autoscaler(name, apps_v1=apps_v1) for name in names]
+    return SimpleNamespace(tick=lambda: [autoscaler.tick() for autoscaler in autoscalers])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time one autoscaler tick over several targets against backends with a fixed round trip.")
+    parser.add_argument('--targets', type=int, default=5)
+    parser.add_argument('--queue-targets', type=int, default=2, help="How many of the targets use the queue policy")
+    parser.add_argument('--rtt', type=float, default=0.05, help="Seconds per Prometheus, RabbitMQ or Kubernetes request")
+    parser.add_argument('--ticks', type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    SlowBackend.delay = args.rtt
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowBackend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    module = load_autoscaler_module()
+    for concurrent in (False, True):
+        group = build_group(module, url, args.targets, args.queue_targets, args.rtt, concurrent)
+        group.tick()  # open the connections
+        timings = []
+        for _ in range(args.ticks):
+            start = time.perf_counter()
+            group.tick()
+            timings.append(time.perf_counter() - start)
+        print(f"{'concurrent' if concurrent else 'sequential'}: {args.targets} targets, median tick {statistics.median(timings) * 1000:.0f} ms "
+              f"({statistics.median(timings) / args.rtt:.1f} round trips)")
+    server.shutdown()
+    sys.exit(0)
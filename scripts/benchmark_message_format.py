@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../app'))
+
+import time
+import argparse
+from messageEnvelope import encode_message, encode_legacy_message, decode_message
+
+
+def time_per_message(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def benchmark(image_bytes, iterations):
+    legacy_body = encode_legacy_message(1, image_bytes)
+    binary_body, binary_properties = encode_message(1, image_bytes, 'image/jpeg')
+
+    class LegacyProperties:
+        headers = None
+
+    results = {
+        'legacy_bytes': len(legacy_body.encode('utf-8')),
+        'binary_bytes': len(binary_body),
+        'legacy_encode_s': time_per_message(lambda: encode_legacy_message(1, image_bytes), iterations),
+        'binary_encode_s': time_per_message(lambda: encode_message(1, image_bytes, 'image/jpeg'), iterations),
+        'legacy_decode_s': time_per_message(lambda: decode_message(legacy_body, LegacyProperties), iterations),
+        'binary_decode_s': time_per_message(lambda: decode_message(binary_body, binary_properties), iterations),
+    }
+    return results
+
+
+if __name__ == "__main__":
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Compare the legacy JSON message format with the binary envelope.")
+    parser.add_argument('--image', default=dir_path + '/../data/sampleImages/n01440764_tench.JPEG')
+    parser.add_argument('--size-kb', type=int, default=None, help="Use random bytes of this size instead of an image file")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.size_kb:
+        image_bytes = os.urandom(args.size_kb * 1024)
+    else:
+        with open(args.image, 'rb') as f:
+            image_bytes = f.read()
+
+    r = benchmark(image_bytes, args.iterations)
+    print(f"Image size: {len(image_bytes)} bytes")
+    print(f"Message size   legacy: {r['legacy_bytes']} bytes, binary: {r['binary_bytes']} bytes "
+          f"({100.0 * (r['legacy_bytes'] - r['binary_bytes']) / r['legacy_bytes']:.1f}% saved)")
+    print(f"Encode time    legacy: {r['legacy_encode_s'] * 1e6:.1f} us, binary: {r['binary_encode_s'] * 1e6:.1f} us")
+    print(f"Decode time    legacy: {r['legacy_decode_s'] * 1e6:.1f} us, binary: {r['binary_decode_s'] * 1e6:.1f} us")
+    saved = (r['legacy_encode_s'] + r['legacy_decode_s']) - (r['binary_encode_s'] + r['binary_decode_s'])
+    print(f"CPU saved per message (encode + decode): {saved * 1e6:.1f} us")
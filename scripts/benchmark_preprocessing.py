@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../app'))
+
+import io
+import time
+import argparse
+import torch
+from PIL import Image
+from torchvision import transforms
+from preprocessing import ImagePreprocessor, normalize_mode, flatten_to_rgb
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 960), (1920, 1080), (4032, 3024)]
+
+torchvision_preprocess = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+])
+
+
+def synthetic_image(width, height, mode, image_format):
+    """Smooth random image encoded as image_format; a stand-in for a photo of the given resolution."""
+    image = Image.merge('RGB', [Image.effect_noise((max(1, width // 16), max(1, height // 16)), 64).convert('L') for _ in range(3)])
+    image = image.resize((width, height), Image.BICUBIC).convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def baseline(data):
+    image = Image.open(io.BytesIO(data))
+    return torchvision_preprocess(flatten_to_rgb(normalize_mode(image)))
+
+
+def time_per_image(fn, data, iterations):
+    fn(data)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(data)
+    return (time.perf_counter() - start) / iterations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode + preprocess time per image by input resolution.")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--formats', nargs='+', default=['JPEG:RGB', 'PNG:RGBA', 'JPEG:L', 'GIF:P'],
+                        help="FORMAT:MODE pairs to generate test images with")
+    args = parser.parse_args()
+
+    preprocessor = ImagePreprocessor()
+
+    def fast(data):
+        return preprocessor.to_tensor([Image.open(io.BytesIO(data))])[0]
+
+    print(f"{'input':>22s} {'torchvision ms':>15s} {'fast ms':>9s} {'speedup':>8s} {'mean abs diff':>14s}")
+    for spec in args.formats:
+        image_format, mode = spec.split(':')
+        for width, height in RESOLUTIONS:
+            data = synthetic_image(width, height, mode, image_format)
+            diff = (baseline(data) - fast(data)).abs().mean().item()
+            slow_s = time_per_image(baseline, data, args.iterations)
+            fast_s = time_per_image(fast, data, args.iterations)
+            label = f"{image_format}/{mode} {width}x{height}"
+            print(f"{label:>22s} {slow_s * 1000:15.2f} {fast_s * 1000:9.2f} {slow_s / fast_s:7.1f}x {diff:14.4f}")
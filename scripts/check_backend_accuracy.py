@@ -0,0 +1,50 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../app'))
+
+import time
+import argparse
+from classifier import ImageClassifier, BACKENDS, load_sample_images
+
+
+def time_per_image(classifier, images, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        classifier.predict_batch(images[i:i + batch_size], topk=1)
+    return (time.perf_counter() - start) / len(images)
+
+
+if __name__ == "__main__":
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Compare top-1 agreement and speed of inference backends against eager fp32.")
+    parser.add_argument('--model-path', default=dir_path + '/../models/resnet18.pth')
+    parser.add_argument('--label-path', default=dir_path + '/../data/imagenet_classes.txt')
+    parser.add_argument('--images', default=dir_path + '/../data/sampleImages')
+    parser.add_argument('--calibration-dir', default=None, help="Defaults to --images")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--channels-last', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--min-agreement', type=float, default=0.98)
+    args = parser.parse_args()
+
+    images = load_sample_images(args.images)
+    print(f"Loaded {len(images)} images from {args.images}")
+    reference = ImageClassifier(model_path=args.model_path, label_path=args.label_path)
+    reference_time = time_per_image(reference, images, args.batch_size)
+
+    failed = False
+    for backend in args.backends:
+        classifier = ImageClassifier(
+            model_path=args.model_path,
+            label_path=args.label_path,
+            backend=backend,
+            channels_last=args.channels_last,
+            calibration_dir=args.calibration_dir or args.images
+        )
+        agreement = classifier.top1_agreement(reference, images, args.batch_size)
+        per_image = time_per_image(classifier, images, args.batch_size)
+        ok = agreement >= args.min_agreement
+        failed = failed or not ok
+        print(f"{backend:18s} top-1 agreement {agreement:6.1%}  {per_image * 1000:7.2f} ms/image  "
+              f"speedup x{reference_time / per_image:4.2f}  {'OK' if ok else 'BELOW THRESHOLD'}")
+    sys.exit(1 if failed else 0)
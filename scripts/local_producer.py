@@ -0,0 +1,181 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../app'))
+
+import json
+import time
+import queue
+import random
+import logging
+import argparse
+import threading
+import itertools
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+
+class InMemoryPostgres:
+    """Stands in for PostgresConnectionManager with the queries the producer issues on the /predict and /results?id= paths.
+
+    Rows live in a dict keyed by id; workers write results back through complete(). Any other query, such as
+    the paginated /results listing, raises NotImplementedError.
+    """
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        self.sequence = itertools.count(1)
+        self.rows = {}
+        self.image_results = {}
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute_query(self, query, params=None, retry=None):
+        with self.lock:
+            if 'nextval' in query:
+                return [(next(self.sequence),) for _ in range(params[0])]
+            if query.startswith('SELECT id, status, label, confidence FROM classification_requests WHERE id'):
+                row = self.rows.get(params[0])
+                return [(params[0], row['status'], row['label'], row['confidence'])] if row else []
+            if 'FROM image_results' in query:
+                return [self.image_results[params[0]]] if params[0] in self.image_results else []
+            if query.startswith("UPDATE classification_requests SET status = 'FAILED'"):
+                request_ids = params[0] if isinstance(params[0], (list, tuple)) else [params[0]]
+                for request_id in request_ids:
+                    row = self.rows.get(request_id)
+                    if row is not None and row['status'] == 'PENDING':
+                        row.update(status='FAILED', label='unknown', confidence=0)
+                return None
+        raise NotImplementedError(f"InMemoryPostgres does not serve: {query}")
+
+    def execute_values(self, query, rows, template=None, page_size=1000, fetch=False):
+        if not query.startswith('INSERT INTO classification_requests'):
+            raise NotImplementedError(f"InMemoryPostgres does not serve: {query}")
+        with self.lock:
+            for request_id, status, label, confidence, created_at, _ in rows:
+                self.rows[request_id] = {'status': status, 'label': label, 'confidence': confidence, 'createdAt': created_at}
+
+    def complete(self, request_id, status, label, confidence, image_hash=None):
+        """Write a worker's result, as the consumer's ResultWriter does."""
+        with self.lock:
+            row = self.rows.get(request_id)
+            if row is not None:
+                row.update(status=status, label=label, confidence=confidence, updated=datetime.now(timezone.utc))
+            if image_hash and status == 'PROCESSED':
+                self.image_results[image_hash] = (label, confidence)
+
+
+class InMemoryBroker:
+    """Stands in for RabbitMQPublisher, RabbitMQ and the workers.
+
+    Publishes are confirmed at once and queued; `workers` threads each take `service_time` seconds per
+    message (exponentially distributed when `jitter` is set), answer direct reply-to callers like the
+    consumer does, and write the result to the database, or mark it FAILED with probability `failure_rate`.
+    """
+    def __init__(self, database, workers=4, service_time=0.05, jitter=False, failure_rate=0.0):
+        self.database = database
+        self.workers = workers
+        self.service_time = service_time
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.messages = queue.Queue()
+        self.replies = {}
+        self.replies_lock = threading.Lock()
+        self.correlation_ids = itertools.count(1)
+
+    def start(self, timeout=30):
+        for index in range(self.workers):
+            threading.Thread(target=self.work, name=f"worker-{index}", daemon=True).start()
+
+    def publish(self, body, properties=None, routing_key=None):
+        self.messages.put((body, properties))
+        confirm = Future()
+        confirm.set_result(None)
+        return confirm
+
+    def withdraw(self, future):
+        return False
+
+    def publish_rpc(self, body, properties, routing_key=None):
+        properties.correlation_id = str(next(self.correlation_ids))
+        properties.reply_to = 'amq.rabbitmq.reply-to'
+        reply = Future()
+        reply.correlation_id = properties.correlation_id
+        with self.replies_lock:
+            self.replies[properties.correlation_id] = reply
+        return self.publish(body, properties), reply
+
+    def cancel_rpc(self, reply):
+        with self.replies_lock:
+            self.replies.pop(reply.correlation_id, None)
+
+    def close(self):
+        pass
+
+    def work(self):
+        from messageEnvelope import decode_message
+        while True:
+            body, properties = self.messages.get()
+            request_id, _ = decode_message(body, properties)
+            headers = properties.headers or {}
+            delay = random.expovariate(1 / self.service_time) if self.jitter else self.service_time
+            time.sleep(delay)
+            if random.random() < self.failure_rate:
+                self.database.complete(request_id, 'FAILED', 'unknown', 0)
+                continue
+            topk = int(headers.get('x-topk', 1))
+            results = [(f"class_{rank}", round(1.0 / (rank + 1), 3)) for rank in range(topk)]
+            if properties.reply_to:
+                with self.replies_lock:
+                    reply = self.replies.pop(properties.correlation_id, None)
+                if reply is not None:
+                    reply.set_result(json.dumps({
+                        'id': request_id, 'status': 'PROCESSED', 'label': results[0][0], 'confidence': results[0][1],
+                        'topk': [{'label': label, 'confidence': confidence} for label, confidence in results]
+                    }))
+            self.database.complete(request_id, 'PROCESSED', results[0][0], results[0][1], headers.get('x-content-hash'))
+
+
+def load_app(broker_options, environ=None):
+    """Import the real app/app.py with its Postgres pool and RabbitMQ publisher replaced by the in-memory stand-ins.
+
+    Ingest is forced to the batched writer, since the ORM path needs a real database, and result
+    notifications are off, since they need LISTEN; /results?wait= then answers at once.
+    """
+    import postgresConnector
+    import rabbitmqPublisher
+    os.environ.update(environ or {})
+    os.environ.update({'INGEST_MODE': 'batched', 'RESULT_NOTIFY_ENABLED': 'false'})
+    database = InMemoryPostgres()
+    broker = InMemoryBroker(database, **broker_options)
+    originals = (postgresConnector.PostgresConnectionManager, rabbitmqPublisher.RabbitMQPublisher)
+    postgresConnector.PostgresConnectionManager = lambda *args, **kwargs: database
+    rabbitmqPublisher.RabbitMQPublisher = lambda *args, **kwargs: broker
+    try:
+        import app
+    finally:
+        postgresConnector.PostgresConnectionManager, rabbitmqPublisher.RabbitMQPublisher = originals
+    return app, database, broker
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the real producer (app/app.py) with Postgres, RabbitMQ and the workers "
+                                                 "replaced by in-memory stand-ins, for running the load generator locally.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--service-time', type=float, default=0.05, help="Seconds one worker spends per message")
+    parser.add_argument('--jitter', action='store_true', help="Exponentially distributed service times")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    app, _, _ = load_app(dict(workers=args.workers, service_time=args.service_time, jitter=args.jitter,
+                              failure_rate=args.failure_rate))
+    # One access log line per request would slow the producer down more than anything being measured
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    print(f"app.py on http://{args.host}:{args.port} with {args.workers} in-memory worker(s) at "
+          f"{args.service_time * 1000:.0f} ms per message, capacity {args.workers / args.service_time:.0f} req/s", flush=True)
+    app.app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,293 @@
+import os
+import io
+import re
+import csv
+import sys
+import json
+import math
+import time
+import random
+import struct
+import asyncio
+import argparse
+import aiohttp
+
+PHASES = ('enqueue', 'queued', 'end_to_end', 'schedule_lag')
+FINAL_STATUSES = ('PROCESSED', 'FAILED')
+
+
+class LatencyHistogram:
+    """HDR-style histogram: log-spaced buckets with a bounded relative error, so memory does not grow with the sample count.
+
+    Values are recorded in seconds; a bucket covers [b^i, b^(i+1)) with b = 1 + 2 * precision, and
+    reported percentiles are the bucket midpoints, within `precision` of the true value.
+    """
+    def __init__(self, precision=0.01, lowest=1e-6):
+        self.base = math.log(1 + 2 * precision)
+        self.lowest = lowest
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, value):
+        value = max(value, self.lowest)
+        index = int(math.log(value / self.lowest) / self.base)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        running = 0
+        for index in sorted(self.buckets):
+            running += self.buckets[index]
+            if running >= rank:
+                midpoint = self.lowest * math.exp((index + 0.5) * self.base)
+                return min(max(midpoint, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'min': self.min,
+            'mean': self.total / self.count,
+            'p50': self.percentile(0.50),
+            'p90': self.percentile(0.90),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+            'max': self.max
+        }
+
+
+def load_workload(file_path):
+    with open(file_path) as f:
+        return [int(float(x)) for x in f.read().split()]
+
+
+def load_images(folder, synthetic=8):
+    """JPEG/PNG bytes from `folder`, or `synthetic` random JPEGs when the folder does not exist."""
+    if os.path.isdir(folder):
+        images = []
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    images.append((name, f.read()))
+        if images:
+            return images
+    from PIL import Image
+    images = []
+    for i in range(synthetic):
+        buffer = io.BytesIO()
+        Image.effect_noise((320, 240), 64 + 16 * i).convert('RGB').save(buffer, 'JPEG', quality=90)
+        images.append((f"synthetic_{i}.jpg", buffer.getvalue()))
+    return images
+
+
+def make_unique(image, index):
+    """Insert a JPEG comment carrying `index` after SOI so every upload has a different hash and misses the result cache."""
+    if not image.startswith(b'\xff\xd8'):
+        return image
+    comment = f"loadtest {index}".encode('ascii')
+    return image[:2] + b'\xff\xfe' + struct.pack('>H', len(comment) + 2) + comment + image[2:]
+
+
+def schedule(workload, arrivals):
+    """Send offsets in seconds: workload[i] requests inside second i, evenly spaced or as a Poisson process."""
+    offsets = []
+    for second, count in enumerate(workload):
+        if arrivals == 'poisson':
+            offsets.extend(sorted(second + random.random() for _ in range(count)))
+        else:
+            offsets.extend(second + (i + 0.5) / count for i in range(count))
+    return offsets
+
+
+def parse_request_id(data):
+    if 'id' in data:
+        return int(data['id'])
+    match = re.search(r'Request id:\s*(\d+)', data.get('msg', ''))
+    return int(match.group(1)) if match else None
+
+
+class OpenLoopLoadTester:
+    """Sends requests at their scheduled times whatever the number in flight, then follows each one to its result.
+
+    Latencies are measured from the scheduled send time rather than the actual one, so a client that
+    falls behind adds its lag to the results instead of hiding it (coordinated omission); the lag
+    itself is reported as schedule_lag.
+    """
+    def __init__(self, base_url, images, unique, poll_interval, result_wait, result_timeout, topk, connections):
+        self.base_url = base_url.rstrip('/')
+        self.images = images
+        self.unique = unique
+        self.poll_interval = poll_interval
+        self.result_wait = result_wait
+        self.result_timeout = result_timeout
+        self.topk = topk
+        self.connections = connections
+        self.histograms = {phase: LatencyHistogram() for phase in PHASES}
+        self.outcomes = {}
+        self.records = []
+
+    def count(self, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    async def run(self, offsets):
+        connector = aiohttp.TCPConnector(limit=self.connections)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            loop = asyncio.get_running_loop()
+            start = loop.time() + 0.5
+            tasks = []
+            for index, offset in enumerate(offsets):
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self.request(session, index, start + offset)))
+            await asyncio.gather(*tasks)
+
+    async def request(self, session, index, scheduled):
+        loop = asyncio.get_running_loop()
+        record = {'index': index, 'request_id': None, 'http_status': None, 'status': None,
+                  'enqueue': None, 'queued': None, 'end_to_end': None, 'schedule_lag': loop.time() - scheduled}
+        self.records.append(record)
+        self.histograms['schedule_lag'].record(record['schedule_lag'])
+
+        name, image = self.images[index % len(self.images)]
+        if self.unique:
+            image = make_unique(image, index)
+        form = aiohttp.FormData()
+        form.add_field('image', image, filename=name, content_type='image/png' if name.lower().endswith('.png') else 'image/jpeg')
+        try:
+            async with session.post(f"{self.base_url}/predict", data=form, params={'topk': self.topk}) as response:
+                record['http_status'] = response.status
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            record['status'] = f"error: {type(e).__name__}"
+            self.count('enqueue_error')
+            return
+        accepted = loop.time()
+        record['enqueue'] = accepted - scheduled
+        self.histograms['enqueue'].record(record['enqueue'])
+        request_id = parse_request_id(data) if record['http_status'] == 200 else None
+        if request_id is None:
+            record['status'] = f"rejected: {data.get('header') or data.get('error') or record['http_status']}"
+            self.count('rejected')
+            return
+        record['request_id'] = request_id
+
+        status = await self.wait_for_result(session, request_id, accepted)
+        finished = loop.time()
+        record['status'] = status
+        self.count(status.lower())
+        if status in FINAL_STATUSES:
+            record['queued'] = finished - accepted
+            record['end_to_end'] = finished - scheduled
+            self.histograms['queued'].record(record['queued'])
+            self.histograms['end_to_end'].record(record['end_to_end'])
+
+    async def wait_for_result(self, session, request_id, accepted):
+        """Long-poll /results with ?wait= where the server supports it, otherwise poll every poll_interval."""
+        loop = asyncio.get_running_loop()
+        params = {'id': request_id, 'format': 'json', 'wait': int(self.result_wait * 1000)}
+        while loop.time() - accepted < self.result_timeout:
+            asked = loop.time()
+            try:
+                async with session.get(f"{self.base_url}/results", params=params, headers={'Accept': 'application/json'}) as response:
+                    data = await response.json(content_type=None) if response.status in (200, 404) else {}
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                data = {}
+            if data.get('status') in FINAL_STATUSES:
+                return data['status']
+            # Server answered at once (no long polling, or an error): back off before asking again
+            if loop.time() - asked < self.result_wait / 2:
+                await asyncio.sleep(self.poll_interval)
+        return 'TIMEOUT'
+
+    def report(self, duration, offsets):
+        return {
+            'target': self.base_url,
+            'scheduled_requests': len(offsets),
+            'duration_seconds': duration,
+            'offered_rate': len(offsets) / offsets[-1] if offsets and offsets[-1] else 0.0,
+            'outcomes': self.outcomes,
+            'latency_seconds': {phase: histogram.summary() for phase, histogram in self.histograms.items()}
+        }
+
+
+def write_summary_csv(path, report):
+    fields = ['phase', 'count', 'min', 'mean', 'p50', 'p90', 'p95', 'p99', 'p999', 'max']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for phase, summary in report['latency_seconds'].items():
+            writer.writerow({'phase': phase, **summary})
+
+
+def write_requests_csv(path, records):
+    fields = ['index', 'request_id', 'http_status', 'status', 'schedule_lag', 'enqueue', 'queued', 'end_to_end']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for record in sorted(records, key=lambda r: r['index']):
+            writer.writerow(record)
+
+
+if __name__ == "__main__":
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Open-loop load generator: follows a per-second workload exactly and measures "
+                                                 "enqueue, queueing and end-to-end classification latency.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Producer base URL (the app or scripts/local_producer.py)")
+    parser.add_argument('--workload', default=dir_path + '/../data/workload.txt')
+    parser.add_argument('--duration', type=int, default=None, help="Only replay the first N seconds of the workload")
+    parser.add_argument('--load-scale', type=float, default=1.0, help="Multiply every per-second request count")
+    parser.add_argument('--arrivals', default='uniform', choices=['uniform', 'poisson'], help="Spacing of requests within a second")
+    parser.add_argument('--images', default=dir_path + '/../data/sampleImages', help="Folder of images to upload (random JPEGs if missing)")
+    parser.add_argument('--unique', action='store_true', help="Make every upload distinct so none is answered from the result cache")
+    parser.add_argument('--topk', type=int, default=1)
+    parser.add_argument('--result-wait', type=float, default=5.0, help="Long-poll wait per /results call, seconds")
+    parser.add_argument('--poll-interval', type=float, default=0.1, help="Polling interval when the server does not long-poll")
+    parser.add_argument('--result-timeout', type=float, default=300.0, help="Give up on a request this long after it was accepted")
+    parser.add_argument('--connections', type=int, default=1000, help="Client connection limit; keep it above the expected concurrency")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output-json', default=None, help="Write the summary report as JSON")
+    parser.add_argument('--output-csv', default=None, help="Write per-phase percentiles as CSV")
+    parser.add_argument('--requests-csv', default=None, help="Write one row per request as CSV")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workload = load_workload(args.workload)[:args.duration]
+    workload = [round(count * args.load_scale) for count in workload]
+    offsets = schedule(workload, args.arrivals)
+    images = load_images(args.images)
+    print(f"Sending {len(offsets)} requests over {len(workload)} s to {args.url} ({len(images)} images, {args.arrivals} arrivals)")
+
+    tester = OpenLoopLoadTester(args.url, images, args.unique, args.poll_interval, args.result_wait,
+                                args.result_timeout, args.topk, args.connections)
+    started = time.perf_counter()
+    asyncio.run(tester.run(offsets))
+    report = tester.report(time.perf_counter() - started, offsets)
+
+    print(f"Outcomes: {report['outcomes']}")
+    for phase, summary in report['latency_seconds'].items():
+        if summary['count']:
+            print(f"{phase:>12}: n={summary['count']} p50 {summary['p50'] * 1000:.1f} ms, p95 {summary['p95'] * 1000:.1f} ms, "
+                  f"p99 {summary['p99'] * 1000:.1f} ms, max {summary['max'] * 1000:.1f} ms")
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.output_csv:
+        write_summary_csv(args.output_csv, report)
+    if args.requests_csv:
+        write_requests_csv(args.requests_csv, tester.records)
+    finished = report['outcomes'].get('processed', 0) + report['outcomes'].get('failed', 0)
+    sys.exit(0 if finished == len(offsets) else 1)
@@ -0,0 +1,306 @@
+import sys
+import os
+AUTOSCALER_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../autoscaler')
+sys.path.append(AUTOSCALER_DIR)
+
+import re
+import logging
+import argparse
+import itertools
+import importlib.util
+from types import SimpleNamespace
+from queuePolicy import QueueStats, QueueScalingPolicy
+from forecastPolicy import HoltWintersForecaster, PredictiveScalingPolicy, SeasonDetector
+
+# Cap on the modelled latency of a second in which no replica is ready
+MAX_LATENCY = 60.0
+
+# Same defaults as the autoscaler's environment variables
+DEFAULT_PARAMS = {
+    'MOVING_AVERAGE_DURATION': '1m', 'COOLDOWN_PERIOD': 30, 'LATENCY_THRESHOLD_UP': 0.20,
+    'LATENCY_THRESHOLD_DOWN': 0.1, 'COUNT_THRESHOLD': 20, 'MAX_REPLICAS': 8, 'MIN_REPLICAS': 1, 'MAX_FAILURES': 3,
+    'SERVICE_RATE_PER_REPLICA': 10.0, 'TARGET_UTILIZATION': 0.8, 'BACKLOG_DRAIN_SECONDS': 30, 'SCALE_DOWN_WINDOW': 300,
+    'STARTUP_SECONDS': 30.0, 'FORECAST_ALPHA': 0.5, 'FORECAST_BETA': 0.2, 'FORECAST_GAMMA': 0.3,
+    'FORECAST_SEASON_SECONDS': 'auto', 'FORECAST_MAX_SEASON_SECONDS': 3600.0, 'MAX_FORECAST_ERROR': 0.5
+}
+
+
+def load_autoscaler_module():
+    """Import autoscaler/autoscaler-request.py, whose hyphenated name rules out a normal import."""
+    spec = importlib.util.spec_from_file_location('autoscaler_request', os.path.join(AUTOSCALER_DIR, 'autoscaler-request.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_duration(duration):
+    match = re.fullmatch(r'(\d+)([smh])', duration)
+    if not match:
+        raise ValueError(f"Unsupported duration: {duration}")
+    return int(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600}[match.group(2)]
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SimulatedCluster:
+    """Fluid queueing model of one deployment plus the two AppsV1Api calls the autoscaler makes.
+
+    Each ready replica serves service_rate requests/s. Requests that cannot be served wait in a shared
+    backlog. A new replica only becomes ready startup_time seconds after the scale request. A request's
+    latency is its service time, plus the time to drain the backlog ahead of it, plus an M/M/c-style
+    waiting term that grows as utilization approaches 1.
+    """
+    def __init__(self, clock, service_rate, startup_time, initial_replicas):
+        self.clock = clock
+        self.service_rate = service_rate
+        self.startup_time = startup_time
+        self.pods = [0.0] * initial_replicas  # ready_at time of each pod
+        self.backlog = 0.0
+        self.history = []  # (arrivals, completed, latency, provisioned, ready) per simulated second
+        self.scale_events = []  # (time, old_replicas, new_replicas)
+
+    def ready_replicas(self):
+        return sum(1 for ready_at in self.pods if ready_at <= self.clock.now)
+
+    def read_namespaced_deployment(self, name, namespace):
+        return SimpleNamespace(spec=SimpleNamespace(replicas=len(self.pods)), status=SimpleNamespace(ready_replicas=self.ready_replicas()))
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body):
+        replicas = body['spec']['replicas']
+        old = len(self.pods)
+        if replicas > old:
+            self.pods.extend([self.clock.now + self.startup_time] * (replicas - old))
+        elif replicas < old:
+            # Pods that are still starting are removed first
+            self.pods = sorted(self.pods)[:replicas]
+        if replicas != old:
+            self.scale_events.append((self.clock.now, old, replicas))
+
+    def step(self, arrivals):
+        ready = self.ready_replicas()
+        capacity = ready * self.service_rate
+        completed = min(self.backlog + arrivals, capacity)
+        self.backlog = self.backlog + arrivals - completed
+        if capacity <= 0:
+            latency = MAX_LATENCY
+        else:
+            service_time = 1.0 / self.service_rate
+            utilization = min(arrivals / capacity, 0.99)
+            queueing = service_time * utilization / (1 - utilization) / ready
+            latency = min(service_time + queueing + self.backlog / capacity, MAX_LATENCY)
+        self.history.append((arrivals, completed, latency, len(self.pods), ready))
+
+
+class FakeResponse:
+    def __init__(self, value):
+        self.value = value
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        result = [] if self.value is None else [{'metric': {}, 'value': [0, str(self.value)]}]
+        return {'status': 'success', 'data': {'resultType': 'vector', 'result': result}}
+
+
+class FakePrometheus:
+    """Answers the autoscaler's PromQL queries from the simulated history instead of real scrapes."""
+    def __init__(self, cluster, moving_average_duration):
+        self.cluster = cluster
+        self.window = parse_duration(moving_average_duration)
+
+    def get(self, url, params=None, timeout=None):
+        query = params['query']
+        history = self.cluster.history
+        if not history:
+            return FakeResponse(None)
+        if 'request_latency_seconds_sum' in query:
+            return FakeResponse(self.max_moving_average_latency())
+        if 'request_latency_seconds_count' in query:
+            recent = history[-60:]
+            return FakeResponse(sum(h[0] for h in recent) / len(recent))
+        if 'consumer_messages_processed_total' in query:
+            recent = history[-60:]
+            return FakeResponse(sum(h[1] for h in recent) / len(recent))
+        return FakeResponse(None)
+
+    def max_moving_average_latency(self):
+        """max_over_time(rate(sum)/rate(count) over the moving-average window)[1m:], weighted by requests."""
+        history = self.cluster.history
+        best = None
+        for end in range(max(1, len(history) - 59), len(history) + 1):
+            window = history[max(0, end - self.window):end]
+            requests = sum(h[0] for h in window)
+            if requests:
+                average = sum(h[0] * h[2] for h in window) / requests
+                best = average if best is None else max(best, average)
+        return best
+
+
+class FakeQueueStats:
+    """RabbitMQ management API stand-in for the 'queue' policy, with a 5 s smoothed publish rate."""
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def fetch(self):
+        recent = self.cluster.history[-5:] or [(0, 0, 0, 0, 0)]
+        backlog = int(self.cluster.backlog)
+        return QueueStats(depth=backlog, ready=backlog, unacked=0,
+                          publish_rate=sum(h[0] for h in recent) / len(recent),
+                          ack_rate=sum(h[1] for h in recent) / len(recent), consumers=self.cluster.ready_replicas())
+
+
+def percentile(values_with_weights, fraction):
+    total = sum(weight for _, weight in values_with_weights)
+    if not total:
+        return 0.0
+    running = 0
+    for value, weight in sorted(values_with_weights):
+        running += weight
+        if running >= fraction * total:
+            return value
+    return values_with_weights[-1][0]
+
+
+def simulate(module, arrivals, params, policy, service_rate, startup_time, slo):
+    clock = SimClock()
+    cluster = SimulatedCluster(clock, service_rate, startup_time, params['MIN_REPLICAS'])
+    queue_stats = queue_policy = None
+    if policy in ('queue', 'predictive'):
+        queue_stats = FakeQueueStats(cluster)
+        policy_args = dict(
+            min_replicas=params['MIN_REPLICAS'], max_replicas=params['MAX_REPLICAS'],
+            service_rate=params['SERVICE_RATE_PER_REPLICA'], target_utilization=params['TARGET_UTILIZATION'],
+            drain_time=params['BACKLOG_DRAIN_SECONDS'], scale_down_window=params['SCALE_DOWN_WINDOW'], clock=clock.monotonic
+        )
+        if policy == 'predictive':
+            auto_season = params['FORECAST_SEASON_SECONDS'] == 'auto'
+            forecaster = HoltWintersForecaster(
+                alpha=params['FORECAST_ALPHA'], beta=params['FORECAST_BETA'], gamma=params['FORECAST_GAMMA'],
+                season_length=0 if auto_season else float(params['FORECAST_SEASON_SECONDS']), season_bucket=params['COOLDOWN_PERIOD']
+            )
+            season_detector = SeasonDetector(params['COOLDOWN_PERIOD'], float(params['FORECAST_MAX_SEASON_SECONDS'])) if auto_season else None
+            queue_policy = PredictiveScalingPolicy(
+                decision_interval=params['COOLDOWN_PERIOD'], startup_time=params['STARTUP_SECONDS'], forecaster=forecaster,
+                max_forecast_error=params['MAX_FORECAST_ERROR'], season_detector=season_detector, **policy_args
+            )
+        else:
+            queue_policy = QueueScalingPolicy(**policy_args)
+    autoscaler = module.AutoScaler(
+        prometheus_url='http://prometheus.sim',
+        moving_average_duration=params['MOVING_AVERAGE_DURATION'],
+        cooldown_period=params['COOLDOWN_PERIOD'],
+        deployment_name='simulated',
+        namespace='default',
+        latency_threshold_up=params['LATENCY_THRESHOLD_UP'],
+        latency_threshold_down=params['LATENCY_THRESHOLD_DOWN'],
+        count_threshold=params['COUNT_THRESHOLD'],
+        max_replicas=params['MAX_REPLICAS'],
+        min_replicas=params['MIN_REPLICAS'],
+        MAX_FAILURES=params['MAX_FAILURES'],
+        scaling_policy=policy,
+        queue_stats=queue_stats,
+        queue_policy=queue_policy,
+        apps_v1=cluster,
+        session=FakePrometheus(cluster, params['MOVING_AVERAGE_DURATION']),
+        clock=clock
+    )
+
+    next_tick = params['COOLDOWN_PERIOD']
+    forecast_decisions = decisions = 0
+    for count in arrivals:
+        if clock.now >= next_tick:
+            autoscaler.tick()
+            next_tick += params['COOLDOWN_PERIOD']
+            decisions += 1
+            forecast_decisions += bool(getattr(queue_policy, 'using_forecast', False))
+        cluster.step(count)
+        clock.now += 1
+
+    history = cluster.history
+    requests = sum(h[0] for h in history)
+    violating = [h for h in history if h[2] > slo]
+    directions = [1 if new > old else -1 for _, old, new in cluster.scale_events]
+    latencies = [(h[2], h[0]) for h in history]
+    return {
+        'requests': requests,
+        'slo_violation_seconds': len(violating),
+        'slo_violation_ratio': sum(h[0] for h in violating) / requests if requests else 0.0,
+        'p50_latency': percentile(latencies, 0.50),
+        'p95_latency': percentile(latencies, 0.95),
+        'p99_latency': percentile(latencies, 0.99),
+        'replica_seconds': sum(h[3] for h in history),
+        'max_replicas': max(h[3] for h in history),
+        'scale_events': len(cluster.scale_events),
+        'oscillations': sum(1 for a, b in zip(directions, directions[1:]) if a != b),
+        'final_backlog': cluster.backlog,
+        'forecast_share': forecast_decisions / decisions if decisions else 0.0,
+        'forecast_error': getattr(queue_policy, 'forecast_error', None),
+        'startup_estimate': getattr(queue_policy, 'startup_time', None),
+        'history': history
+    }
+
+
+def parse_grid(specs):
+    """['COOLDOWN_PERIOD=15,30', 'LATENCY_THRESHOLD_UP=0.2,0.3'] -> list of parameter overrides."""
+    axes = []
+    for spec in specs:
+        key, values = spec.split('=', 1)
+        axes.append([(key, value) for value in values.split(',')])
+    return [dict(combination) for combination in itertools.product(*axes)] if axes else [{}]
+
+
+if __name__ == "__main__":
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Replay a per-second workload against the real AutoScaler decision logic "
+                                                 "with a simulated cluster and Prometheus.")
+    parser.add_argument('--workload', default=dir_path + '/../data/workload.txt')
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the workload this many times back to back")
+    parser.add_argument('--load-scale', type=float, default=1.0, help="Multiply every arrival count")
+    parser.add_argument('--policy', default='latency', choices=['latency', 'queue', 'predictive'])
+    parser.add_argument('--service-rate', type=float, default=12.0, help="Requests/s one ready replica serves")
+    parser.add_argument('--startup-time', type=float, default=20.0, help="Seconds from a scale-up to the new replica being ready")
+    parser.add_argument('--slo', type=float, default=0.5, help="Latency SLO in seconds")
+    parser.add_argument('--set', nargs='*', default=[], metavar='KEY=VALUE', help="Override a policy parameter")
+    parser.add_argument('--grid', nargs='*', default=[], metavar='KEY=V1,V2', help="Sweep policy parameters")
+    args = parser.parse_args()
+
+    def with_overrides(params, overrides):
+        params = dict(params)
+        for key, value in overrides.items():
+            if key not in params:
+                raise SystemExit(f"Unknown parameter {key}; expected one of {sorted(params)}")
+            params[key] = type(params[key])(value)
+        return params
+
+    base = with_overrides(DEFAULT_PARAMS, dict(item.split('=', 1) for item in args.set))
+    with open(args.workload) as f:
+        trace = [float(value) * args.load_scale for value in f.read().split()]
+    arrivals = trace * args.repeat
+
+    module = load_autoscaler_module()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"Simulating {len(arrivals)} s ({len(arrivals) / 3600:.2f} h) of traffic, {sum(arrivals):.0f} requests, "
+          f"policy {args.policy}, {args.service_rate} req/s per replica, {args.startup_time} s startup, SLO {args.slo} s")
+    for overrides in parse_grid(args.grid):
+        params = with_overrides(base, overrides)
+        r = simulate(module, arrivals, params, args.policy, args.service_rate, args.startup_time, args.slo)
+        label = ' '.join(f"{k}={v}" for k, v in overrides.items()) or 'defaults'
+        print(f"{label}: SLO violations {r['slo_violation_seconds']} s ({r['slo_violation_ratio']:.1%} of requests), "
+              f"p50/p95/p99 {r['p50_latency']:.2f}/{r['p95_latency']:.2f}/{r['p99_latency']:.2f} s, "
+              f"{r['replica_seconds']:.0f} replica-seconds (max {r['max_replicas']}), "
+              f"{r['scale_events']} scale events, {r['oscillations']} oscillations, backlog left {r['final_backlog']:.0f}")
+        if args.policy == 'predictive':
+            error = 'n/a' if r['forecast_error'] is None else f"{r['forecast_error']:.2f}"
+            print(f"    forecast used in {r['forecast_share']:.0%} of decisions, forecast error {error}, "
+                  f"learned startup {r['startup_estimate']:.1f} s")
@@ -0,0 +1,104 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../app'))
+
+import io
+import time
+import uuid
+import argparse
+import threading
+import logging
+
+
+class SlowClassifier:
+    """Stands in for ImageClassifier: every forward pass takes `delay` seconds and returns a fixed label."""
+    def __init__(self, delay):
+        self.delay = delay
+
+    def prepare(self, image):
+        return image
+
+    def predict_prepared(self, prepared, topk=5):
+        time.sleep(self.delay)
+        return [[('slow', 1.0)] for _ in prepared]
+
+    def predict_batch(self, images, topk=5):
+        return self.predict_prepared(images, topk)
+
+    def predict(self, image, topk=5):
+        return self.predict_prepared([image], topk)[0]
+
+
+class InMemoryDatabase:
+    """Records result writes instead of sending them to Postgres."""
+    def __init__(self):
+        self.written = set()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        pass
+
+    def execute_values(self, query, rows, template=None, page_size=1000, fetch=False):
+        if 'UPDATE' in query:
+            with self.lock:
+                self.written.update(row[0] for row in rows)
+
+    def execute_query(self, query, params=None, retry=True):
+        with self.lock:
+            self.written.add(params[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consume messages with an artificially slow model against a local RabbitMQ "
+                                                 "(e.g. docker run -p 5672:5672 rabbitmq:3) and report heartbeat losses.")
+    parser.add_argument('--mode', default='pipeline', choices=['single', 'batch', 'pipeline'])
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=8.0, help="Seconds per forward pass")
+    parser.add_argument('--heartbeat', type=int, default=2, help="Heartbeat interval requested from the broker")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    queue_name = f"slow-model-{uuid.uuid4().hex[:8]}"
+    os.environ.update({
+        'CONSUMER_MODE': args.mode,
+        'RABBITMQ_QUEUE': queue_name,
+        'RABBITMQ_HEARTBEAT': str(args.heartbeat),
+        'BATCH_SIZE': '4',
+        'WRITE_BATCH_SIZE': '4',
+    })
+    logging.basicConfig(level=logging.WARNING)
+
+    import pika
+    from PIL import Image
+    import consumer
+    from messageEnvelope import encode_message
+
+    consumer.classifier = SlowClassifier(args.delay)
+    consumer.db_manager = InMemoryDatabase()
+
+    connection = pika.BlockingConnection(consumer.rabbitmq_manager.parameters)
+    channel = connection.channel()
+    channel.queue_declare(queue=queue_name, durable=True)
+    image = io.BytesIO()
+    Image.new('RGB', (32, 32)).save(image, 'JPEG')
+    for request_id in range(1, args.messages + 1):
+        body, properties = encode_message(request_id, image.getvalue(), 'image/jpeg')
+        channel.basic_publish(exchange='', routing_key=queue_name, body=body, properties=properties)
+    print(f"Published {args.messages} messages to {queue_name}; each forward pass takes {args.delay}s, heartbeat {args.heartbeat}s")
+
+    threading.Thread(target=consumer.start_consuming, daemon=True).start()
+
+    start = time.time()
+    while time.time() - start < args.timeout:
+        connection.process_data_events(time_limit=1)
+        remaining = channel.queue_declare(queue=queue_name, passive=True).method.message_count
+        if remaining == 0 and len(consumer.db_manager.written) >= args.messages:
+            break
+    channel.queue_delete(queue=queue_name)
+    connection.close()
+
+    drops = consumer.CONNECTION_DROPS._value.get()
+    redeliveries = consumer.REDELIVERIES._value.get()
+    print(f"Mode {args.mode}: {len(consumer.db_manager.written)}/{args.messages} written in {time.time() - start:.1f}s, "
+          f"{drops:.0f} connection drops, {redeliveries:.0f} redeliveries")
+    sys.exit(0 if drops == 0 and redeliveries == 0 else 1)
@@ -0,0 +1,86 @@
+import json
+import time
+import argparse
+import threading
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class QueueModel:
+    """Queue whose arrivals follow a per-second trace and which drains at a fixed rate."""
+    def __init__(self, arrivals, drain_rate, unacked):
+        self.arrivals = arrivals
+        self.drain_rate = drain_rate
+        self.unacked = unacked
+        self.ready = 0.0
+        self.second = 0
+        self.lock = threading.Lock()
+
+    def tick(self):
+        with self.lock:
+            arrivals = self.arrivals[self.second % len(self.arrivals)]
+            self.ready = max(0.0, self.ready + arrivals - self.drain_rate)
+            self.second += 1
+
+    def snapshot(self, name, vhost):
+        with self.lock:
+            publish_rate = self.arrivals[(self.second - 1) % len(self.arrivals)] if self.second else 0.0
+            ack_rate = min(self.drain_rate, publish_rate + self.ready)
+            ready = int(self.ready)
+        return {
+            'name': name,
+            'vhost': vhost,
+            'messages': ready + self.unacked,
+            'messages_ready': ready,
+            'messages_unacknowledged': self.unacked,
+            'consumers': 1,
+            'message_stats': {
+                'publish_details': {'rate': float(publish_rate)},
+                'ack_details': {'rate': float(ack_rate)}
+            }
+        }
+
+
+def make_handler(model):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            if len(parts) != 4 or parts[:2] != ['api', 'queues']:
+                self.send_error(404)
+                return
+            body = json.dumps(model.snapshot(unquote(parts[3]), unquote(parts[2]))).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in for the RabbitMQ management API queue endpoint, for running the autoscaler locally.")
+    parser.add_argument('--port', type=int, default=15672)
+    parser.add_argument('--workload', default=None, help="Per-second arrival counts, e.g. data/workload.txt")
+    parser.add_argument('--publish-rate', type=float, default=10.0, help="Constant arrival rate when no workload is given")
+    parser.add_argument('--drain-rate', type=float, default=20.0, help="Messages/s the consumers remove from the queue")
+    parser.add_argument('--unacked', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.workload:
+        with open(args.workload) as f:
+            arrivals = [float(value) for value in f.read().split()]
+    else:
+        arrivals = [args.publish_rate]
+    model = QueueModel(arrivals, args.drain_rate, args.unacked)
+
+    def advance():
+        while True:
+            time.sleep(1)
+            model.tick()
+    threading.Thread(target=advance, daemon=True).start()
+
+    print(f"Serving /api/queues/<vhost>/<queue> on port {args.port}")
+    ThreadingHTTPServer(('0.0.0.0', args.port), make_handler(model)).serve_forever()
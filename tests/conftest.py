@@ -0,0 +1,85 @@
+import os
+import sys
+import importlib
+import importlib.util
+import pytest
+from prometheus_client import REGISTRY
+
+# The app and autoscaler modules import each other by bare module name, as they do inside their images
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+sys.path.insert(0, os.path.join(ROOT, 'autoscaler'))
+
+def clear_default_registry():
+    """Drop every collector from the default Prometheus registry.
+
+    app.py, asyncApp.py, consumer.py and the autoscaler each register the same request metrics at import
+    time, so whatever an earlier test module registered has to go before the next one is imported.
+    """
+    for collector in list(REGISTRY._collector_to_names):
+        REGISTRY.unregister(collector)
+
+def import_entry_point(name, patches=(), environ=None):
+    """Import app.py, asyncApp.py or consumer.py once per session.
+
+    patches are (module, attribute, replacement) triples and environ extra environment variables, both
+    applied only while the module is imported, for things the entry point reads or builds at import time.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    clear_default_registry()
+    originals = [(module, attribute, getattr(module, attribute)) for module, attribute, _ in patches]
+    saved_environ = dict(os.environ)
+    for module, attribute, replacement in patches:
+        setattr(module, attribute, replacement)
+    os.environ.update(environ or {})
+    try:
+        return importlib.import_module(name)
+    finally:
+        for module, attribute, original in originals:
+            setattr(module, attribute, original)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+
+def import_autoscaler():
+    """Import autoscaler/autoscaler-request.py, whose hyphenated name rules out a normal import."""
+    if 'autoscaler_request' in sys.modules:
+        return sys.modules['autoscaler_request']
+    clear_default_registry()
+    spec = importlib.util.spec_from_file_location('autoscaler_request', os.path.join(ROOT, 'autoscaler', 'autoscaler-request.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['autoscaler_request'] = module
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def database_url():
+    """URL of a throwaway PostgreSQL database with the app's schema freshly created in it.
+
+    Tests that need one are skipped unless TEST_DATABASE_URL is set; every table is dropped afterwards.
+    """
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy import create_engine, make_url
+    from models import db
+    engine = create_engine(make_url(url).set(drivername='postgresql+psycopg2'))
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    yield url
+    db.metadata.drop_all(engine)
+    engine.dispose()
+
+@pytest.fixture
+def db_manager(database_url):
+    """A PostgresConnectionManager pooling connections to the TEST_DATABASE_URL database."""
+    from psycopg2.extensions import parse_dsn
+    from postgresConnector import PostgresConnectionManager
+    dsn = parse_dsn(database_url)
+    manager = PostgresConnectionManager(
+        host=dsn.get('host', 'localhost'), port=int(dsn.get('port', 5432)), user=dsn.get('user'),
+        password=dsn.get('password'), database=dsn['dbname'], max_retries=1, max_pool_size=2
+    )
+    manager.connect()
+    yield manager
+    manager.close()
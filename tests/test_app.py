@@ -0,0 +1,417 @@
+import io
+import tarfile
+import zipfile
+import json
+import time
+import threading
+import pytest
+from concurrent.futures import Future
+from PIL import Image
+
+import postgresConnector
+import rabbitmqPublisher
+from conftest import import_entry_point
+from requestWriter import INSERT_REQUESTS_QUERY
+from resultNotifier import ResultNotifier
+from constants import RESULTS_NOTIFY_CHANNEL
+from stageTracing import read_stage_times
+
+
+class FakeDatabase:
+    """Just enough of PostgresConnectionManager for the producer's own queries."""
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.rows = {}
+        self.cache = {}
+
+    def connect(self):
+        pass
+
+    def execute_query(self, query, params=None, retry=None):
+        with self.lock:
+            if 'nextval' in query:
+                start, self.sequence = self.sequence, self.sequence + params[0]
+                return [(i,) for i in range(start + 1, self.sequence + 1)]
+            if query.startswith('SELECT id, status, label, confidence FROM classification_requests WHERE id'):
+                row = self.rows.get(params[0])
+                return [(params[0], row['status'], row['label'], row['confidence'])] if row else []
+            if 'FROM image_results' in query:
+                return [self.cache[params[0]]] if params[0] in self.cache else []
+            if query.startswith("UPDATE classification_requests SET status = 'FAILED'"):
+                if self.rows[params[0]]['status'] == 'PENDING':
+                    self.rows[params[0]].update(status='FAILED', label='unknown', confidence=0)
+                return None
+        raise NotImplementedError(query)
+
+    def execute_values(self, query, rows, template=None, page_size=1000, fetch=False):
+        assert query == INSERT_REQUESTS_QUERY
+        with self.lock:
+            for request_id, status, label, confidence, created_at, _ in rows:
+                self.rows[request_id] = {'status': status, 'label': label, 'confidence': confidence, 'createdAt': created_at}
+
+
+class FakePublisher:
+    """Resolves confirms according to outcome: 'ack', 'nack' or 'timeout' (never confirmed).
+
+    Outcomes queued in outcomes apply to the next publishes, in order, before falling back to outcome.
+    RPC publishes are answered with reply, unless it is None or the publish was not acked.
+    """
+    def __init__(self, *args, **kwargs):
+        self.outcome = 'ack'
+        self.outcomes = []
+        self.published = []
+        self.withdrawn = []
+        self.reply = None
+        self.cancelled = []
+
+    def start(self):
+        pass
+
+    def publish(self, body, properties=None, routing_key=None):
+        future = Future()
+        self.published.append((body, properties))
+        outcome = self.outcomes.pop(0) if self.outcomes else self.outcome
+        if outcome == 'ack':
+            future.set_result(len(self.published))
+        elif outcome == 'nack':
+            future.set_exception(RuntimeError("RabbitMQ rejected the message (basic.nack)"))
+        return future
+
+    def withdraw(self, future):
+        self.withdrawn.append(future)
+        return True
+
+    def publish_rpc(self, body, properties, routing_key=None):
+        confirm = self.publish(body, properties, routing_key)
+        reply = Future()
+        reply.correlation_id = len(self.published)
+        if self.reply is not None and confirm.done() and confirm.exception() is None:
+            reply.set_result(json.dumps(self.reply))
+        return confirm, reply
+
+    def cancel_rpc(self, reply):
+        self.cancelled.append(reply.correlation_id)
+
+
+app = import_entry_point('app', [
+    (postgresConnector, 'PostgresConnectionManager', FakeDatabase),
+    (rabbitmqPublisher, 'RabbitMQPublisher', FakePublisher),
+], environ={'INGEST_MODE': 'batched', 'RESULT_NOTIFY_ENABLED': 'false'})
+
+
+@pytest.fixture
+def database():
+    app.db_manager.rows.clear()
+    app.db_manager.cache.clear()
+    app.result_cache.local.entries.clear()
+    return app.db_manager
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    publisher = FakePublisher()
+    monkeypatch.setattr(app, 'rabbitmq_publisher', publisher)
+    monkeypatch.setattr(app, 'publish_confirm_timeout', 0.05)
+    return publisher
+
+
+@pytest.fixture
+def notifier(monkeypatch):
+    """A notifier that is never started; tests deliver notifications to it by hand."""
+    notifier = ResultNotifier(app.db_manager, RESULTS_NOTIFY_CHANNEL)
+    monkeypatch.setattr(app, 'result_notifier', notifier)
+    return notifier
+
+
+def notify_when_waiting(notifier, payload):
+    """Dispatch payload from another thread as soon as a client subscribes to its request."""
+    def dispatch():
+        while int(payload['id']) not in notifier.waiters:
+            threading.Event().wait(0.005)
+        notifier._dispatch(payload)
+    thread = threading.Thread(target=dispatch, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def png(color='orange'):
+    output = io.BytesIO()
+    Image.new('RGB', (16, 16), color).save(output, format='PNG')
+    return output.getvalue()
+
+
+def tar_of(files):
+    output = io.BytesIO()
+    with tarfile.open(fileobj=output, mode='w') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return output.getvalue()
+
+
+def zip_of(files):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return output.getvalue()
+
+
+def post_image(client, data, path='/predict'):
+    return client.post(path, data={'image': (io.BytesIO(data), 'image.png')}, content_type='multipart/form-data')
+
+
+def test_predict_publishes_once_the_row_is_committed(client, database, publisher):
+    response = post_image(client, png())
+    assert response.status_code == 200
+    (request_id, row), = database.rows.items()
+    assert row['status'] == 'PENDING'
+    body, properties = publisher.published[0]
+    assert body == png()
+    assert properties.headers['x-request-id'] == request_id
+
+
+def test_published_message_carries_the_producer_stage_times(client, database, publisher):
+    before = time.time()
+    post_image(client, png())
+    _, properties = publisher.published[0]
+    times = read_stage_times(properties)
+    assert list(times) == ['received', 'persisted', 'published']
+    assert before <= times['received'] <= times['persisted'] <= times['published'] <= time.time()
+
+
+@pytest.mark.parametrize('outcome', ['timeout', 'nack'])
+def test_unconfirmed_publish_is_withdrawn_and_its_row_failed(client, database, publisher, outcome):
+    publisher.outcome = outcome
+    response = post_image(client, png())
+    assert response.status_code == 400
+    assert response.get_json()['header'] == 'RabbitMQ Error'
+    assert len(publisher.withdrawn) == 1
+    (row,) = database.rows.values()
+    assert row['status'] == 'FAILED'
+
+
+def test_cached_result_skips_the_broker(client, database, publisher):
+    database.cache[app.content_hash(png())] = ('tabby', 0.9)
+    response = post_image(client, png())
+    assert response.status_code == 200
+    assert publisher.published == []
+    (row,) = database.rows.values()
+    assert (row['status'], row['label']) == ('PROCESSED', 'tabby')
+
+
+def test_invalid_images_are_rejected_before_anything_is_stored(client, database, publisher):
+    response = post_image(client, b'not an image')
+    assert response.status_code == 400
+    assert database.rows == {} and publisher.published == []
+
+
+def test_batch_reports_errors_per_image(client, database, publisher):
+    response = client.post('/predict/batch', data={'image': [
+        (io.BytesIO(png('red')), 'red.png'),
+        (io.BytesIO(b'not an image'), 'broken.png'),
+        (io.BytesIO(png('blue')), 'blue.png'),
+    ]}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['accepted'] == 2
+    assert [(item['filename'], item['status']) for item in data['results']] == [('red.png', 200), ('broken.png', 400), ('blue.png', 200)]
+    assert 'id' not in data['results'][1]
+    assert sorted(database.rows) == sorted(item['id'] for item in data['results'] if item['status'] == 200)
+    assert [body for body, _ in publisher.published] == [png('red'), png('blue')]
+
+
+@pytest.mark.parametrize('content_type, pack', [('application/x-tar', tar_of), ('application/zip', zip_of)])
+def test_batch_accepts_an_archive_body(client, database, publisher, content_type, pack):
+    files = {'a.png': png('red'), 'b.png': png('green')}
+    response = client.post('/predict/batch', data=pack(files), content_type=content_type)
+    assert response.status_code == 200
+    assert [item['filename'] for item in response.get_json()['results']] == ['a.png', 'b.png']
+    assert [body for body, _ in publisher.published] == list(files.values())
+
+
+def test_batch_accepts_archive_parts_next_to_images(client, database, publisher):
+    response = client.post('/predict/batch', data={
+        'image': (io.BytesIO(png('red')), 'red.png'),
+        'archive': (io.BytesIO(zip_of({'b.png': png('blue')})), 'more.zip'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert [item['filename'] for item in response.get_json()['results']] == ['red.png', 'b.png']
+    assert len(database.rows) == 2
+
+
+@pytest.mark.parametrize('content_type, pack', [('application/x-tar', tar_of), ('application/zip', zip_of)])
+def test_batch_archive_with_too_many_files_is_rejected_before_anything_is_stored(client, database, publisher, monkeypatch, content_type, pack):
+    monkeypatch.setattr(app, 'max_batch_items', 2)
+    files = {f'{i}.png': png() for i in range(3)}
+    response = client.post('/predict/batch', data=pack(files), content_type=content_type)
+    assert response.status_code == 413
+    assert database.rows == {} and publisher.published == []
+
+
+def test_batch_archive_unpacking_past_the_byte_limit_is_rejected(client, database, publisher, monkeypatch):
+    # Zeros compress well, so the archive is small while its files are not
+    archive = zip_of({'a.png': png(), 'padding.bin': bytes(1024 * 1024)})
+    monkeypatch.setattr(app, 'max_batch_bytes', 512 * 1024)
+    response = client.post('/predict/batch', data=archive, content_type='application/zip')
+    assert response.status_code == 413
+    assert database.rows == {} and publisher.published == []
+
+
+def test_batch_body_past_the_content_length_limit_is_rejected(client, database, publisher, monkeypatch):
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    response = client.post('/predict/batch', data=tar_of({'a.png': png(), 'b.bin': bytes(4096)}), content_type='application/x-tar')
+    assert response.status_code == 413
+    assert database.rows == {} and publisher.published == []
+
+
+def test_batch_withdraws_and_fails_only_the_unconfirmed_images(client, database, publisher):
+    publisher.outcomes = ['ack', 'timeout', 'nack']
+    response = client.post('/predict/batch', data=tar_of({'a.png': png('red'), 'b.png': png('green'), 'c.png': png('blue')}), content_type='application/x-tar')
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [item['status'] for item in results] == [200, 400, 400]
+    assert len(publisher.withdrawn) == 2
+    assert [database.rows[item['id']]['status'] for item in results] == ['PENDING', 'FAILED', 'FAILED']
+
+
+@pytest.mark.parametrize('query', ['id=abc', 'id=-4', 'id=99999999999', 'id=7&wait=soon', 'limit=ten', 'cursor=bad', 'status=LOST'])
+def test_results_rejects_malformed_arguments(client, query):
+    response = client.get(f"/results?{query}&format=json")
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def pending_request(database, request_id=7):
+    database.rows[request_id] = {'status': 'PENDING', 'label': None, 'confidence': None}
+    return request_id
+
+
+def test_long_poll_returns_when_the_result_is_notified(client, database, notifier):
+    request_id = pending_request(database)
+    notify_when_waiting(notifier, {'id': request_id, 'status': 'PROCESSED', 'label': 'tabby', 'confidence': 0.9})
+    response = client.get(f"/results?id={request_id}&wait=5000")
+    assert response.status_code == 200
+    assert response.get_json() == {'id': request_id, 'status': 'PROCESSED', 'label': 'tabby'}
+    assert notifier.waiters == {}
+
+
+def test_long_poll_gives_up_with_the_pending_row(client, database, notifier):
+    request_id = pending_request(database)
+    response = client.get(f"/results?id={request_id}&wait=50")
+    assert response.get_json()['status'] == 'PENDING'
+
+
+def test_stream_sends_keepalives_then_the_result(client, database, notifier, monkeypatch):
+    monkeypatch.setattr(app, 'sse_keepalive', 0.01)
+    request_id = pending_request(database)
+
+    def dispatch_later():
+        threading.Event().wait(0.1)
+        notifier._dispatch({'id': request_id, 'status': 'FAILED', 'label': 'unknown', 'confidence': 0})
+    threading.Thread(target=dispatch_later, daemon=True).start()
+
+    response = client.get(f"/results/stream?id={request_id}")
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert body.startswith(': keep-alive\n\n')
+    event = body.split('\n\n')[-2]
+    assert event.splitlines()[0] == 'event: result'
+    assert json.loads(event.splitlines()[1][len('data: '):])['status'] == 'FAILED'
+
+
+def test_stream_resync_rereads_the_row(client, database, notifier):
+    request_id = pending_request(database)
+
+    def finish_while_disconnected():
+        while request_id not in notifier.waiters:
+            threading.Event().wait(0.005)
+        database.rows[request_id].update(status='PROCESSED', label='tabby', confidence=0.9)
+        notifier._resync_all()
+    threading.Thread(target=finish_while_disconnected, daemon=True).start()
+
+    body = client.get(f"/results/stream?id={request_id}").get_data(as_text=True)
+    assert body.startswith('event: result')
+    assert '"label": "tabby"' in body
+
+
+def test_stream_times_out_with_the_pending_row(client, database, notifier):
+    request_id = pending_request(database)
+    body = client.get(f"/results/stream?id={request_id}&timeout=0.05").get_data(as_text=True)
+    assert body.startswith('event: timeout')
+
+
+def test_stream_of_an_unknown_request_is_not_found(client, database, notifier):
+    assert client.get("/results/stream?id=404").status_code == 404
+
+
+@pytest.mark.parametrize('query', ['', 'id=abc', 'id=0', 'id=7&timeout=soon', 'id=7&timeout=nan'])
+def test_stream_rejects_malformed_arguments(client, database, notifier, query):
+    pending_request(database)
+    response = client.get(f"/results/stream?{query}")
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_stream_is_unavailable_without_notifications(client, database):
+    assert client.get(f"/results/stream?id={pending_request(database)}").status_code == 503
+
+
+def test_wait_returns_the_workers_reply(client, database, publisher):
+    publisher.reply = {'id': 1, 'status': 'PROCESSED', 'label': 'tabby', 'confidence': 0.9, 'topk': []}
+    response = client.post('/predict?wait=1000&topk=3', data={'image': (io.BytesIO(png()), 'image.png')}, content_type='multipart/form-data')
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['msg'].startswith('Prediction completed') and data['result']['label'] == 'tabby'
+    (_, properties), = publisher.published
+    assert properties.headers['x-topk'] == 3
+
+
+def test_wait_without_a_reply_answers_asynchronously_and_forgets_the_reply(client, database, publisher):
+    response = client.post('/predict?wait=20', data={'image': (io.BytesIO(png()), 'image.png')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.get_json()['msg'].startswith('Prediction request received')
+    assert list(database.rows) == [response.get_json()['id']]
+    assert publisher.cancelled == [1]
+
+
+@pytest.mark.parametrize('outcome', ['timeout', 'nack'])
+def test_wait_with_an_unconfirmed_publish_forgets_the_reply_and_fails_the_row(client, database, publisher, outcome):
+    publisher.outcome = outcome
+    response = client.post('/predict?wait=1000', data={'image': (io.BytesIO(png()), 'image.png')}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert publisher.cancelled == [1] and len(publisher.withdrawn) == 1
+    (row,) = database.rows.values()
+    assert row['status'] == 'FAILED'
+
+
+def test_wait_on_a_cached_image_returns_the_cached_result(client, database, publisher):
+    database.cache[app.content_hash(png())] = ('tabby', 0.9)
+    response = client.post('/predict?wait=1000', data={'image': (io.BytesIO(png()), 'image.png')}, content_type='multipart/form-data')
+    data = response.get_json()
+    assert data['msg'].startswith('Prediction completed')
+    assert data['result'] == {'id': data['id'], 'status': 'PROCESSED', 'label': 'tabby', 'confidence': 0.9,
+                              'topk': [{'label': 'tabby', 'confidence': 0.9}]}
+    assert publisher.published == []
+
+
+def test_wait_for_several_predictions_goes_past_the_cache(client, database, publisher):
+    database.cache[app.content_hash(png())] = ('tabby', 0.9)
+    publisher.reply = {'id': 1, 'status': 'PROCESSED', 'label': 'tabby', 'confidence': 0.9, 'topk': []}
+    response = client.post('/predict?wait=1000&topk=2', data={'image': (io.BytesIO(png()), 'image.png')}, content_type='multipart/form-data')
+    assert response.get_json()['msg'].startswith('Prediction completed')
+    assert len(publisher.published) == 1
+
+
+@pytest.mark.parametrize('query', ['wait=soon', 'wait=inf', 'topk=many', 'topk=1.5'])
+def test_predict_rejects_malformed_arguments(client, database, publisher, query):
+    response = client.post(f'/predict?{query}', data={'image': (io.BytesIO(png()), 'image.png')}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert database.rows == {} and publisher.published == []
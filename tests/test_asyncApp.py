@@ -0,0 +1,145 @@
+import io
+import asyncio
+import pytest
+from PIL import Image
+
+asyncpg = pytest.importorskip('asyncpg')
+pytest.importorskip('aio_pika')
+pytest.importorskip('quart')
+from werkzeug.datastructures import FileStorage
+
+from conftest import import_entry_point
+from stageTracing import read_stage_times
+
+asyncApp = import_entry_point('asyncApp')
+
+
+class FakePool:
+    """The asyncpg pool calls asyncApp.predict makes, against an in-memory table."""
+    def __init__(self):
+        self.rows = {}
+        self.cache = {}
+
+    async def fetchrow(self, query, *args):
+        if 'FROM image_results' in query:
+            return self.cache.get(args[0])
+        raise NotImplementedError(query)
+
+    async def fetchval(self, query, status, label, confidence, now):
+        request_id = len(self.rows) + 1
+        self.rows[request_id] = {'status': status, 'label': label, 'createdAt': now}
+        return request_id
+
+    async def execute(self, query, request_id):
+        assert "status = 'PENDING'" in query
+        if self.rows[request_id]['status'] == 'PENDING':
+            self.rows[request_id]['status'] = 'FAILED'
+
+
+class FakeExchange:
+    def __init__(self, error=None):
+        self.error = error
+        self.published = []
+
+    async def publish(self, message, routing_key, timeout=None):
+        if self.error is not None:
+            raise self.error
+        self.published.append((routing_key, message))
+
+
+class FakeChannel:
+    def __init__(self, error=None):
+        self.default_exchange = FakeExchange(error)
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    pool, channel = FakePool(), FakeChannel()
+    monkeypatch.setattr(asyncApp, 'db_pool', pool)
+    monkeypatch.setattr(asyncApp, 'amqp_channel', channel)
+    monkeypatch.setattr(asyncApp, 'local_cache', asyncApp.LRUCache(10))
+    return pool, channel
+
+
+def png():
+    output = io.BytesIO()
+    Image.new('RGB', (16, 16), 'orange').save(output, format='PNG')
+    return output.getvalue()
+
+
+def post_image(data):
+    async def run():
+        files = {'image': FileStorage(io.BytesIO(data), filename='image.png', content_type='image/png')}
+        response = await asyncApp.app.test_client().post('/predict', files=files)
+        return response.status_code, await response.get_json()
+    return asyncio.run(run())
+
+
+def test_predict_inserts_then_publishes_the_envelope(connections):
+    pool, channel = connections
+    status, body = post_image(png())
+    assert status == 200
+    assert body['id'] == 1
+    assert pool.rows[1]['status'] == 'PENDING'
+    # createdAt is timestamp without time zone, which asyncpg only accepts as a naive datetime
+    assert pool.rows[1]['createdAt'].tzinfo is None
+    routing_key, message = channel.default_exchange.published[0]
+    assert message.body == png()
+    assert message.headers['x-request-id'] == 1
+    assert message.message_id == '1'
+    assert list(read_stage_times(message)) == ['received', 'persisted', 'published']
+
+
+def test_failed_publish_marks_the_row_failed(connections, monkeypatch):
+    pool, _ = connections
+    monkeypatch.setattr(asyncApp, 'amqp_channel', FakeChannel(error=asyncio.TimeoutError()))
+    status, body = post_image(png())
+    assert status == 400
+    assert pool.rows[1]['status'] == 'FAILED'
+
+
+def test_cached_result_is_stored_without_publishing(connections):
+    pool, channel = connections
+    pool.cache[asyncApp.content_hash(png())] = {'label': 'tabby', 'confidence': 0.9}
+    status, _ = post_image(png())
+    assert status == 200
+    assert pool.rows[1] == {'status': 'PROCESSED', 'label': 'tabby', 'createdAt': pool.rows[1]['createdAt']}
+    assert channel.default_exchange.published == []
+
+
+def test_invalid_images_are_rejected(connections):
+    pool, channel = connections
+    status, _ = post_image(b'not an image')
+    assert status == 400
+    assert pool.rows == {} and channel.default_exchange.published == []
+
+
+def test_create_request_inserts_a_row(database_url):
+    async def run():
+        asyncApp.db_pool = await asyncpg.create_pool(database_url, min_size=1, max_size=1)
+        try:
+            request_id = await asyncApp.create_request('PENDING')
+            cached_id = await asyncApp.create_request('PROCESSED', 'tabby', 0.9)
+            rows = await asyncApp.db_pool.fetch(
+                'SELECT id, status, label, confidence, "createdAt", updated FROM classification_requests ORDER BY id')
+        finally:
+            await asyncApp.db_pool.close()
+            asyncApp.db_pool = None
+        return request_id, cached_id, rows
+
+    request_id, cached_id, rows = asyncio.run(run())
+    assert [row['id'] for row in rows] == [request_id, cached_id]
+    assert rows[0]['status'] == 'PENDING' and rows[0]['label'] is None
+    assert (rows[1]['status'], rows[1]['label'], rows[1]['confidence']) == ('PROCESSED', 'tabby', 0.9)
+    assert rows[0]['createdAt'] is not None and rows[0]['createdAt'] == rows[0]['updated']
+
+
+@pytest.mark.parametrize('query', ['id=abc', 'id=-4', 'id=99999999999', 'limit=ten', 'cursor=bad'])
+def test_results_rejects_malformed_arguments(query):
+    async def run():
+        response = await asyncApp.app.test_client().get(f"/results?{query}&format=json")
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(run())
+    assert status == 400
+    assert 'error' in body
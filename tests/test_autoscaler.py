@@ -0,0 +1,252 @@
+import os
+import sys
+import threading
+import importlib.util
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from queuePolicy import QueueStats, QueueScalingPolicy
+from conftest import ROOT, import_autoscaler
+
+
+class FakeAppsV1:
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.patches = []
+
+    def read_namespaced_deployment(self, name, namespace):
+        return SimpleNamespace(spec=SimpleNamespace(replicas=self.replicas), status=SimpleNamespace(ready_replicas=self.replicas))
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body):
+        self.patches.append(body['spec']['replicas'])
+        self.replicas = body['spec']['replicas']
+
+
+class FakePrometheusSession:
+    """Answers the latency query with `latency` and the request rate query with `rate`; None means no data."""
+    def __init__(self, latency, rate):
+        self.latency = latency
+        self.rate = rate
+
+    def get(self, url, params=None, timeout=None):
+        value = self.latency if 'request_latency_seconds_sum' in params['query'] else self.rate
+        result = [] if value is None else [{'metric': {}, 'value': [0, str(value)]}]
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {'data': {'result': result}})
+
+
+def latency_autoscaler(replicas, latency, rate, **kwargs):
+    module = import_autoscaler()
+    apps_v1 = FakeAppsV1(replicas)
+    autoscaler = module.AutoScaler(
+        prometheus_url='http://prometheus', moving_average_duration='1m', cooldown_period=30, deployment_name='flask-app',
+        namespace='default', latency_threshold_up=0.2, latency_threshold_down=0.1, count_threshold=20, max_replicas=4,
+        min_replicas=1, MAX_FAILURES=1, apps_v1=apps_v1, session=FakePrometheusSession(latency, rate), **kwargs)
+    return autoscaler, apps_v1
+
+
+@pytest.mark.parametrize('replicas, latency, rate, expected', [
+    (2, 0.5, 1, [3]),     # slow: one more replica
+    (2, 0.15, 30, [3]),   # busy: one more replica
+    (4, 0.5, 30, []),     # already at max_replicas
+    (2, 0.05, 1, [1]),    # fast and quiet: one fewer
+    (1, 0.05, 1, []),     # already at min_replicas
+    (2, 0.15, 1, []),     # between the thresholds
+])
+def test_latency_policy_moves_one_replica_at_a_time(replicas, latency, rate, expected):
+    autoscaler, apps_v1 = latency_autoscaler(replicas, latency, rate)
+    autoscaler.tick()
+    assert apps_v1.patches == expected
+
+
+def test_latency_policy_scales_up_after_repeated_metric_failures():
+    autoscaler, apps_v1 = latency_autoscaler(2, None, None)
+    autoscaler.tick()
+    assert apps_v1.patches == []
+    autoscaler.tick()
+    assert apps_v1.patches == [3]
+
+
+def test_queue_autoscaler_reads_the_queue_and_scales():
+    stats = QueueStats(depth=100, ready=100, unacked=0, publish_rate=20.0, ack_rate=10.0, consumers=2)
+    policy = QueueScalingPolicy(min_replicas=1, max_replicas=10, service_rate=10, target_utilization=0.5, drain_time=10,
+                                scale_down_window=60, clock=lambda: 0.0)
+    autoscaler, apps_v1 = latency_autoscaler(2, latency=None, rate=None, scaling_policy='queue',
+                                             queue_stats=SimpleNamespace(fetch=lambda: stats), queue_policy=policy)
+    autoscaler.tick()
+    # (20/s + 100 ready / 10 s) / (10/s * 0.5) = 6
+    assert apps_v1.patches == [6]
+
+
+def simulator():
+    if 'simulate_autoscaler' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('simulate_autoscaler', os.path.join(ROOT, 'scripts', 'simulate_autoscaler.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules['simulate_autoscaler'] = module
+    return sys.modules['simulate_autoscaler']
+
+
+SIMULATION_PARAMS = {
+    'MOVING_AVERAGE_DURATION': '1m', 'COOLDOWN_PERIOD': 30, 'LATENCY_THRESHOLD_UP': 0.20,
+    'LATENCY_THRESHOLD_DOWN': 0.1, 'COUNT_THRESHOLD': 20, 'MAX_REPLICAS': 8, 'MIN_REPLICAS': 1, 'MAX_FAILURES': 3,
+    'SERVICE_RATE_PER_REPLICA': 10.0, 'TARGET_UTILIZATION': 0.8, 'BACKLOG_DRAIN_SECONDS': 30, 'SCALE_DOWN_WINDOW': 300
+}
+
+
+@pytest.mark.parametrize('policy', ['latency', 'queue'])
+def test_simulated_step_in_load_is_absorbed_by_scaling_up(policy):
+    # 5 req/s for 5 minutes, then 40 req/s for 10 minutes, with 12 req/s per replica
+    arrivals = [5.0] * 300 + [40.0] * 600
+    result = simulator().simulate(import_autoscaler(), arrivals, SIMULATION_PARAMS, policy, service_rate=12.0,
+                                  startup_time=20.0, slo=0.5)
+    assert result['requests'] == sum(arrivals)
+    assert result['max_replicas'] >= 4
+    assert result['final_backlog'] < 40
+    assert 0 < result['slo_violation_seconds'] < 600
+
+
+def test_simulated_cluster_only_serves_with_ready_replicas():
+    module = simulator()
+    clock = module.SimClock()
+    cluster = module.SimulatedCluster(clock, service_rate=10.0, startup_time=20.0, initial_replicas=1)
+    cluster.patch_namespaced_deployment_scale('simulated', 'default', {'spec': {'replicas': 3}})
+    assert cluster.read_namespaced_deployment('simulated', 'default').spec.replicas == 3
+    assert cluster.ready_replicas() == 1
+    clock.now = 20
+    assert cluster.ready_replicas() == 3
+
+
+def test_parse_grid_expands_every_combination():
+    grid = simulator().parse_grid(['COOLDOWN_PERIOD=15,30', 'MAX_REPLICAS=4'])
+    assert grid == [{'COOLDOWN_PERIOD': '15', 'MAX_REPLICAS': '4'}, {'COOLDOWN_PERIOD': '30', 'MAX_REPLICAS': '4'}]
+
+
+def test_predictive_policy_leads_the_recurring_ramps_of_the_workload_trace():
+    module = simulator()
+    with open(os.path.join(ROOT, 'data', 'workload.txt')) as f:
+        trace = [float(value) for value in f.read().split()]
+    params = dict(module.DEFAULT_PARAMS, COOLDOWN_PERIOD=10)
+    violations = {}
+    for policy in ('queue', 'predictive'):
+        history = module.simulate(import_autoscaler(), trace * 4, params, policy, service_rate=12.0, startup_time=20.0,
+                                  slo=0.5)['history']
+        violations[policy] = [sum(1 for h in history[start:start + len(trace)] if h[2] > 0.5)
+                              for start in range(0, len(history), len(trace))]
+    # The reactive policy is late for every ramp; the season is known after two cycles, and from then on
+    # replicas are ready before the ramps arrive
+    assert all(count > 0 for count in violations['queue'])
+    assert violations['predictive'][2:] == [0, 0]
+    assert sum(violations['predictive']) < sum(violations['queue'])
+
+
+class BarrierAppsV1(FakeAppsV1):
+    """Deployment reads that only return once `parties` callers are reading at the same time."""
+    def __init__(self, replicas, barrier):
+        super().__init__(replicas)
+        self.barrier = barrier
+
+    def read_namespaced_deployment(self, name, namespace):
+        self.barrier.wait(timeout=5)
+        return super().read_namespaced_deployment(name, namespace)
+
+
+def test_group_decides_every_target_concurrently():
+    module = import_autoscaler()
+    barrier = threading.Barrier(3)
+    targets = []
+    for name in ('flask-app', 'worker-app', 'asgi-app'):
+        autoscaler, apps_v1 = latency_autoscaler(2, latency=0.5, rate=1)
+        autoscaler.DEPLOYMENT_NAME = name
+        autoscaler.apps_v1 = BarrierAppsV1(2, barrier)
+        targets.append(autoscaler)
+    module.AutoScalerGroup(targets).tick()
+    # Read one after the other, every read would have timed out on the barrier
+    assert [autoscaler.apps_v1.patches for autoscaler in targets] == [[3], [3], [3]]
+
+
+def test_one_decision_runs_its_queries_and_deployment_read_concurrently():
+    barrier = threading.Barrier(3)
+
+    class BarrierSession(FakePrometheusSession):
+        def get(self, url, params=None, timeout=None):
+            barrier.wait(timeout=5)
+            return super().get(url, params, timeout)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        autoscaler, apps_v1 = latency_autoscaler(2, latency=0.5, rate=1, executor=executor)
+        autoscaler.session = BarrierSession(0.5, 1)
+        autoscaler.apps_v1 = BarrierAppsV1(2, barrier)
+        autoscaler.tick()
+    assert autoscaler.apps_v1.patches == [3]
+
+
+def test_a_failing_target_does_not_stop_the_others():
+    module = import_autoscaler()
+    broken = SimpleNamespace(DEPLOYMENT_NAME='broken', tick=lambda: 1 / 0)
+    healthy, apps_v1 = latency_autoscaler(2, latency=0.5, rate=1)
+    module.AutoScalerGroup([broken, healthy]).tick()
+    assert apps_v1.patches == [3]
+
+
+class StopLoop(Exception):
+    pass
+
+
+def test_group_keeps_each_target_on_its_own_cooldown():
+    module = import_autoscaler()
+    ticks = []
+
+    class Clock:
+        now = 0.0
+
+        def monotonic(self):
+            return self.now
+
+        def sleep(self, seconds):
+            self.now += seconds
+            if self.now > 60:
+                raise StopLoop
+
+    clock = Clock()
+    targets = [SimpleNamespace(DEPLOYMENT_NAME=name, COOLDOWN_PERIOD=cooldown, tick=lambda name=name: ticks.append((name, clock.now)))
+               for name, cooldown in (('flask-app', 15), ('worker-app', 30))]
+    with pytest.raises(StopLoop):
+        module.AutoScalerGroup(targets, clock=clock).autoscale()
+    assert [t for name, t in ticks if name == 'flask-app'] == [0, 15, 30, 45, 60]
+    assert [t for name, t in ticks if name == 'worker-app'] == [0, 30, 60]
+
+
+def test_prefixed_settings_override_the_shared_ones_per_target(monkeypatch):
+    module = import_autoscaler()
+    for key, value in dict(PROMETHEUS_URL='http://prometheus', MOVING_AVERAGE_DURATION='1m', COOLDOWN_PERIOD='30',
+                           NAMESPACE='default', LATENCY_THRESHOLD_UP='0.2', LATENCY_THRESHOLD_DOWN='0.1', COUNT_THRESHOLD='20',
+                           MAX_REPLICAS='4', MIN_REPLICAS='1', MAX_FAILURES='3', WORKER_APP_SCALING_POLICY='queue',
+                           WORKER_APP_MAX_REPLICAS='8', WORKER_APP_COOLDOWN_PERIOD='15').items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv('SCALING_POLICY', raising=False)
+    flask_app = module.create_autoscaler('flask-app', apps_v1=FakeAppsV1(1))
+    worker_app = module.create_autoscaler('worker-app', apps_v1=FakeAppsV1(1))
+    assert (flask_app.SCALING_POLICY, flask_app.MAX_REPLICAS, flask_app.COOLDOWN_PERIOD) == ('latency', 4, 30)
+    assert (worker_app.SCALING_POLICY, worker_app.MAX_REPLICAS, worker_app.COOLDOWN_PERIOD) == ('queue', 8, 15)
+    assert worker_app.queue_policy.max_replicas == 8
+
+
+@pytest.mark.parametrize('season, expected_length, detects', [(None, 0, True), ('auto', 0, True), ('630', 630, False)])
+def test_predictive_policy_detects_the_season_unless_configured(monkeypatch, season, expected_length, detects):
+    module = import_autoscaler()
+    for key, value in dict(PROMETHEUS_URL='http://prometheus', MOVING_AVERAGE_DURATION='1m', COOLDOWN_PERIOD='10',
+                           NAMESPACE='default', LATENCY_THRESHOLD_UP='0.2', LATENCY_THRESHOLD_DOWN='0.1', COUNT_THRESHOLD='20',
+                           MAX_REPLICAS='8', MIN_REPLICAS='1', MAX_FAILURES='3', SCALING_POLICY='predictive',
+                           FORECAST_MAX_SEASON_SECONDS='1800').items():
+        monkeypatch.setenv(key, value)
+    if season is None:
+        monkeypatch.delenv('FORECAST_SEASON_SECONDS', raising=False)
+    else:
+        monkeypatch.setenv('FORECAST_SEASON_SECONDS', season)
+    policy = module.create_autoscaler('worker-app', apps_v1=FakeAppsV1(1)).queue_policy
+    assert policy.forecaster.season_length == expected_length
+    assert (policy.season_detector is not None) == detects
+    if detects:
+        # Two cycles of the longest season, one sample per decision interval
+        assert policy.season_detector.samples.maxlen == 360
@@ -0,0 +1,91 @@
+import io
+import tarfile
+import zipfile
+import pytest
+
+from batchUpload import iter_tar, iter_zip, iter_archive, BatchTooLarge
+
+
+class Unseekable(io.RawIOBase):
+    """A request body that can only be read forwards."""
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.data.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def tar_of(files):
+    output = io.BytesIO()
+    with tarfile.open(fileobj=output, mode='w:gz') as archive:
+        directory = tarfile.TarInfo('images')
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return output.getvalue()
+
+
+def zip_of(files):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('images/', b'')
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return output.getvalue()
+
+
+def read_all(members):
+    return {name: file.read() for name, file in members}
+
+
+def test_tar_stream_yields_regular_files_only():
+    files = {'images/a.png': b'a', 'images/b.png': b'bb'}
+    assert read_all(iter_tar(Unseekable(tar_of(files)))) == files
+
+
+def test_zip_is_spooled_when_the_stream_cannot_seek():
+    files = {'images/a.png': b'a', 'images/b.png': b'bb'}
+    assert read_all(iter_zip(Unseekable(zip_of(files)))) == files
+
+
+def test_archive_type_follows_the_filename():
+    files = {'a.png': b'a'}
+    assert read_all(iter_archive('batch.ZIP', io.BytesIO(zip_of(files)))) == files
+    assert read_all(iter_archive('batch.tar.gz', io.BytesIO(tar_of(files)))) == files
+
+
+@pytest.mark.parametrize('pack, iterate', [(tar_of, iter_tar), (zip_of, iter_zip)])
+def test_file_count_limit_ignores_directories(pack, iterate):
+    data = pack({'a.png': b'a', 'b.png': b'b'})
+    assert len(read_all(iterate(io.BytesIO(data), max_files=2))) == 2
+    with pytest.raises(BatchTooLarge):
+        read_all(iterate(io.BytesIO(data), max_files=1))
+
+
+@pytest.mark.parametrize('pack, iterate', [(tar_of, iter_tar), (zip_of, iter_zip)])
+def test_unpacked_size_limit_uses_the_declared_sizes(pack, iterate):
+    data = pack({'a.png': bytes(600), 'b.png': bytes(600)})
+    assert len(data) < 1000
+    with pytest.raises(BatchTooLarge):
+        read_all(iterate(io.BytesIO(data), max_total_bytes=1000))
+
+
+def test_zip_members_are_not_opened_when_the_archive_is_over_the_limit():
+    members = iter_zip(io.BytesIO(zip_of({'a.png': b'a', 'b.png': b'b', 'c.png': b'c'})), max_files=2)
+    with pytest.raises(BatchTooLarge):
+        next(members)
+
+
+def test_spooling_stops_at_the_byte_limit():
+    stream = Unseekable(bytes(8 * 1024 * 1024))
+    with pytest.raises(BatchTooLarge):
+        next(iter_zip(stream, max_total_bytes=1024 * 1024))
+    assert stream.data.tell() < 8 * 1024 * 1024
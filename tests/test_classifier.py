@@ -0,0 +1,129 @@
+import os
+import time
+import importlib.util
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+from PIL import Image
+from torchvision import models
+
+from classifier import ImageClassifier
+
+needs_onnxruntime = pytest.mark.skipif(importlib.util.find_spec('onnxruntime') is None, reason="onnxruntime is not installed")
+
+
+@pytest.fixture(scope='module')
+def checkpoint(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('model')
+    model_path = folder / 'resnet18.pth'
+    torch.save(models.resnet18().state_dict(), model_path)
+    label_path = folder / 'labels.txt'
+    label_path.write_text('\n'.join(f"class {i}" for i in range(1000)))
+    return str(model_path), str(label_path)
+
+
+def sample_images():
+    noise = np.random.default_rng(0).integers(0, 256, (256, 256, 3), dtype=np.uint8)
+    return [Image.new('RGB', (320, 240), 'red'), Image.new('RGB', (200, 300), 'navy'), Image.fromarray(noise)]
+
+
+def test_predict_batch_matches_predict(checkpoint):
+    model_path, label_path = checkpoint
+    classifier = ImageClassifier(model_path=model_path, label_path=label_path)
+    images = sample_images()
+
+    batch_results = classifier.predict_batch(images, topk=3)
+    assert len(batch_results) == len(images)
+    for image, results in zip(images, batch_results):
+        single = classifier.predict(image, topk=3)
+        assert [label for label, _ in results] == [label for label, _ in single]
+        assert [confidence for _, confidence in results] == pytest.approx([confidence for _, confidence in single], abs=1e-5)
+    assert classifier.predict_batch([], topk=3) == []
+
+
+@pytest.mark.parametrize('backend, channels_last', [
+    ('torchscript', False),
+    ('torchscript', True),
+    ('eager', True),
+    pytest.param('onnx', False, marks=needs_onnxruntime),
+])
+def test_fp32_backends_agree_with_eager(checkpoint, tmp_path, backend, channels_last):
+    model_path, label_path = checkpoint
+    eager = ImageClassifier(model_path=model_path, label_path=label_path, warmup_iterations=0)
+    other = ImageClassifier(model_path=model_path, label_path=label_path, backend=backend, channels_last=channels_last,
+                            warmup_iterations=1, onnx_cache_dir=str(tmp_path))
+    images = sample_images()
+    for expected, results in zip(eager.predict_batch(images, topk=1), other.predict_batch(images, topk=1)):
+        assert results[0][0] == expected[0][0]
+        assert results[0][1] == pytest.approx(expected[0][1], abs=1e-3)
+
+
+@pytest.mark.parametrize('backend', ['quantized_dynamic', 'quantized_static'])
+def test_quantized_backends_classify(checkpoint, tmp_path, backend):
+    model_path, label_path = checkpoint
+    for i, image in enumerate(sample_images()):
+        image.save(tmp_path / f'{i}.png')
+    classifier = ImageClassifier(model_path=model_path, label_path=label_path, backend=backend, calibration_dir=str(tmp_path))
+    results = classifier.predict_batch(sample_images(), topk=2)
+    assert [len(result) for result in results] == [2, 2, 2]
+    assert all(0 <= confidence <= 1 for result in results for _, confidence in result)
+
+
+def test_fast_preprocessing_agrees_with_torchvision(checkpoint):
+    model_path, label_path = checkpoint
+    fast, reference = (ImageClassifier(model_path=model_path, label_path=label_path, warmup_iterations=0, preprocessing=preprocessing)
+                       for preprocessing in ('fast', 'torchvision'))
+    images = sample_images()
+    for expected, results in zip(reference.predict_batch(images, topk=1), fast.predict_batch(images, topk=1)):
+        assert results[0][0] == expected[0][0]
+        assert results[0][1] == pytest.approx(expected[0][1], abs=1e-2)
+
+
+def test_unknown_backend_is_rejected(checkpoint):
+    with pytest.raises(ValueError):
+        ImageClassifier(model_path=checkpoint[0], label_path=checkpoint[1], backend='tensorrt')
+
+
+def build(checkpoint, cache_dir):
+    model_path, label_path = checkpoint
+    return ImageClassifier(model_path=model_path, label_path=label_path, backend='onnx',
+                           warmup_iterations=0, onnx_cache_dir=str(cache_dir))
+
+
+@needs_onnxruntime
+def test_onnx_export_is_cached_outside_the_model_directory(checkpoint, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    build(checkpoint, cache_dir)
+    onnx_path = cache_dir / 'resnet18.onnx'
+    assert onnx_path.exists()
+    assert sorted(os.listdir(os.path.dirname(checkpoint[0]))) == ['labels.txt', 'resnet18.pth']
+    # No temporary export directories are left behind
+    assert all(name.startswith('resnet18.onnx') for name in os.listdir(cache_dir))
+
+    exported_at = onnx_path.stat().st_mtime_ns
+    classifier = build(checkpoint, cache_dir)
+    assert onnx_path.stat().st_mtime_ns == exported_at
+    assert len(classifier.predict(Image.new('RGB', (64, 48)), topk=3)) == 3
+
+
+@needs_onnxruntime
+def test_onnx_export_is_refreshed_when_the_checkpoint_is_newer(checkpoint, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    build(checkpoint, cache_dir)
+    onnx_path = cache_dir / 'resnet18.onnx'
+    stale = time.time() - 3600
+    for name in os.listdir(cache_dir):
+        os.utime(cache_dir / name, (stale, stale))
+    build(checkpoint, cache_dir)
+    assert onnx_path.stat().st_mtime > stale
+
+
+@needs_onnxruntime
+def test_incomplete_cached_export_is_replaced(checkpoint, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    build(checkpoint, cache_dir)
+    onnx_path = cache_dir / 'resnet18.onnx'
+    onnx_path.write_bytes(b'truncated')
+    build(checkpoint, cache_dir)
+    assert onnx_path.stat().st_size > len(b'truncated')
@@ -0,0 +1,547 @@
+import io
+import json
+import time
+import queue
+import threading
+import hashlib
+import pika
+import pytest
+from types import SimpleNamespace
+from PIL import Image
+
+from conftest import import_entry_point
+from messageEnvelope import encode_message, encode_legacy_message
+from stageTracing import stage_headers
+from resultWriter import ResultWriter, UPDATE_RESULTS_QUERY
+from constants import RESULTS_NOTIFY_CHANNEL
+
+
+class FakeClassifier:
+    """Stands in for the ResNet checkpoint, which is not part of the repository."""
+    def __init__(self, *args, **kwargs):
+        self.kwargs = kwargs
+        self.warmed_up = None
+
+    def warmup(self, iterations=2, batch_size=1):
+        self.warmed_up = (iterations, batch_size)
+
+    def predict(self, image, topk=5):
+        return [('tabby', 0.9), ('tiger', 0.05), ('lynx', 0.02)][:topk]
+
+    def predict_batch(self, images, topk=5):
+        return [self.predict(image, topk) for image in images]
+
+    def prepare(self, image):
+        return image
+
+    def predict_prepared(self, prepared, topk=5):
+        return [self.predict(image, topk) for image in prepared]
+
+
+consumer = import_entry_point('consumer')
+
+
+@pytest.fixture(autouse=True)
+def fake_classifier(monkeypatch):
+    # The consumer only loads the real model in main(); the tests hand it the stand-in instead
+    monkeypatch.setattr(consumer, 'classifier', FakeClassifier())
+
+
+class FakeChannel:
+    def __init__(self):
+        self.acked = []
+        self.nacked = []
+        self.published = []
+        self.is_open = True
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.nacked.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.queries = []
+
+    def execute_query(self, query, params=None):
+        self.queries.append((query, params))
+
+    def execute_values(self, query, rows, template=None):
+        self.queries.extend((query, row) for row in rows)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(consumer, 'db_manager', database)
+    monkeypatch.setattr(consumer, 'result_writer', ResultWriter(database, max_size=1))
+    return database
+
+
+def delivery(tag):
+    return SimpleNamespace(delivery_tag=tag, redelivered=False)
+
+
+def png():
+    output = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(output, format='PNG')
+    return output.getvalue()
+
+
+def undecodable_message(request_id, retry_count):
+    return encode_message(request_id, b'not an image', 'image/jpeg', {'x-retry-count': retry_count})
+
+
+def statuses(database):
+    found = []
+    for query, params in database.queries:
+        if query == UPDATE_RESULTS_QUERY:
+            found.append((params[1], params[0]))
+        elif 'UPDATE classification_requests' in query:
+            found.append((params[0], params[-1]))
+    return found
+
+
+def cached_results(database):
+    return [params for query, params in database.queries if query.startswith('INSERT INTO image_results')]
+
+
+def test_processed_message_is_written_and_acked(database):
+    channel = FakeChannel()
+    body, properties = encode_message(40, png(), 'image/png')
+    consumer.callback(channel, delivery(1), properties, body)
+    assert statuses(database) == [('PROCESSED', 40)]
+    assert channel.acked == [1]
+
+
+class RecordingSpanExporter:
+    def __init__(self):
+        self.exported = []
+
+    def export(self, request_id, times):
+        self.exported.append((request_id, dict(times)))
+
+
+def test_processed_message_is_traced_through_every_consumer_stage(database, monkeypatch):
+    exporter = RecordingSpanExporter()
+    monkeypatch.setattr(consumer, 'span_exporter', exporter)
+    body, properties = encode_message(41, png(), 'image/png', stage_headers({'received': 1.0, 'published': 2.0}))
+    consumer.callback(FakeChannel(), delivery(1), properties, body)
+    (request_id, times), = exporter.exported
+    assert request_id == 41
+    assert list(times) == ['received', 'published', 'dequeued', 'decoded', 'inferred', 'written']
+    assert times['dequeued'] <= times['decoded'] <= times['inferred'] <= times['written']
+
+
+def test_stage_times_are_only_stored_once_their_column_exists(monkeypatch):
+    class OldDatabase(FakeDatabase):
+        def execute_query(self, query, params=None):
+            super().execute_query(query, params)
+            # information_schema knows no stage_times column, e.g. when the ALTER TABLE was not permitted
+            return []
+    database = OldDatabase()
+    monkeypatch.setattr(consumer, 'db_manager', database)
+    monkeypatch.setattr(consumer, 'store_stage_times', True)
+    consumer.prepare_schema()
+    assert any('ADD COLUMN IF NOT EXISTS stage_times' in query for query, _ in database.queries)
+    assert consumer.store_stage_times is False
+
+
+def test_ack_waits_for_the_result_write(database, monkeypatch):
+    monkeypatch.setattr(consumer, 'result_writer', ResultWriter(database, max_size=2))
+    channel = FakeChannel()
+    for tag, request_id in ((1, 47), (2, 48)):
+        body, properties = encode_message(request_id, png(), 'image/png')
+        consumer.callback(channel, delivery(tag), properties, body)
+        if tag == 1:
+            assert channel.acked == [] and statuses(database) == []
+    assert statuses(database) == [('PROCESSED', 47), ('PROCESSED', 48)]
+    assert channel.acked == [1, 2]
+
+
+def test_processed_result_is_cached_under_the_producer_hash(database):
+    channel = FakeChannel()
+    body, properties = encode_message(45, png(), 'image/png', {'x-content-hash': 'abc'})
+    consumer.callback(channel, delivery(1), properties, body)
+    assert cached_results(database) == [('abc', 'tabby', 0.9)]
+
+    # Messages from producers that do not send the header are hashed by the worker
+    body, properties = encode_message(46, png(), 'image/png')
+    consumer.process_batch(channel, [(delivery(2), properties, body, {})])
+    assert cached_results(database)[1][0] == hashlib.sha256(png()).hexdigest()
+    assert channel.acked == [1, 2]
+
+
+def test_legacy_json_message_is_still_processed(database):
+    channel = FakeChannel()
+    consumer.callback(channel, delivery(2), pika.BasicProperties(), encode_legacy_message(39, png()))
+    assert statuses(database) == [('PROCESSED', 39)]
+    assert channel.acked == [2]
+
+
+def rpc_message(request_id, data, topk):
+    body, properties = encode_message(request_id, data, 'image/png', {'x-topk': topk})
+    properties.reply_to, properties.correlation_id = 'amq.rabbitmq.reply-to', f'call-{request_id}'
+    return body, properties
+
+
+def test_rpc_caller_gets_the_requested_top_k_before_the_write(database, monkeypatch):
+    monkeypatch.setattr(consumer, 'result_writer', ResultWriter(database, max_size=2))
+    channel = FakeChannel()
+    body, properties = rpc_message(50, png(), topk=2)
+    consumer.callback(channel, delivery(1), properties, body)
+    (routing_key, reply, reply_properties), = channel.published
+    assert (routing_key, reply_properties.correlation_id) == ('amq.rabbitmq.reply-to', 'call-50')
+    assert json.loads(reply)['topk'] == [{'label': 'tabby', 'confidence': 0.9}, {'label': 'tiger', 'confidence': 0.05}]
+    assert statuses(database) == [] and channel.acked == []
+
+
+def test_rpc_callers_in_a_batch_each_get_their_own_top_k(database):
+    channel = FakeChannel()
+    first, second = rpc_message(51, png(), topk=1), rpc_message(52, png(), topk=3)
+    consumer.process_batch(channel, [(delivery(1), first[1], first[0], {}), (delivery(2), second[1], second[0], {})])
+    assert [len(json.loads(reply)['topk']) for _, reply, _ in channel.published] == [1, 3]
+    assert statuses(database) == [('PROCESSED', 51), ('PROCESSED', 52)]
+
+
+def test_retried_rpc_request_keeps_its_reply_address(database):
+    channel = FakeChannel()
+    body, properties = rpc_message(53, b'not an image', topk=1)
+    consumer.callback(channel, delivery(1), properties, body)
+    retried = channel.published[0][2]
+    assert (retried.reply_to, retried.correlation_id) == ('amq.rabbitmq.reply-to', 'call-53')
+
+
+def test_undecodable_image_is_retried_with_its_envelope(database):
+    channel = FakeChannel()
+    body, properties = undecodable_message(41, retry_count=0)
+    consumer.callback(channel, delivery(1), properties, body)
+    assert channel.nacked == [1]
+    retried = channel.published[0][2]
+    assert retried.headers['x-request-id'] == 41
+    assert retried.headers['x-retry-count'] == 1
+    assert (retried.content_type, retried.message_id) == ('image/jpeg', '41')
+    assert statuses(database) == []
+
+
+def test_undecodable_image_is_marked_failed_after_the_last_attempt(database):
+    channel = FakeChannel()
+    body, properties = undecodable_message(42, retry_count=2)
+    consumer.callback(channel, delivery(7), properties, body)
+    assert statuses(database) == [('FAILED', 42)]
+    assert channel.acked == [7]
+    # Clients waiting on /results/stream hear about the failure from the same statement
+    (query, _), = database.queries
+    assert f"pg_notify('{RESULTS_NOTIFY_CHANNEL}'" in query
+
+
+def test_undecodable_image_in_a_batch_is_marked_failed(database):
+    channel = FakeChannel()
+    body, properties = undecodable_message(43, retry_count=2)
+    consumer.process_batch(channel, [(delivery(3), properties, body, {})])
+    assert statuses(database) == [('FAILED', 43)]
+    assert channel.acked == [3]
+
+
+def test_unreadable_envelope_falls_back_to_the_message_id(database):
+    channel = FakeChannel()
+    properties = pika.BasicProperties(message_id='44', headers={'x-retry-count': 2})
+    consumer.callback(channel, delivery(5), properties, b'{not json')
+    assert statuses(database) == [('FAILED', 44)]
+    assert channel.acked == [5]
+
+
+class FakeScheduler:
+    """call_later/remove_timeout like a pika connection, fired by hand."""
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        timer = (delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        self.timers.remove(timer)
+
+    def fire(self):
+        _, callback = self.timers.pop(0)
+        callback()
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    batches = []
+    monkeypatch.setattr(consumer, 'process_batch', lambda ch, batch: batches.append([method.delivery_tag for method, _, _, _ in batch]))
+    return batches
+
+
+def test_batcher_flushes_when_the_batch_is_full(batches):
+    scheduler = FakeScheduler()
+    batcher = consumer.MessageBatcher(scheduler, FakeChannel(), max_size=3, max_wait=0.05)
+    for tag in (1, 2, 3):
+        batcher.on_message(None, delivery(tag), pika.BasicProperties(), b'')
+    assert batches == [[1, 2, 3]]
+    # The wait timer started by the first message is cancelled by the full flush
+    assert scheduler.timers == []
+
+
+def test_batcher_flushes_max_wait_after_the_first_message(batches):
+    scheduler = FakeScheduler()
+    batcher = consumer.MessageBatcher(scheduler, FakeChannel(), max_size=3, max_wait=0.05)
+    batcher.on_message(None, delivery(1), pika.BasicProperties(), b'')
+    batcher.on_message(None, delivery(2), pika.BasicProperties(), b'')
+    assert batches == []
+    assert [delay for delay, _ in scheduler.timers] == [0.05]
+
+    scheduler.fire()
+    assert batches == [[1, 2]]
+    batcher.on_message(None, delivery(3), pika.BasicProperties(), b'')
+    assert len(scheduler.timers) == 1
+
+
+def test_batcher_stamps_the_dequeue_time(monkeypatch):
+    received = []
+    monkeypatch.setattr(consumer, 'process_batch', lambda ch, batch: received.extend(times for _, _, _, times in batch))
+    batcher = consumer.MessageBatcher(FakeScheduler(), FakeChannel(), max_size=1, max_wait=0.05)
+    batcher.on_message(None, delivery(1), pika.BasicProperties(headers={'x-stage-times': {'received': 1_000_000}}), b'')
+    assert received[0]['received'] == 1.0
+    assert received[0]['dequeued'] > 1.0
+
+
+def test_ready_only_once_consuming(monkeypatch):
+    monkeypatch.setattr(consumer, 'consuming', consumer.threading.Event())
+    client = consumer.app.test_client()
+    assert client.get('/ready').status_code == 503
+    consumer.consuming.set()
+    assert client.get('/ready').status_code == 200
+
+
+def test_ready_follows_the_supervisor_in_supervisor_mode(monkeypatch):
+    supervisor = SimpleNamespace(ready=lambda: False)
+    monkeypatch.setattr(consumer, 'supervisor', supervisor)
+    client = consumer.app.test_client()
+    assert client.get('/ready').status_code == 503
+    supervisor.ready = lambda: True
+    assert client.get('/ready').status_code == 200
+
+
+def test_supervisor_mode_starts_no_thread_in_the_parent(monkeypatch):
+    calls = []
+
+    class RecordingSupervisor:
+        def __init__(self, target, processes, threads, server=None):
+            calls.append(('supervisor', target, processes, server))
+
+        def start_server(self):
+            calls.append('start_server')
+
+        def start(self):
+            calls.append('start')
+
+        def monitor(self):
+            calls.append('monitor')
+
+    monkeypatch.setattr(consumer, 'worker_processes', 2)
+    monkeypatch.setattr(consumer, 'supervisor', None)
+    monkeypatch.setattr(consumer, 'WorkerSupervisor', RecordingSupervisor)
+    monkeypatch.setattr(consumer, 'prepare_parent', lambda: calls.append('prepare_parent'))
+    monkeypatch.setattr(consumer, 'load_classifier', lambda: calls.append('load_classifier'))
+    monkeypatch.setattr(consumer.threading, 'Thread', lambda *args, **kwargs: calls.append('thread'))
+    consumer.main()
+    assert calls == [('supervisor', consumer.start_consuming, 2, consumer.serve_http), 'start_server',
+                     'prepare_parent', 'load_classifier', 'start', 'monitor']
+
+
+def test_single_process_serves_http_before_loading_and_is_ready_once_consuming(monkeypatch):
+    calls = []
+
+    class RecordingThread:
+        def __init__(self, target, daemon=False):
+            self.target = target
+
+        def start(self):
+            calls.append(self.target.__name__)
+
+    def start_consuming(on_ready):
+        calls.append('start_consuming')
+        on_ready()
+
+    monkeypatch.setattr(consumer, 'worker_processes', 1)
+    monkeypatch.setattr(consumer, 'consuming', consumer.threading.Event())
+    monkeypatch.setattr(consumer.threading, 'Thread', RecordingThread)
+    monkeypatch.setattr(consumer, 'load_classifier', lambda: calls.append('load_classifier'))
+    monkeypatch.setattr(consumer, 'start_consuming', start_consuming)
+    consumer.main()
+    assert calls == ['start_metrics_server', 'start_flask_app', 'load_classifier', 'start_consuming']
+    assert consumer.consuming.is_set()
+
+
+def test_load_classifier_warms_up_and_records_the_startup_phases(monkeypatch):
+    import classifier
+    monkeypatch.setattr(classifier, 'ImageClassifier', FakeClassifier)
+    monkeypatch.setattr(consumer, 'warmup_batches', 3)
+    monkeypatch.setattr(consumer, 'batch_size', 8)
+    monkeypatch.setattr(consumer, 'consumer_mode', 'pipeline')
+    consumer.load_classifier()
+    assert isinstance(consumer.classifier, FakeClassifier)
+    assert consumer.classifier.kwargs['warmup_iterations'] == 0
+    assert consumer.classifier.warmed_up == (3, 8)
+    phases = {sample.labels['phase'] for sample in consumer.STARTUP_SECONDS.collect()[0].samples}
+    assert phases == {'load', 'warmup'}
+
+
+def test_time_to_first_inference_is_recorded_once(database, monkeypatch):
+    monkeypatch.setattr(consumer, 'first_inference_done', False)
+    monkeypatch.setattr(consumer, 'started_at', consumer.time.time() - 5)
+    body, properties = encode_message(70, png(), 'image/png')
+    consumer.callback(FakeChannel(), delivery(1), properties, body)
+    first = consumer.TIME_TO_FIRST_INFERENCE._value.get()
+    assert 5 <= first < 10
+    monkeypatch.setattr(consumer, 'started_at', consumer.time.time() - 60)
+    consumer.callback(FakeChannel(), delivery(2), properties, body)
+    assert consumer.TIME_TO_FIRST_INFERENCE._value.get() == first
+
+
+class FakeConnection:
+    """Queues callbacks the way pika's add_callback_threadsafe does; the test thread plays the I/O loop."""
+    def __init__(self):
+        self.callbacks = queue.Queue()
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+    def run_until(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            try:
+                self.callbacks.get(timeout=0.05)()
+            except queue.Empty:
+                pass
+        return condition()
+
+
+def staged_consumer(database, connection, prefetch_count=8, decode_workers=2, batch_size=4):
+    staged = consumer.StagedConsumer(ResultWriter(database, max_size=10), prefetch_count, decode_workers,
+                                     batch_size, batch_timeout=0.05, write_max_age=0.05)
+    staged.attach(connection)
+    return staged
+
+
+def test_staged_consumer_runs_every_stage_and_acks_on_the_io_thread(database):
+    connection, channel = FakeConnection(), FakeChannel()
+    staged = staged_consumer(database, connection)
+    staged.start()
+    for tag, request_id in ((1, 60), (2, 61)):
+        body, properties = encode_message(request_id, png(), 'image/png')
+        staged.on_message(channel, delivery(tag), properties, body)
+    body, properties = encode_message(62, png(), 'image/png')
+    properties.reply_to, properties.correlation_id = 'amq.rabbitmq.reply-to', 'call-62'
+    staged.on_message(channel, delivery(3), properties, body)
+    body, properties = undecodable_message(63, retry_count=2)
+    staged.on_message(channel, delivery(4), properties, body)
+
+    assert connection.run_until(lambda: len(channel.acked) == 4)
+    assert sorted(channel.acked) == [1, 2, 3, 4]
+    assert sorted(statuses(database)) == [('FAILED', 63), ('PROCESSED', 60), ('PROCESSED', 61), ('PROCESSED', 62)]
+    reply = json.loads(channel.published[0][1])
+    assert channel.published[0][0] == 'amq.rabbitmq.reply-to' and reply['id'] == 62 and reply['label'] == 'tabby'
+    assert all(staged.queues[stage].empty() for stage in staged.queues)
+
+
+def test_staged_consumer_requeues_when_the_decode_queue_is_full(database):
+    channel = FakeChannel()
+    staged = staged_consumer(database, FakeConnection(), prefetch_count=1, decode_workers=1, batch_size=1)
+    body, properties = encode_message(64, png(), 'image/png')
+    staged.on_message(channel, delivery(1), properties, body)
+    staged.on_message(channel, delivery(2), properties, body)
+    assert channel.nacked == [2] and channel.acked == []
+
+
+class SlowClassifier(FakeClassifier):
+    """A forward pass that blocks until the test releases it, like a model slower than the heartbeat interval."""
+    def __init__(self):
+        self.running = threading.Event()
+        self.release = threading.Event()
+
+    def predict_prepared(self, prepared, topk=5):
+        self.running.set()
+        assert self.release.wait(timeout=10)
+        return super().predict_prepared(prepared, topk)
+
+
+def test_slow_model_does_not_block_the_io_thread(database, monkeypatch):
+    slow = SlowClassifier()
+    monkeypatch.setattr(consumer, 'classifier', slow)
+    connection, channel = FakeConnection(), FakeChannel()
+    staged = staged_consumer(database, connection, batch_size=1)
+    staged.start()
+    body, properties = encode_message(65, png(), 'image/png')
+    staged.on_message(channel, delivery(1), properties, body)
+    assert slow.running.wait(timeout=10)
+
+    # While the forward pass runs, the I/O thread still takes deliveries and runs its callbacks (heartbeats)
+    start = time.monotonic()
+    body, properties = encode_message(66, png(), 'image/png')
+    staged.on_message(channel, delivery(2), properties, body)
+    heartbeat = threading.Event()
+    connection.add_callback_threadsafe(heartbeat.set)
+    assert connection.run_until(heartbeat.is_set)
+    assert time.monotonic() - start < 1 and channel.acked == []
+
+    slow.release.set()
+    assert connection.run_until(lambda: len(channel.acked) == 2)
+    assert sorted(statuses(database)) == [('PROCESSED', 65), ('PROCESSED', 66)]
+
+
+def test_deliveries_from_a_closed_channel_are_dropped(database):
+    connection = FakeConnection()
+    staged = staged_consumer(database, connection, decode_workers=1, batch_size=1)
+    closed, channel = FakeChannel(), FakeChannel()
+    closed.is_open = False
+    for ch, tag, request_id in ((closed, 1, 67), (channel, 2, 68)):
+        body, properties = encode_message(request_id, png(), 'image/png')
+        staged.on_message(ch, delivery(tag), properties, body)
+    staged.start()
+    assert connection.run_until(lambda: channel.acked == [2])
+    assert closed.acked == [] and statuses(database) == [('PROCESSED', 68)]
+
+
+def test_start_consuming_reconnects_after_a_lost_connection(database, monkeypatch):
+    attempts, closed = [], []
+
+    def consume(staged, on_ready):
+        attempts.append(staged)
+        if len(attempts) == 1:
+            raise pika.exceptions.AMQPConnectionError('connection reset')
+        raise SystemExit
+
+    monkeypatch.setattr(consumer, 'consumer_mode', 'single')
+    monkeypatch.setattr(consumer, 'consume', consume)
+    monkeypatch.setattr(consumer, 'reconnect_delay', 0)
+    monkeypatch.setattr(consumer.rabbitmq_manager, 'close_quietly', lambda: closed.append(True))
+    database.connect = lambda: None
+    drops = consumer.CONNECTION_DROPS._value.get()
+    with pytest.raises(SystemExit):
+        consumer.start_consuming()
+    assert len(attempts) == 2 and closed == [True]
+    assert consumer.CONNECTION_DROPS._value.get() == drops + 1
+
+
+def test_redeliveries_are_counted(database):
+    redeliveries = consumer.REDELIVERIES._value.get()
+    body, properties = encode_message(69, png(), 'image/png')
+    consumer.callback(FakeChannel(), SimpleNamespace(delivery_tag=1, redelivered=True), properties, body)
+    assert consumer.REDELIVERIES._value.get() == redeliveries + 1
+
+
+def test_committed_messages_are_counted_for_the_queue_autoscaler(database):
+    processed = consumer.MESSAGES_PROCESSED._value.get()
+    body, properties = encode_message(71, png(), 'image/png')
+    consumer.callback(FakeChannel(), delivery(1), properties, body)
+    assert consumer.MESSAGES_PROCESSED._value.get() == processed + 1
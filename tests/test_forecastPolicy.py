@@ -0,0 +1,138 @@
+import os
+import random
+import pytest
+
+from forecastPolicy import HoltWintersForecaster, PredictiveScalingPolicy, SeasonDetector
+from conftest import ROOT
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def ramp(t):
+    """Rate of a 100 s cycle with a ramp from 50 s to 70 s."""
+    return 50.0 if 50 <= t % 100 < 70 else 10.0
+
+
+def test_holt_forecast_follows_a_linear_trend():
+    forecaster = HoltWintersForecaster(alpha=0.8, beta=0.8)
+    for t in range(0, 200, 10):
+        forecaster.update(t, 2.0 * t)
+    assert forecaster.forecast(30) == pytest.approx(2.0 * 220, rel=0.05)
+
+
+def test_seasonal_forecast_anticipates_a_recurring_ramp():
+    forecaster = HoltWintersForecaster(alpha=0.3, beta=0.0, gamma=0.5, season_length=100, season_bucket=10)
+    for t in range(0, 600, 10):
+        forecaster.update(t, ramp(t))
+    # Last update at t=590; 650 is inside the next cycle's ramp, 620 is not
+    assert forecaster.forecast(60) > 35
+    assert forecaster.forecast(30) < 25
+
+
+def test_reseason_seeds_every_bucket_from_history():
+    forecaster = HoltWintersForecaster(alpha=0.3, beta=0.0, gamma=0.5, season_bucket=10)
+    history = [(t, ramp(t)) for t in range(0, 300, 10)]
+    for t, rate in history:
+        forecaster.update(t, rate)
+    forecaster.reseason(100, history)
+    assert forecaster.season_length == 100
+    # Last update at t=290; the forecast follows the ramp as soon as the season is known
+    assert forecaster.forecast(60) > 35
+    assert forecaster.forecast(30) < 25
+
+
+def load_trace():
+    with open(os.path.join(ROOT, 'data', 'workload.txt')) as f:
+        return [float(value) for value in f.read().split()]
+
+
+def test_season_detector_finds_the_workload_cycle():
+    trace = load_trace() * 2
+    detector = SeasonDetector(10, max_season=3600)
+    for t in range(0, len(trace), 10):
+        detector.add(t, sum(trace[t:t + 10]) / 10)
+    assert detector.detect() == len(trace) // 2
+
+
+def test_season_detector_needs_two_cycles():
+    trace = load_trace()
+    detector = SeasonDetector(10, max_season=3600)
+    for t in range(0, len(trace), 10):
+        detector.add(t, sum(trace[t:t + 10]) / 10)
+    assert detector.detect() is None
+
+
+@pytest.mark.parametrize('rate', [lambda rng: 20.0, lambda rng: rng.gauss(20, 3)])
+def test_season_detector_ignores_load_without_a_cycle(rate):
+    rng = random.Random(1)
+    detector = SeasonDetector(10, max_season=3600)
+    for t in range(0, 7200, 10):
+        detector.add(t, rate(rng))
+    assert detector.detect() is None
+
+
+def predictive_policy(clock, **kwargs):
+    args = dict(min_replicas=1, max_replicas=20, service_rate=10, target_utilization=1.0, drain_time=10,
+                scale_down_window=0, decision_interval=10, startup_time=20, min_forecast_samples=3)
+    args.update(kwargs)
+    return PredictiveScalingPolicy(clock=clock, **args)
+
+
+def test_predictive_policy_is_reactive_until_the_forecast_has_been_scored():
+    clock = Clock()
+    policy = predictive_policy(clock, forecaster=HoltWintersForecaster(alpha=1.0, beta=1.0))
+    for t, rate in ((0, 10), (10, 20), (20, 30)):
+        clock.now = t
+        desired = policy.desired_replicas(1, rate, 0)
+    assert not policy.using_forecast
+    assert desired == 3
+
+
+def test_predictive_policy_provisions_ahead_of_a_ramp_once_trusted():
+    clock = Clock()
+    policy = predictive_policy(clock, forecaster=HoltWintersForecaster(alpha=1.0, beta=1.0))
+    # Lead time is startup (20 s) + decision interval (10 s); a steady ramp of 1/s per second is forecast exactly
+    for t in range(0, 100, 10):
+        clock.now = t
+        desired = policy.desired_replicas(1, float(t), 0)
+    assert policy.using_forecast
+    assert policy.last_forecast == pytest.approx(120)
+    assert desired == 12
+
+
+def test_predictive_policy_falls_back_when_the_forecast_is_poor():
+    clock = Clock()
+    policy = predictive_policy(clock, forecaster=HoltWintersForecaster(alpha=1.0, beta=1.0), max_forecast_error=0.2)
+    for t in range(0, 200, 10):
+        clock.now = t
+        policy.desired_replicas(1, 100.0 if (t // 10) % 2 else 5.0, 0)
+    assert policy.forecast_error > 0.2
+    assert not policy.using_forecast
+
+
+def test_predictive_policy_learns_the_startup_time():
+    clock = Clock()
+    policy = predictive_policy(clock, startup_alpha=1.0)
+    assert policy.desired_replicas(1, 50, 0, ready_replicas=1) == 5
+    clock.now = 45
+    policy.desired_replicas(5, 50, 0, ready_replicas=5)
+    assert policy.startup_time == 45
+
+
+def test_predictive_policy_detects_the_season_and_leads_the_ramp():
+    clock = Clock()
+    forecaster = HoltWintersForecaster(alpha=0.3, beta=0.0, gamma=0.5, season_bucket=10)
+    policy = predictive_policy(clock, forecaster=forecaster, season_detector=SeasonDetector(10, max_season=200, min_samples=20))
+    for t in range(0, 630, 10):
+        clock.now = t
+        desired = policy.desired_replicas(1, ramp(t), 0)
+    assert forecaster.season_length == 100
+    assert policy.using_forecast
+    # At t=620 the ramp starting at 650 is inside the 30 s lead time
+    assert desired == 5
@@ -0,0 +1,65 @@
+import io
+import pytest
+from PIL import Image
+
+from imageValidation import read_upload, validate_image
+
+
+def encode(format, size=(32, 24), mode='RGB'):
+    output = io.BytesIO()
+    Image.new(mode, size, 'orange').save(output, format=format)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('format, content_type', [('PNG', 'image/png'), ('JPEG', 'image/jpeg'), ('GIF', 'image/gif')])
+def test_header_mode_returns_the_upload_unchanged(format, content_type):
+    data = encode(format)
+    assert validate_image(data) == (data, content_type)
+
+
+def test_full_mode_re_encodes_the_image():
+    data = encode('PNG')
+    image_bytes, content_type = validate_image(data, mode='full')
+    assert content_type == 'image/png'
+    assert Image.open(io.BytesIO(image_bytes)).size == (32, 24)
+
+
+@pytest.mark.parametrize('format', ['BMP', 'TIFF', 'WEBP'])
+def test_formats_outside_the_allow_list_are_rejected(format):
+    with pytest.raises(ValueError, match='Invalid image format'):
+        validate_image(encode(format))
+
+
+def test_images_over_the_pixel_limit_are_rejected_from_the_header():
+    with pytest.raises(ValueError, match='pixels'):
+        validate_image(encode('PNG', size=(200, 100)), max_pixels=10_000)
+
+
+def test_decompression_bombs_are_rejected():
+    # Far beyond twice Image.MAX_IMAGE_PIXELS, where PIL itself refuses to open the image
+    data = encode('PNG', size=(10_000, 10_000), mode='1')
+    with pytest.raises(Image.DecompressionBombError):
+        validate_image(data)
+
+
+def test_bytes_that_are_not_an_image_are_rejected():
+    with pytest.raises(Image.UnidentifiedImageError):
+        validate_image(b'definitely not an image')
+
+
+def test_corrupt_image_data_is_rejected():
+    data = bytearray(encode('PNG', size=(64, 64)))
+    data[-20] ^= 0xFF  # Break the checksum of the last chunk
+    with pytest.raises(SyntaxError):
+        validate_image(bytes(data))
+
+
+def test_read_upload_refuses_oversized_files():
+    assert read_upload(io.BytesIO(b'x' * 10), max_bytes=10) == b'x' * 10
+    with pytest.raises(ValueError, match='maximum upload size'):
+        read_upload(io.BytesIO(b'x' * 11), max_bytes=10)
+
+
+def test_read_upload_refuses_empty_files():
+    with pytest.raises(ValueError, match='Empty'):
+        read_upload(io.BytesIO(b''))
@@ -0,0 +1,65 @@
+import json
+import base64
+import pika
+import pytest
+
+from constants import MESSAGE_SCHEMA_VERSION
+from messageEnvelope import encode_message, encode_legacy_message, decode_message, envelope_request_id
+from stageTracing import stage_headers, read_stage_times, STAGE_HEADER
+
+IMAGE = b'\xff\xd8\xff\xe0 not really a jpeg \x00\x01\xff\xd9'
+
+
+def test_binary_envelope_round_trip():
+    body, properties = encode_message(17, IMAGE, 'image/jpeg', {'x-retry-count': 1})
+    assert body == IMAGE
+    assert properties.content_type == 'image/jpeg'
+    assert properties.delivery_mode == 2
+    assert properties.message_id == '17'
+    assert properties.headers['x-schema-version'] == MESSAGE_SCHEMA_VERSION
+    assert properties.headers['x-retry-count'] == 1
+    assert decode_message(body, properties) == (17, IMAGE)
+
+
+def test_headers_survive_amqp_encoding():
+    body, properties = encode_message(18, IMAGE, 'image/png')
+    encoded = b''.join(properties.encode())
+    decoded = pika.BasicProperties()
+    decoded.decode(encoded)
+    assert decoded.content_type == 'image/png'
+    assert decode_message(body, decoded) == (18, IMAGE)
+
+
+def test_stage_times_survive_amqp_encoding():
+    times = {'received': 1700000000.25, 'published': 1700000000.5}
+    body, properties = encode_message(19, IMAGE, 'image/jpeg', stage_headers(times))
+    decoded = pika.BasicProperties()
+    decoded.decode(b''.join(properties.encode()))
+    assert read_stage_times(decoded) == times
+    assert decode_message(body, decoded) == (19, IMAGE)
+
+
+def test_messages_without_stage_times_read_as_empty():
+    assert read_stage_times(None) == {}
+    assert read_stage_times(pika.BasicProperties()) == {}
+    assert read_stage_times(pika.BasicProperties(headers={STAGE_HEADER: {}})) == {}
+
+
+def test_legacy_json_message_round_trip():
+    body = encode_legacy_message(19, IMAGE)
+    assert json.loads(body)['image'] == base64.b64encode(IMAGE).decode('ascii')
+    assert decode_message(body, pika.BasicProperties()) == (19, IMAGE)
+    assert decode_message(body, None) == (19, IMAGE)
+
+
+def test_newer_schema_versions_are_rejected():
+    properties = pika.BasicProperties(headers={'x-schema-version': MESSAGE_SCHEMA_VERSION + 1, 'x-request-id': 20})
+    with pytest.raises(ValueError):
+        decode_message(IMAGE, properties)
+
+
+def test_envelope_request_id_falls_back_to_the_message_id():
+    assert envelope_request_id(pika.BasicProperties(headers={'x-request-id': 21}, message_id='99')) == 21
+    assert envelope_request_id(pika.BasicProperties(message_id='22')) == 22
+    assert envelope_request_id(pika.BasicProperties(message_id='not a number')) is None
+    assert envelope_request_id(None) is None
@@ -0,0 +1,112 @@
+import io
+import os
+import sys
+import time
+import socket
+import asyncio
+import hashlib
+import subprocess
+import importlib.util
+import urllib.request
+import pytest
+from PIL import Image
+
+from conftest import ROOT
+
+
+def loadtester():
+    if 'open_loop_loadtester' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('open_loop_loadtester', os.path.join(ROOT, 'scripts', 'open_loop_loadtester.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules['open_loop_loadtester'] = module
+    return sys.modules['open_loop_loadtester']
+
+
+def test_histogram_percentiles_are_within_the_precision():
+    histogram = loadtester().LatencyHistogram(precision=0.01)
+    values = [i / 1000 for i in range(1, 1001)]
+    for value in values:
+        histogram.record(value)
+    summary = histogram.summary()
+    assert summary['count'] == 1000
+    assert summary['p50'] == pytest.approx(0.5, rel=0.01)
+    assert summary['p99'] == pytest.approx(0.99, rel=0.01)
+    assert (summary['min'], summary['max']) == (0.001, 1.0)
+
+
+def test_empty_histogram_reports_only_its_count():
+    assert loadtester().LatencyHistogram().summary() == {'count': 0}
+
+
+@pytest.mark.parametrize('arrivals', ['uniform', 'poisson'])
+def test_schedule_sends_each_second_its_count(arrivals):
+    offsets = loadtester().schedule([2, 0, 3], arrivals)
+    assert [int(offset) for offset in offsets] == [0, 0, 2, 2, 2]
+    assert offsets == sorted(offsets)
+
+
+def test_uniform_schedule_spaces_requests_evenly():
+    assert loadtester().schedule([4], 'uniform') == [0.125, 0.375, 0.625, 0.875]
+
+
+def test_unique_uploads_differ_and_still_decode():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buffer, 'JPEG')
+    image = buffer.getvalue()
+    first, second = (loadtester().make_unique(image, index) for index in (1, 2))
+    assert len({hashlib.sha256(data).hexdigest() for data in (image, first, second)}) == 3
+    assert Image.open(io.BytesIO(first)).size == (8, 8)
+
+
+def test_request_id_comes_from_the_id_field_or_the_message():
+    module = loadtester()
+    assert module.parse_request_id({'id': 7, 'msg': 'Prediction request received. Request id:3'}) == 7
+    assert module.parse_request_id({'msg': 'Prediction request received. Request id:3'}) == 3
+    assert module.parse_request_id({'msg': 'Failed'}) is None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def local_producer():
+    """scripts/local_producer.py serving the real app.py on a free port."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'scripts', 'local_producer.py'), '--port', str(port), '--workers', '2',
+         '--service-time', '0.02'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            urllib.request.urlopen(url + '/health', timeout=1)
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail("local_producer.py did not start")
+            time.sleep(0.2)
+    yield url
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def test_load_generator_follows_requests_through_the_real_producer(local_producer):
+    module = loadtester()
+    offsets = module.schedule([5, 5], 'uniform')
+    tester = module.OpenLoopLoadTester(local_producer, module.load_images('/nonexistent', synthetic=2), unique=True,
+                                       poll_interval=0.02, result_wait=1.0, result_timeout=10, topk=1, connections=20)
+    asyncio.run(tester.run(offsets))
+    report = tester.report(2.0, offsets)
+    assert report['outcomes'] == {'processed': 10}
+    assert report['latency_seconds']['end_to_end']['count'] == 10
+    # Every request got its own id from the producer's id allocator
+    assert sorted(record['request_id'] for record in tester.records) == list(range(1, 11))
+    # Each worker takes 20 ms per message
+    assert report['latency_seconds']['queued']['min'] >= 0.02
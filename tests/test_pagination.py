@@ -0,0 +1,96 @@
+import pytest
+from datetime import datetime, timedelta
+
+from pagination import encode_cursor, decode_cursor, parse_page_args, build_page_query, build_page
+
+CREATED = datetime(2026, 10, 18, 12, 0, 0, 123456)
+
+
+def key(request_id, created_at=CREATED):
+    return {'id': request_id, 'createdAt': created_at}
+
+
+@pytest.mark.parametrize('request_id', [1, 42, 2 ** 31 - 1])
+def test_cursor_round_trip(request_id):
+    cursor = encode_cursor(key(request_id))
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (CREATED, request_id)
+
+
+@pytest.mark.parametrize('cursor', [
+    '', 'not-base64!', encode_cursor(key('abc')), encode_cursor(key(-1)), encode_cursor(key(2 ** 40)),
+    encode_cursor(key(5, CREATED.astimezone())),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_parse_page_args_defaults_and_bounds():
+    assert parse_page_args({}) == {'limit': 10, 'order': 'desc', 'direction': 'next', 'status': None, 'cursor_key': None}
+    args = parse_page_args({'limit': '1000', 'order': 'ASC', 'direction': 'prev', 'status': 'failed', 'cursor': encode_cursor(key(5))})
+    assert args == {'limit': 100, 'order': 'asc', 'direction': 'prev', 'status': 'FAILED', 'cursor_key': (CREATED, 5)}
+    for args in ({'status': 'LOST'}, {'limit': 'ten'}):
+        with pytest.raises(ValueError):
+            parse_page_args(args)
+
+
+def test_build_page_query_walks_the_index_from_the_cursor():
+    query, params = build_page_query(limit=10, order='desc', direction='next', status='PENDING', cursor_key=(CREATED, 50))
+    assert 'status = %s AND ("createdAt", id) < (%s, %s)' in query
+    assert 'ORDER BY "createdAt" DESC, id DESC' in query
+    assert params == ['PENDING', CREATED, 50, 11]
+
+    query, params = build_page_query(limit=10, order='desc', direction='prev', cursor_key=(CREATED, 50), paramstyle='numeric')
+    assert '("createdAt", id) > ($1, $2)' in query
+    assert 'ORDER BY "createdAt" ASC, id ASC' in query
+    assert params == [CREATED, 50, 11]
+
+
+def test_build_page_sets_cursors_from_the_extra_row():
+    rows = [(9, 'PROCESSED', 'tabby', CREATED), (8, 'PENDING', None, CREATED), (7, 'PENDING', None, CREATED)]
+    page = build_page(rows, limit=2, order='desc', direction='next')
+    assert [row['id'] for row in page['data']] == [9, 8]
+    assert page['has_more'] is True
+    assert decode_cursor(page['next_cursor']) == (CREATED, 8)
+    assert page['prev_cursor'] is None
+
+    # A 'prev' page is read in the opposite order and reversed back
+    rows = [(10, 'PENDING', None, CREATED), (11, 'PENDING', None, CREATED)]
+    page = build_page(rows, limit=2, order='desc', direction='prev', cursor_key=(CREATED, 9))
+    assert [row['id'] for row in page['data']] == [11, 10]
+    assert decode_cursor(page['next_cursor']) == (CREATED, 10)
+    assert page['prev_cursor'] is None
+
+
+def fetch_page(db_manager, **args):
+    page_args = parse_page_args(args)
+    query, params = build_page_query(**page_args)
+    return build_page(db_manager.execute_query(query, params), **page_args)
+
+
+def test_pages_follow_creation_order_when_ids_are_allocated_in_blocks(db_manager):
+    # Two producers holding id blocks 1-100 and 101-200 interleave their inserts, and a batch shares one timestamp
+    ids = [101, 1, 102, 2, 3, 4, 103]
+    created = [CREATED + timedelta(seconds=i) for i in range(5)] + [CREATED + timedelta(seconds=5)] * 2
+    for request_id, created_at in zip(ids, created):
+        db_manager.execute_query(
+            'INSERT INTO classification_requests (id, status, "createdAt", updated) VALUES (%s, %s, %s, %s)',
+            (request_id, 'FAILED' if request_id == 2 else 'PENDING', created_at, created_at)
+        )
+    newest_first = [103, 4, 3, 2, 102, 1, 101]
+
+    page = fetch_page(db_manager, limit='3')
+    pages = [page]
+    while page['next_cursor']:
+        page = fetch_page(db_manager, limit='3', cursor=page['next_cursor'])
+        pages.append(page)
+    seen = [row['id'] for page in pages for row in page['data']]
+    assert seen == newest_first
+
+    # Walking back from the last page returns the same pages
+    previous = fetch_page(db_manager, limit='3', cursor=pages[-1]['prev_cursor'], direction='prev')
+    assert previous['data'] == pages[-2]['data']
+
+    page = fetch_page(db_manager, limit='10', order='asc', status='pending')
+    assert [row['id'] for row in page['data']] == [101, 1, 102, 3, 4, 103]
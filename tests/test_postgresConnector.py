@@ -0,0 +1,205 @@
+import threading
+import pytest
+from psycopg2 import IntegrityError, OperationalError
+
+import postgresConnector
+from postgresConnector import PostgresConnectionManager
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, query, params=None):
+        self.connection.statements.append(query)
+        if self.connection.failures:
+            raise self.connection.failures.pop(0)
+        self.description = [('column',)] if 'SELECT' in query.upper() or 'RETURNING' in query.upper() else None
+
+    def fetchall(self):
+        return [(1,)]
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = 0
+        self.autocommit = False
+        self.statements = []
+        self.failures = server.failures
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeServer:
+    """Replaces psycopg2.connect and counts the connections the pool opens."""
+    def __init__(self):
+        self.connections = []
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def connect(self, **kwargs):
+        with self.lock:
+            connection = FakeConnection(self)
+            self.connections.append(connection)
+            return connection
+
+    def open_connections(self):
+        return sum(1 for connection in self.connections if not connection.closed)
+
+    def statements(self):
+        return [statement for connection in self.connections for statement in connection.statements]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(postgresConnector.psycopg2, 'connect', server.connect)
+    monkeypatch.setattr(PostgresConnectionManager, '_create_db_if_not_exists', lambda self: None)
+    return server
+
+
+def manager(**kwargs):
+    return PostgresConnectionManager(host='db', port=5432, user='root', password='password', database='test',
+                                     max_retries=1, retry_delay=0, **kwargs)
+
+
+def test_connect_does_not_open_past_max_pool_size(server):
+    pool = manager(min_pool_size=2, max_pool_size=2)
+    pool.connect()
+    borrowed = [pool.acquire(), pool.acquire()]
+    # A second connect() (e.g. after a reconnect) while every slot is in use opens nothing
+    pool.connect()
+    assert server.open_connections() == 2
+    for conn in borrowed:
+        pool.release(conn)
+    pool.connect()
+    assert server.open_connections() == 2
+
+
+def test_concurrent_use_never_exceeds_max_pool_size(server):
+    pool = manager(min_pool_size=2, max_pool_size=3)
+    pool.connect()
+    peak = []
+
+    def work():
+        for _ in range(20):
+            pool.connect()
+            with pool.connection():
+                peak.append(server.open_connections())
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 3
+
+
+def test_recently_used_connections_skip_the_health_check(server):
+    pool = manager(max_pool_size=1, health_check_interval=30)
+    pool.execute_query("SELECT 2")
+    pool.execute_query("SELECT 3")
+    assert server.statements() == ["SELECT 2", "SELECT 3"]
+
+
+def test_idle_connections_are_checked_before_reuse(server):
+    pool = manager(max_pool_size=1, health_check_interval=0)
+    pool.execute_query("SELECT 2")
+    pool.execute_query("SELECT 3")
+    assert server.statements() == ["SELECT 2", "SELECT 1", "SELECT 3"]
+
+
+def test_a_connection_error_gets_every_idle_connection_checked(server):
+    pool = manager(max_pool_size=2, health_check_interval=30)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    with pytest.raises(OperationalError):
+        with pool.connection():
+            raise OperationalError("server closed the connection unexpectedly")
+    assert second.closed
+    pool.execute_query("SELECT 2")
+    # first went back to the pool before the error, so it is checked even though it was used recently
+    assert first.statements == ["SELECT 1", "SELECT 2"]
+
+
+def test_execute_query_returns_rows_whenever_the_statement_has_them(server):
+    pool = manager()
+    assert pool.execute_query("SELECT 1") == [(1,)]
+    assert pool.execute_query("INSERT INTO t VALUES (1) RETURNING id") == [(1,)]
+    assert pool.execute_query("UPDATE t SET a = 1") is None
+
+
+def test_reads_are_retried_on_a_fresh_connection(server):
+    pool = manager(max_pool_size=1)
+    server.failures.append(OperationalError("server closed the connection unexpectedly"))
+    assert pool.execute_query("SELECT 2") == [(1,)]
+    assert server.statements() == ["SELECT 2", "SELECT 2"]
+
+
+def test_writes_are_not_retried_unless_the_caller_says_so(server):
+    pool = manager(max_pool_size=1)
+    server.failures.append(OperationalError("server closed the connection unexpectedly"))
+    with pytest.raises(OperationalError):
+        pool.execute_query("UPDATE t SET a = 1")
+    assert server.statements() == ["UPDATE t SET a = 1"]
+
+    server.failures.append(OperationalError("server closed the connection unexpectedly"))
+    pool.execute_query("UPDATE t SET a = 1", retry=True)
+    assert server.statements()[1:] == ["UPDATE t SET a = 1", "UPDATE t SET a = 1"]
+
+
+def test_returning_rows_from_a_real_database(db_manager):
+    rows = db_manager.execute_query(
+        'INSERT INTO classification_requests (status, "createdAt", updated) VALUES (%s, now(), now()) RETURNING id',
+        ('PENDING',)
+    )
+    assert len(rows) == 1
+    assert db_manager.execute_query("SELECT id FROM classification_requests") == rows
+    assert db_manager.execute_query("UPDATE classification_requests SET status = 'FAILED'") is None
+
+
+INSERT_QUERY = 'INSERT INTO classification_requests (status, label, "createdAt", updated) VALUES %s'
+TEMPLATE = "(%s, %s, now(), now())"
+
+
+def count_rows(db_manager):
+    return db_manager.execute_query("SELECT count(*) FROM classification_requests")[0][0]
+
+
+def test_execute_values_commits_every_page(db_manager):
+    rows = [('PENDING', None)] * 5
+    db_manager.execute_values(INSERT_QUERY, rows, page_size=2, template=TEMPLATE)
+    assert count_rows(db_manager) == 5
+
+
+def test_execute_values_rolls_back_earlier_pages_on_failure(db_manager):
+    # status is NOT NULL, so the third page fails after the first two were sent
+    rows = [('PENDING', None)] * 4 + [(None, None)]
+    with pytest.raises(IntegrityError):
+        db_manager.execute_values(INSERT_QUERY, rows, page_size=2, template=TEMPLATE)
+    assert count_rows(db_manager) == 0
+
+
+def test_execute_values_returns_the_connection_in_autocommit(db_manager):
+    db_manager.execute_values(INSERT_QUERY, [('PENDING', None)], template=TEMPLATE)
+    with db_manager.connection() as conn:
+        assert conn.autocommit
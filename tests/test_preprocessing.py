@@ -0,0 +1,102 @@
+import io
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+from PIL import Image
+from torchvision import transforms
+
+from preprocessing import ImagePreprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+torchvision_preprocess = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+])
+
+# One 8-bit level after normalization, for the channel with the smallest std
+ONE_LEVEL = 1 / (255 * min(IMAGENET_STD)) + 1e-4
+
+
+def photo(width, height, noise=10, seed=0):
+    """Smooth gradients plus sensor-like noise, encoded and reopened like an upload."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    pixels = (np.sin(x * 12 + y * 5 + np.arange(3)) * 0.5 + 0.5) * 200 + rng.normal(0, noise, (height, width, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def reopen(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def difference(data):
+    fast = ImagePreprocessor().to_tensor([Image.open(io.BytesIO(data))])[0]
+    reference = torchvision_preprocess(Image.open(io.BytesIO(data)).convert('RGB'))
+    return (fast - reference).abs()
+
+
+@pytest.mark.parametrize('size', [(320, 240), (257, 300), (1000, 333), (224, 224), (100, 80)])
+def test_lossless_inputs_match_torchvision_to_one_level(size):
+    assert float(difference(reopen(photo(*size), 'PNG')).max()) <= ONE_LEVEL
+
+
+def test_jpegs_too_small_to_draft_match_torchvision_to_one_level():
+    assert float(difference(reopen(photo(256, 400), 'JPEG', quality=90)).max()) <= ONE_LEVEL
+
+
+@pytest.mark.parametrize('noise, mean_limit', [(0, 0.03), (80, 0.1)])
+def test_draft_decoding_stays_close_to_torchvision(noise, mean_limit):
+    data = reopen(photo(1920, 1080, noise=noise), 'JPEG', quality=90)
+    image = Image.open(io.BytesIO(data))
+    assert ImagePreprocessor().load(image).size == (224, 224)
+    assert min(image.size) < 1080 and min(image.size) >= 256
+    assert float(difference(data).mean()) < mean_limit
+
+
+def test_transparency_is_composited_onto_white():
+    clear = Image.new('RGBA', (300, 300), (0, 0, 0, 0))
+    loaded = ImagePreprocessor().load(Image.open(io.BytesIO(reopen(clear, 'PNG'))))
+    assert loaded.mode == 'RGB'
+    assert loaded.getextrema() == ((255, 255), (255, 255), (255, 255))
+
+
+def test_palette_with_transparency_is_composited_onto_white():
+    image = Image.new('P', (300, 300), 0)
+    image.putpalette([0, 0, 0, 200, 0, 0])
+    image.paste(1, (150, 0, 300, 300))
+    loaded = ImagePreprocessor().load(Image.open(io.BytesIO(reopen(image, 'PNG', transparency=0))))
+    assert loaded.getpixel((10, 112)) == (255, 255, 255)
+    assert loaded.getpixel((200, 112)) == (200, 0, 0)
+
+
+def test_animated_gif_uses_its_first_frame():
+    frames = [Image.new('P', (300, 300), color) for color in (1, 2)]
+    for frame in frames:
+        frame.putpalette([0, 0, 0, 0, 200, 0, 0, 0, 200])
+    data = reopen(frames[0], 'GIF', save_all=True, append_images=frames[1:])
+    image = Image.open(io.BytesIO(data))
+    image.seek(1)
+    assert ImagePreprocessor().load(image).getpixel((100, 100)) == (0, 200, 0)
+
+
+@pytest.mark.parametrize('mode, value, expected', [('L', 90, 90), ('I;16', 65535, 255), ('CMYK', (0, 0, 0, 0), 255)])
+def test_greyscale_16_bit_and_cmyk_become_rgb(mode, value, expected):
+    loaded = ImagePreprocessor().load(Image.new(mode, (300, 300), value))
+    assert loaded.mode == 'RGB'
+    assert loaded.getpixel((100, 100)) == (expected,) * 3
+
+
+def test_batches_reuse_the_per_thread_buffer():
+    preprocessor = ImagePreprocessor()
+    images = [photo(300, 300, seed=seed) for seed in range(3)]
+    first = preprocessor.to_tensor(images)
+    pointer = first.data_ptr()
+    second = preprocessor.to_tensor(images[:2])
+    assert second.shape == (2, 3, 224, 224)
+    assert second.data_ptr() == pointer
+    assert torch.allclose(second, torch.stack([torchvision_preprocess(image) for image in images[:2]]), atol=ONE_LEVEL)
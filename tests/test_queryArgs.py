@@ -0,0 +1,31 @@
+import pytest
+
+from queryArgs import parse_number, parse_request_id, MAX_REQUEST_ID
+
+
+def test_parse_number_uses_the_default_when_missing():
+    assert parse_number({}, 'limit', 10, 1, 100, cast=int) == 10
+    assert parse_number({'limit': ''}, 'limit', 10, 1, 100, cast=int) == 10
+
+
+def test_parse_number_clamps_to_the_bounds():
+    assert parse_number({'limit': '500'}, 'limit', 10, 1, 100, cast=int) == 100
+    assert parse_number({'limit': '-3'}, 'limit', 10, 1, 100, cast=int) == 1
+
+
+@pytest.mark.parametrize('value', ['abc', '1.5e', 'nan', 'inf', '2.5'])
+def test_parse_number_rejects_malformed_values(value):
+    cast = int if value == '2.5' else float
+    with pytest.raises(ValueError):
+        parse_number({'timeout': value}, 'timeout', 0, 0, 10, cast=cast)
+
+
+@pytest.mark.parametrize('value', [None, '', 'abc', '0', '-1', str(MAX_REQUEST_ID + 1)])
+def test_parse_request_id_rejects_invalid_ids(value):
+    with pytest.raises(ValueError):
+        parse_request_id(value)
+
+
+def test_parse_request_id_accepts_row_ids():
+    assert parse_request_id('42') == 42
+    assert parse_request_id(MAX_REQUEST_ID) == MAX_REQUEST_ID
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from queuePolicy import QueueScalingPolicy, RabbitMQQueueStats
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def queue_policy(clock, **kwargs):
+    args = dict(min_replicas=1, max_replicas=10, service_rate=10, target_utilization=0.5, drain_time=10, scale_down_window=60)
+    args.update(kwargs)
+    return QueueScalingPolicy(clock=clock, **args)
+
+
+def test_queue_policy_sizes_for_arrivals_plus_backlog():
+    policy = queue_policy(Clock())
+    # (20/s + 100 ready / 10 s) / (10/s * 0.5) = 6
+    assert policy.recommend(20, 100) == 6
+    assert policy.recommend(0, 0) == 1
+    assert policy.recommend(1000, 0) == 10
+
+
+def test_queue_policy_scales_up_at_once_and_down_after_the_window():
+    clock = Clock()
+    policy = queue_policy(clock)
+    assert policy.desired_replicas(2, 20, 100) == 6
+    clock.now = 30
+    assert policy.desired_replicas(6, 5, 0) == 6
+    clock.now = 61
+    assert policy.desired_replicas(6, 5, 0) == 1
+
+
+def test_queue_policy_limits_the_scale_up_step():
+    policy = queue_policy(Clock(), max_step_up=2)
+    assert policy.desired_replicas(2, 20, 100) == 4
+
+
+def test_service_rate_is_learned_only_while_messages_wait():
+    policy = queue_policy(Clock(), service_rate_alpha=0.5)
+    policy.observe_throughput(40, 2, ready=0)
+    assert policy.service_rate == 10
+    policy.observe_throughput(40, 2, ready=50)
+    assert policy.service_rate == 15
+
+
+class FakeSession:
+    def __init__(self, payload):
+        self.payload = payload
+        self.urls = []
+
+    def get(self, url, auth=None, timeout=None):
+        self.urls.append(url)
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: self.payload)
+
+
+def test_queue_stats_are_read_from_the_management_api():
+    session = FakeSession({
+        'messages': 120, 'messages_ready': 100, 'messages_unacknowledged': 20, 'consumers': 3,
+        'message_stats': {'publish_details': {'rate': 25.5}, 'ack_details': {'rate': 18.0}},
+    })
+    stats = RabbitMQQueueStats('http://rabbitmq:15672/', 'requests_queue', session=session).fetch()
+    assert session.urls == ['http://rabbitmq:15672/api/queues/%2F/requests_queue']
+    assert (stats.depth, stats.ready, stats.unacked, stats.consumers) == (120, 100, 20, 3)
+    assert (stats.publish_rate, stats.ack_rate) == (25.5, 18.0)
+
+
+def test_idle_queue_without_message_stats_has_zero_rates():
+    stats = RabbitMQQueueStats('http://rabbitmq:15672', 'requests_queue', session=FakeSession({'messages': 0})).fetch()
+    assert (stats.depth, stats.publish_rate, stats.ack_rate) == (0, 0.0, 0.0)
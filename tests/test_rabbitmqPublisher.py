@@ -0,0 +1,176 @@
+import pika
+import pytest
+from types import SimpleNamespace
+
+import rabbitmqPublisher
+from rabbitmqPublisher import PendingPublish, PublisherConnection, RabbitMQPublisher
+
+
+class FakeChannel:
+    def __init__(self):
+        self.is_open = True
+        self.published = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append(body)
+
+    def add_on_close_callback(self, callback):
+        pass
+
+    def confirm_delivery(self, ack_nack_callback, callback):
+        callback(None)
+
+    def queue_declare(self, queue, durable, callback):
+        callback(None)
+
+
+class FakeIOLoop:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+    def stop(self):
+        pass
+
+
+def open_connection():
+    connection = PublisherConnection(pika.ConnectionParameters(), 'requests_queue', 'test-publisher')
+    connection.connection = SimpleNamespace(ioloop=FakeIOLoop(), is_open=True)
+    channel = FakeChannel()
+    connection._on_channel_open(channel)
+    return connection, channel
+
+
+def submit(connection, body):
+    pending = PendingPublish(body, pika.BasicProperties(), 'requests_queue')
+    connection.submit(pending)
+    return pending.future
+
+
+def confirm(connection, delivery_tag, multiple=False, ack=True):
+    method = pika.spec.Basic.Ack if ack else pika.spec.Basic.Nack
+    connection._on_confirm(SimpleNamespace(method=method(delivery_tag=delivery_tag, multiple=multiple)))
+
+
+def test_submitted_messages_are_published_from_the_io_thread():
+    connection, channel = open_connection()
+    submit(connection, b'one')
+    assert channel.published == []
+    assert connection.connection.ioloop.callbacks == [connection._drain]
+    connection._drain()
+    assert channel.published == [b'one']
+
+
+def test_multiple_acks_resolve_every_earlier_message():
+    connection, channel = open_connection()
+    futures = [submit(connection, body) for body in (b'one', b'two', b'three')]
+    connection._drain()
+    confirm(connection, 2, multiple=True)
+    assert [future.done() for future in futures] == [True, True, False]
+    confirm(connection, 3)
+    assert [future.result() for future in futures] == [1, 2, 3]
+    assert connection.unconfirmed == {}
+
+
+def test_nacked_messages_fail():
+    connection, channel = open_connection()
+    future = submit(connection, b'one')
+    connection._drain()
+    confirm(connection, 1, ack=False)
+    with pytest.raises(RuntimeError, match='nack'):
+        future.result(0)
+
+
+def test_reconnect_fails_unconfirmed_messages_and_publishes_the_outbox():
+    connection, channel = open_connection()
+    in_flight = submit(connection, b'one')
+    connection._drain()
+    connection.ready.clear()  # The connection is going down; submit() only queues
+    queued = submit(connection, b'two')
+    connection._on_connection_closed(connection.connection, 'broker restarted')
+    with pytest.raises(ConnectionError):
+        in_flight.result(0)
+
+    # The new channel starts again at delivery tag 1 and publishes what was left in the outbox
+    channel = FakeChannel()
+    connection._on_channel_open(channel)
+    assert channel.published == [b'two']
+    confirm(connection, 1)
+    assert queued.result(0) == 1
+
+
+def test_reconnect_backoff_is_bounded(monkeypatch):
+    connection = PublisherConnection(pika.ConnectionParameters(), 'requests_queue', 'test-publisher',
+                                     retry_delay=1, max_retry_delay=5)
+    delays = []
+
+    class FailingConnection:
+        def __init__(self, parameters, on_open_callback, on_open_error_callback, on_close_callback):
+            self.ioloop = SimpleNamespace(start=lambda: on_open_error_callback(self, 'refused'), stop=lambda: None)
+
+    def sleep(delay):
+        delays.append(delay)
+        if len(delays) == 5:
+            connection.stopping = True
+
+    monkeypatch.setattr(rabbitmqPublisher.pika, 'SelectConnection', FailingConnection)
+    monkeypatch.setattr(rabbitmqPublisher.time, 'sleep', sleep)
+    connection.run()
+    assert delays == [1, 2, 4, 5, 5]
+
+
+def test_withdraw_only_takes_back_unpublished_messages():
+    connection, channel = open_connection()
+    publisher = RabbitMQPublisher('localhost', 5672, 'requests_queue')
+    publisher.connections = [connection]
+    published = submit(connection, b'one')
+    connection._drain()
+    queued = submit(connection, b'two')
+
+    assert publisher.withdraw(queued)
+    assert not publisher.withdraw(published)
+    connection._drain()
+    assert channel.published == [b'one']
+
+
+def rpc_sample(outcome):
+    for metric in rabbitmqPublisher.RPC_REPLIES.collect():
+        for sample in metric.samples:
+            if sample.name.endswith('_total') and sample.labels == {'outcome': outcome}:
+                return sample.value
+    return 0
+
+
+def test_rpc_requests_are_published_on_the_reply_consumer_connection():
+    publisher = RabbitMQPublisher('localhost', 5672, 'requests_queue', pool_size=2, enable_rpc=True)
+    assert publisher.rpc_connection is publisher.connections[0]
+    assert publisher.connections[1].on_reply is None
+    confirm, reply = publisher.publish_rpc(b'one', pika.BasicProperties())
+    (pending,) = publisher.rpc_connection.outbox
+    assert pending.future is confirm
+    assert pending.properties.reply_to == rabbitmqPublisher.DIRECT_REPLY_TO
+    assert pending.properties.correlation_id == reply.correlation_id
+
+
+def test_replies_resolve_their_caller_and_late_replies_are_dropped():
+    publisher = RabbitMQPublisher('localhost', 5672, 'requests_queue', enable_rpc=True)
+    _, answered = publisher.publish_rpc(b'one', pika.BasicProperties())
+    _, abandoned = publisher.publish_rpc(b'two', pika.BasicProperties())
+    late_before = rpc_sample('late')
+
+    publisher.rpc_connection._on_reply_message(None, None, SimpleNamespace(correlation_id=answered.correlation_id), b'{"label": "tabby"}')
+    assert answered.result(timeout=0) == b'{"label": "tabby"}'
+
+    publisher.cancel_rpc(abandoned)
+    assert publisher.replies == {}
+    publisher._on_reply(abandoned.correlation_id, b'{}')
+    assert not abandoned.done()
+    assert rpc_sample('late') == late_before + 1
+
+
+def test_rpc_needs_the_reply_consumer():
+    publisher = RabbitMQPublisher('localhost', 5672, 'requests_queue')
+    with pytest.raises(RuntimeError):
+        publisher.publish_rpc(b'one', pika.BasicProperties())
@@ -0,0 +1,112 @@
+import time
+import threading
+import pytest
+
+from requestWriter import BatchedRequestWriter, IdAllocator, FAIL_ABANDONED_QUERY
+
+
+class FakeIdAllocator:
+    def __init__(self):
+        self.last = 0
+
+    def next_id(self):
+        self.last += 1
+        return self.last
+
+
+class SlowDatabase:
+    """Records inserts; each execute_values call waits for `release` to be set."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.inserted = []
+        self.queries = []
+        self.writing = threading.Event()
+
+    def execute_values(self, query, rows, template=None):
+        self.writing.set()
+        self.release.wait()
+        self.inserted.extend(row[0] for row in rows)
+
+    def execute_query(self, query, params=None):
+        self.queries.append((query, params))
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def test_submit_returns_once_the_row_is_committed():
+    database = SlowDatabase()
+    database.release.set()
+    writer = BatchedRequestWriter(database, FakeIdAllocator(), max_wait=0.001)
+    assert writer.submit() == 1
+    assert database.inserted == [1]
+
+
+def test_timed_out_rows_are_dropped_or_marked_failed():
+    database = SlowDatabase()
+    writer = BatchedRequestWriter(database, FakeIdAllocator(), max_wait=0.001, commit_timeout=0.2)
+    errors = []
+
+    def submit():
+        try:
+            writer.submit()
+        except TimeoutError as e:
+            errors.append(e)
+
+    # Request 1 is being inserted when its caller gives up; request 2 is still queued behind it
+    first = threading.Thread(target=submit)
+    first.start()
+    assert database.writing.wait(1)
+    with pytest.raises(TimeoutError):
+        writer.submit()
+    first.join()
+    assert len(errors) == 1
+
+    database.release.set()
+    wait_for(lambda: database.queries)
+    assert database.queries == [(FAIL_ABANDONED_QUERY, ([1],))]
+    time.sleep(0.05)
+    assert database.inserted == [1]
+
+
+class SequenceDatabase:
+    """Answers the block reservation query from a shared counter, like the id sequence."""
+    def __init__(self):
+        self.value = 0
+        self.reservations = 0
+
+    def execute_query(self, query, params=None):
+        self.reservations += 1
+        start, self.value = self.value, self.value + params[0]
+        return [(i,) for i in range(start + 1, self.value + 1)]
+
+
+def test_ids_come_from_reserved_blocks():
+    database = SequenceDatabase()
+    allocator = IdAllocator(database, block_size=3)
+    assert [allocator.next_id() for _ in range(4)] == [1, 2, 3, 4]
+    assert database.reservations == 2
+
+
+def test_ids_from_two_processes_are_not_in_creation_order():
+    database = SequenceDatabase()
+    first, second = IdAllocator(database, block_size=10), IdAllocator(database, block_size=10)
+    older = first.next_id()
+    newer = second.next_id()
+    newest = first.next_id()
+    # The documented limit: newest-first listings have to order on "createdAt", not id
+    assert older < newest < newer
+
+
+def test_abandoned_rows_are_only_failed_while_pending(db_manager):
+    db_manager.execute_query(
+        "INSERT INTO classification_requests (id, status, label, \"createdAt\", updated) "
+        "VALUES (1, 'PENDING', NULL, now(), now()), (2, 'PROCESSED', 'tabby', now(), now())")
+    db_manager.execute_query(FAIL_ABANDONED_QUERY, ([1, 2],))
+    assert db_manager.execute_query("SELECT id, status, label FROM classification_requests ORDER BY id") == [
+        (1, 'FAILED', 'unknown'), (2, 'PROCESSED', 'tabby')]
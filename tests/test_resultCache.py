@@ -0,0 +1,61 @@
+from resultCache import LRUCache, ResultCache, content_hash, CACHE_HITS, CACHE_MISSES
+
+
+class FakeDatabase:
+    def __init__(self, rows=None, error=None):
+        self.rows = rows or {}
+        self.error = error
+        self.lookups = []
+
+    def execute_query(self, query, params=None):
+        self.lookups.append(params[0])
+        if self.error is not None:
+            raise self.error
+        return [self.rows[params[0]]] if params[0] in self.rows else []
+
+
+def sample(metric, **labels):
+    # Read the collector itself: other test modules clear the default registry when they import an entry point
+    for collected in metric.collect():
+        for sample in collected.samples:
+            if sample.name.endswith('_total') and sample.labels == labels:
+                return sample.value
+    return 0
+
+
+def test_content_hash_is_the_sha256_of_the_bytes():
+    assert content_hash(b'abc') == 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
+
+
+def test_miss_then_database_hit_then_memory_hit():
+    database = FakeDatabase()
+    cache = ResultCache(database)
+    misses = sample(CACHE_MISSES)
+    assert cache.get('abc') is None
+    assert sample(CACHE_MISSES) == misses + 1
+
+    database.rows['abc'] = ('tabby', 0.9)
+    database_hits = sample(CACHE_HITS, tier='database')
+    assert cache.get('abc') == ('tabby', 0.9)
+    assert sample(CACHE_HITS, tier='database') == database_hits + 1
+
+    memory_hits = sample(CACHE_HITS, tier='memory')
+    assert cache.get('abc') == ('tabby', 0.9)
+    assert sample(CACHE_HITS, tier='memory') == memory_hits + 1
+    # The second hit was served without a query
+    assert database.lookups == ['abc', 'abc']
+
+
+def test_database_errors_are_treated_as_misses():
+    cache = ResultCache(FakeDatabase(error=RuntimeError('connection lost')))
+    assert cache.get('abc') is None
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
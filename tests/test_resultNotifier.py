@@ -0,0 +1,88 @@
+import json
+import queue
+import time
+import pytest
+
+from constants import RESULTS_NOTIFY_CHANNEL
+from resultNotifier import ResultNotifier, WAITERS
+from resultWriter import ResultWriter, FAIL_REQUEST_QUERY, with_notify
+
+
+def waiting():
+    return WAITERS.collect()[0].samples[0].value
+
+
+def test_notifications_reach_only_the_subscribers_of_that_request():
+    notifier = ResultNotifier(None, RESULTS_NOTIFY_CHANNEL)
+    first, second, other = notifier.subscribe(7), notifier.subscribe('7'), notifier.subscribe(8)
+    notifier._dispatch({'id': 7, 'status': 'PROCESSED', 'label': 'tabby', 'confidence': 0.9})
+    assert first.get_nowait()['label'] == 'tabby'
+    assert second.get_nowait()['label'] == 'tabby'
+    assert other.empty()
+
+
+def test_unsubscribe_forgets_the_request_once_its_last_subscriber_leaves():
+    notifier = ResultNotifier(None, RESULTS_NOTIFY_CHANNEL)
+    before = waiting()
+    first, second = notifier.subscribe(7), notifier.subscribe(7)
+    assert waiting() == before + 2
+    notifier.unsubscribe(7, first)
+    assert 7 in notifier.waiters
+    notifier.unsubscribe(7, second)
+    assert notifier.waiters == {} and waiting() == before
+
+
+def test_resync_tells_every_waiter_to_reread_its_row():
+    notifier = ResultNotifier(None, RESULTS_NOTIFY_CHANNEL)
+    first, second = notifier.subscribe(7), notifier.subscribe(8)
+    notifier._resync_all()
+    assert first.get_nowait() == {'id': 7, 'resync': True}
+    assert second.get_nowait() == {'id': 8, 'resync': True}
+
+
+@pytest.fixture
+def listening(db_manager):
+    """A started notifier whose LISTEN is known to be in place."""
+    notifier = ResultNotifier(db_manager, RESULTS_NOTIFY_CHANNEL, poll_interval=0.05, retry_delay=0.01)
+    notifier.start()
+    probe = notifier.subscribe(0)
+    deadline = time.monotonic() + 5
+    while True:
+        db_manager.execute_query("SELECT pg_notify(%s, %s)", (RESULTS_NOTIFY_CHANNEL, json.dumps({'id': 0})))
+        try:
+            probe.get(timeout=0.1)
+            break
+        except queue.Empty:
+            assert time.monotonic() < deadline, "the notifier never started listening"
+    notifier.unsubscribe(0, probe)
+    yield notifier
+    notifier.stop()
+    notifier.join(timeout=1)
+
+
+def insert_pending(db_manager, request_id):
+    db_manager.execute_query(
+        "INSERT INTO classification_requests (id, status, \"createdAt\", updated) VALUES (%s, 'PENDING', now(), now())",
+        (request_id,)
+    )
+
+
+def test_committed_results_are_delivered_to_subscribers(db_manager, listening):
+    insert_pending(db_manager, 1)
+    insert_pending(db_manager, 2)
+    processed, failed = listening.subscribe(1), listening.subscribe(2)
+
+    ResultWriter(db_manager, max_size=1, notify_channel=RESULTS_NOTIFY_CHANNEL).add(1, 'PROCESSED', 'tabby', 0.9)
+    db_manager.execute_query(with_notify(FAIL_REQUEST_QUERY, RESULTS_NOTIFY_CHANNEL), ('FAILED', 'unknown', 0, 2))
+
+    assert processed.get(timeout=2) == {'id': 1, 'status': 'PROCESSED', 'label': 'tabby', 'confidence': 0.9}
+    assert failed.get(timeout=2) == {'id': 2, 'status': 'FAILED', 'label': 'unknown', 'confidence': 0}
+
+
+def test_waiters_are_resynced_after_the_listener_reconnects(db_manager, listening):
+    subscription = listening.subscribe(5)
+    db_manager.execute_query(
+        "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE query = %s AND pid <> pg_backend_pid()",
+        (f"LISTEN {RESULTS_NOTIFY_CHANNEL}",)
+    )
+    assert subscription.get(timeout=5) == {'id': 5, 'resync': True}
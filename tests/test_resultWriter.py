@@ -0,0 +1,114 @@
+import json
+from resultWriter import ResultWriter, UPDATE_RESULTS_QUERY, INSERT_CACHE_QUERY
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        timer = (delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        self.timers.remove(timer)
+
+
+class FakeDatabase:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.statements = []
+
+    def execute_values(self, query, rows, template=None):
+        if self.fail:
+            raise RuntimeError('database is down')
+        self.statements.append((query, rows))
+
+
+def add(writer, events, request_id, image_hash=None, status='PROCESSED', **kwargs):
+    writer.add(request_id, status, 'tabby', 0.9, image_hash=image_hash,
+               on_commit=lambda: events.append(('ack', request_id)),
+               on_error=lambda error: events.append(('error', request_id)), **kwargs)
+
+
+def test_acks_wait_for_the_batch_to_commit():
+    database = FakeDatabase()
+    writer = ResultWriter(database, max_size=3, max_age=0.1, scheduler=FakeScheduler())
+    events = []
+    add(writer, events, 1)
+    add(writer, events, 2)
+    assert events == [] and database.statements == []
+
+    add(writer, events, 3)
+    assert database.statements[0] == (UPDATE_RESULTS_QUERY, [(i, 'PROCESSED', 'tabby', 0.9) for i in (1, 2, 3)])
+    assert events == [('ack', 1), ('ack', 2), ('ack', 3)]
+
+
+def test_oldest_result_is_flushed_after_max_age():
+    database = FakeDatabase()
+    scheduler = FakeScheduler()
+    writer = ResultWriter(database, max_size=10, max_age=0.1, scheduler=scheduler)
+    events = []
+    add(writer, events, 1)
+    add(writer, events, 2)
+    assert [delay for delay, _ in scheduler.timers] == [0.1]
+
+    _, on_timeout = scheduler.timers[0]
+    on_timeout()
+    assert events == [('ack', 1), ('ack', 2)]
+
+
+def test_failed_write_calls_on_error_instead_of_acking():
+    writer = ResultWriter(FakeDatabase(fail=True), max_size=2, max_age=0.1, scheduler=FakeScheduler())
+    events = []
+    add(writer, events, 1)
+    add(writer, events, 2)
+    assert events == [('error', 1), ('error', 2)]
+    assert writer.pending == []
+
+
+def test_processed_results_with_a_hash_are_cached():
+    database = FakeDatabase()
+    writer = ResultWriter(database, max_size=3, max_age=0.1)
+    events = []
+    add(writer, events, 1, image_hash='aaa')
+    add(writer, events, 2)
+    add(writer, events, 3, image_hash='ccc', status='FAILED')
+    assert database.statements[1] == (INSERT_CACHE_QUERY, [('aaa', 'tabby', 0.9)])
+
+
+def test_stage_times_are_stored_with_the_write_time():
+    database = FakeDatabase()
+    writer = ResultWriter(database, max_size=1, max_age=0.1, store_stage_times=True)
+    add(writer, [], 1, stage_times={'received': 10.0, 'inferred': 11.0})
+    _, rows = database.statements[0]
+    stage_times = json.loads(rows[0][4])
+    assert stage_times['received'] == 10.0 and stage_times['inferred'] == 11.0
+    assert stage_times['written'] >= 11.0
+
+
+def test_results_reach_the_database(db_manager):
+    db_manager.execute_query(
+        "INSERT INTO classification_requests (status, \"createdAt\", updated) VALUES ('PENDING', now(), now()), ('PENDING', now(), now())")
+    first, second = (row[0] for row in db_manager.execute_query("SELECT id FROM classification_requests ORDER BY id"))
+    writer = ResultWriter(db_manager, max_size=2, max_age=0.1)
+    events = []
+    add(writer, events, first, image_hash='aaa')
+    add(writer, events, second)
+    assert events == [('ack', first), ('ack', second)]
+
+    stored = db_manager.execute_query("SELECT id, status, label FROM classification_requests ORDER BY id")
+    assert stored == [(first, 'PROCESSED', 'tabby'), (second, 'PROCESSED', 'tabby')]
+    assert db_manager.execute_query("SELECT hash, label FROM image_results") == [('aaa', 'tabby')]
+
+
+def test_stage_times_reach_the_database(db_manager):
+    db_manager.execute_query("INSERT INTO classification_requests (status, \"createdAt\", updated) VALUES ('PENDING', now(), now())")
+    (request_id,), = db_manager.execute_query("SELECT id FROM classification_requests")
+    writer = ResultWriter(db_manager, max_size=1, max_age=0.1, notify_channel='classification_results', store_stage_times=True)
+    events = []
+    add(writer, events, request_id, stage_times={'received': 10.0})
+    assert events == [('ack', request_id)]
+    (stage_times,), = db_manager.execute_query("SELECT stage_times FROM classification_requests")
+    assert stage_times['received'] == 10.0 and 'written' in stage_times
@@ -0,0 +1,21 @@
+from schema import upgrade_schema, has_column
+
+KEYSET_INDEXES = ['ix_classification_requests_created_at_id', 'ix_classification_requests_status_created_at_id']
+
+
+def index_exists(db_manager, name):
+    return bool(db_manager.execute_query("SELECT 1 FROM pg_indexes WHERE indexname = %s", (name,)))
+
+
+def test_upgrade_schema_brings_an_old_database_up_to_date(db_manager):
+    # The schema as created before keyset pagination and stage tracing
+    for name in KEYSET_INDEXES:
+        db_manager.execute_query(f"DROP INDEX {name}")
+    db_manager.execute_query("ALTER TABLE classification_requests DROP COLUMN stage_times")
+    assert not has_column(db_manager, 'classification_requests', 'stage_times')
+
+    upgrade_schema(db_manager)
+    upgrade_schema(db_manager)
+
+    assert all(index_exists(db_manager, name) for name in KEYSET_INDEXES)
+    assert has_column(db_manager, 'classification_requests', 'stage_times')
@@ -0,0 +1,83 @@
+import time
+import pytest
+
+from stageTracing import mark, stage_headers, read_stage_times, observe_stages, create_span_exporter, StageSpanExporter, PIPELINE_STAGE_SECONDS, STAGE_HEADER
+
+
+def observed(stage):
+    """(count, sum) of pipeline_stage_seconds{stage}."""
+    samples = {sample.name: sample.value for metric in PIPELINE_STAGE_SECONDS.collect() for sample in metric.samples
+               if sample.labels.get('stage') == stage}
+    return samples.get('pipeline_stage_seconds_count', 0), samples.get('pipeline_stage_seconds_sum', 0)
+
+
+def test_mark_records_now_or_the_given_time():
+    before = time.time()
+    times = mark({}, 'received')
+    assert before <= times['received'] <= time.time()
+    assert mark(times, 'persisted', 5.0) == {'received': times['received'], 'persisted': 5.0}
+
+
+def test_stage_headers_carry_integer_microseconds():
+    headers = stage_headers({'received': 1.5, 'published': 2.000001})
+    assert headers == {STAGE_HEADER: {'received': 1_500_000, 'published': 2_000_001}}
+
+
+def test_each_stage_is_timed_from_the_previous_one_present():
+    count, total = observed('decoded')
+    # 'dequeued' is missing, so 'decoded' is measured from 'published'
+    observe_stages({'received': 10.0, 'published': 10.5, 'decoded': 11.25}, ('decoded',))
+    assert observed('decoded') == (count + 1, pytest.approx(total + 0.75))
+
+
+def test_clock_skew_is_clamped_to_zero():
+    count, total = observed('dequeued')
+    observe_stages({'published': 10.0, 'dequeued': 9.0}, ('dequeued',))
+    assert observed('dequeued') == (count + 1, total)
+
+
+def test_written_also_records_the_total():
+    count, total = observed('total')
+    observe_stages({'received': 10.0, 'inferred': 11.0, 'written': 12.0}, ('written',))
+    assert observed('total') == (count + 1, pytest.approx(total + 2.0))
+
+
+def test_stages_without_a_timestamp_are_skipped():
+    count, _ = observed('inferred')
+    observe_stages(read_stage_times(None), ('inferred', 'written'))
+    assert observed('inferred')[0] == count
+
+
+def test_spans_cover_every_stage_the_request_reached():
+    sdk = pytest.importorskip('opentelemetry.sdk.trace')
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    spans = InMemorySpanExporter()
+    provider = sdk.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(spans))
+    exporter = StageSpanExporter(provider.get_tracer(__name__), trace.set_span_in_context)
+
+    exporter.export(7, {'received': 1.0, 'published': 1.5, 'dequeued': 2.0, 'written': 3.0})
+    exporter.export(8, {'written': 3.0})
+
+    finished = {span.name: span for span in spans.get_finished_spans()}
+    assert sorted(finished) == ['classification', 'dequeued', 'published', 'written']
+    root = finished['classification']
+    assert root.attributes['request.id'] == 7
+    assert (root.start_time, root.end_time) == (1_000_000_000, 3_000_000_000)
+    assert (finished['written'].start_time, finished['written'].end_time) == (2_000_000_000, 3_000_000_000)
+    assert all(finished[name].parent.span_id == root.context.span_id for name in ('published', 'dequeued', 'written'))
+
+
+def test_span_export_failures_are_only_logged():
+    class BrokenTracer:
+        def start_span(self, *args, **kwargs):
+            raise RuntimeError('collector is down')
+    StageSpanExporter(BrokenTracer(), lambda span: None).export(7, {'received': 1.0, 'written': 2.0})
+
+
+def test_spans_are_only_exported_when_an_endpoint_is_set(monkeypatch):
+    monkeypatch.delenv('OTEL_EXPORTER_OTLP_ENDPOINT', raising=False)
+    monkeypatch.delenv('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT', raising=False)
+    assert create_span_exporter('worker-app') is None
@@ -0,0 +1,109 @@
+import os
+import time
+import signal
+import threading
+import pytest
+
+from workerSupervisor import WorkerSupervisor, threads_per_process
+
+
+def consume_forever(on_ready):
+    on_ready()
+    time.sleep(60)
+
+
+def exit_after_ready(on_ready):
+    on_ready()
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def supervise():
+    """Start a supervisor with the monitor loop on a thread and stop it afterwards."""
+    started = []
+    handler = signal.getsignal(signal.SIGTERM)
+
+    def supervise(target, processes=2, server=None):
+        supervisor = WorkerSupervisor(target, processes, threads=1, restart_delay=0.05, server=server)
+        supervisor.start()
+        monitor = threading.Thread(target=supervisor.monitor, daemon=True)
+        monitor.start()
+        started.append((supervisor, monitor))
+        return supervisor
+
+    yield supervise
+    for supervisor, monitor in started:
+        supervisor.stop()
+        monitor.join(timeout=5)
+    signal.signal(signal.SIGTERM, handler)
+
+
+def test_ready_once_every_child_is_consuming(supervise):
+    supervisor = supervise(consume_forever)
+    assert wait_until(supervisor.ready)
+    assert all(process.is_alive() for process in supervisor.children.values())
+
+
+def test_killed_child_is_restarted_and_becomes_ready_again(supervise):
+    supervisor = supervise(consume_forever)
+    assert wait_until(supervisor.ready)
+    killed = supervisor.children[0].pid
+    os.kill(killed, signal.SIGKILL)
+    assert wait_until(lambda: supervisor.children[0].pid != killed)
+    assert wait_until(supervisor.ready)
+
+
+def test_child_that_stops_consuming_clears_its_flag():
+    supervisor = WorkerSupervisor(exit_after_ready, 1, threads=1)
+    handler = signal.getsignal(signal.SIGTERM)
+    try:
+        supervisor.start()
+        supervisor.children[0].join(timeout=10)
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+    assert supervisor.children[0].exitcode == 0
+    assert not supervisor.ready()
+
+
+def test_server_runs_in_its_own_process_and_sees_readiness(supervise, tmp_path):
+    seen = tmp_path / 'seen'
+
+    def server():
+        # Runs in the forked server process: readiness has to come through shared memory
+        while not supervisor.ready():
+            time.sleep(0.05)
+        seen.write_text(str(os.getpid()))
+        time.sleep(60)
+
+    supervisor = supervise(consume_forever, server=server)
+    assert wait_until(seen.exists)
+    assert int(seen.read_text()) == supervisor.server_process.pid != os.getpid()
+
+
+def test_threads_per_process_splits_the_cpu_quota():
+    assert threads_per_process(2, cpus=4) == 2
+    assert threads_per_process(3, cpus=4) == 1
+    assert threads_per_process(4, cpus=2) == 1
+
+
+def test_server_started_early_is_not_forked_again():
+    handler = signal.getsignal(signal.SIGTERM)
+    supervisor = WorkerSupervisor(consume_forever, 1, threads=1, server=lambda: time.sleep(60))
+    try:
+        supervisor.start_server()
+        server = supervisor.server_process
+        assert server.is_alive() and not supervisor.children
+        supervisor.start()
+        assert supervisor.server_process is server
+        assert wait_until(supervisor.ready)
+    finally:
+        supervisor.stop()
+        signal.signal(signal.SIGTERM, handler)